@@ -22,8 +22,14 @@ This module is an OpenTrep binding.
 
  >>> otp.index()
 
- >>> otp.search(search_string="nce sfo", outputFormat="S")
- ([(89.8466, 'NCE'), (357.45599999999996, 'SFO')], '')
+ >>> res = otp.search(search_string="nce sfo", outputFormat="S")
+
+ >>> res.matches, res.unmatched
+ ([CompactMatch(score=89.8466, code='NCE'), CompactMatch(score=357.45599999999996, code='SFO')], '')
+
+ >>> otp.display(res)
+ Compact format => recognised place (city/airport) codes:
+ ([CompactMatch(score=89.8466, code='NCE'), CompactMatch(score=357.45599999999996, code='SFO')], '')
  ------------------
 
  >>> otp.finalize()
@@ -34,10 +40,84 @@ from __future__ import with_statement
 
 import os
 import sys
-import inspect
-import errno
-import pathlib
-import json
+import logging
+import threading
+import functools
+import time
+from collections import OrderedDict, namedtuple
+
+# The other sub-modules (indexing, ingest, persistent, codes, normalize)
+# are imported on their first use, so that importing the package stays fast
+from . import jsonlib
+from .cache import QueryCache, normalize_query
+from .pool import SearcherPool, SearcherPoolClosedError
+from .utilities import DEFAULT_POR, DEFAULT_IDX, DEFAULT_FMT, DEFAULT_LOG
+from .results import CompactMatch, CompactLocation, decode_json, \
+    decode_protobuf, format_places, format_json_places, \
+    CompactResult, FullResult, JSONResult, InterpretedResult, ProtobufResult
+
+# The diagnostics go through the standard logging module, with the
+# 'OpenTrepWrapper' logger. Its level and handlers are left to the
+# application (see setup_logging() for the command-line scripts)
+logger = logging.getLogger("OpenTrepWrapper")
+logger.addHandler(logging.NullHandler())
+
+# Format of the log records, mentioning the caller (file, function and line)
+LOG_FORMAT = "[TREP][%(filename)s][%(funcName)s][%(lineno)d] - %(message)s"
+
+# Logging levels corresponding to the OpenTrepLib log levels
+LOG_LEVELS = {1: logging.CRITICAL, 2: logging.ERROR, 3: logging.WARNING,
+              4: logging.INFO, 5: logging.DEBUG}
+
+
+def setup_logging(log_level=2, stream=None):
+    """
+    Configure the 'OpenTrepWrapper' logger for a command-line script: its
+    level follows the OpenTrepLib log level, and the log records are
+    displayed on the given stream (the standard error by default).
+    Applications embedding OpenTrepLib configure logging by themselves
+    """
+    logger.setLevel(LOG_LEVELS.get(log_level, logging.DEBUG))
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    return handler
+
+# Report of OpenTrepLib.init_cpp_extension()
+InitReport = namedtuple('InitReport', ['warm_start', 'duration'])
+
+# OpenTrep Python extension, imported on the first use (see _getPyOpenTrep())
+_pyopentrep = None
+
+# Travel Protobuf module of the OpenTrep Python extension and Protobuf
+# decoding error, imported on the first use (see _getTravelProtobuf())
+_travel_pb2 = None
+_pb_decode_error = None
+
+# Faster than calling the named tuple classes, as their fields are given
+# in order
+_new_tuple = tuple.__new__
+
+
+def _megaBytes(nb_bytes):
+    return None if nb_bytes is None else round(nb_bytes / 2**20)
+
+
+def _compactLocation(match, alternates=()):
+    """
+    CompactLocation of a match of the compact format,
+    e.g., 'AUR:AVF:BAE/100' => (1.0, 'AUR', ('AVF', 'BAE'), alternates).
+    Most of the matches have no extra code, and are not split
+    """
+    codes, _, score = match.partition('/')
+    if ':' in codes:
+        code, *extra_codes = codes.split(':')
+        extra_codes = tuple(extra_codes)
+    else:
+        code, extra_codes = codes, ()
+    return _new_tuple(CompactLocation,
+                      (float(score) / 100.0, code, extra_codes, alternates))
 
 class Error(Exception):
    """
@@ -75,24 +155,45 @@ class OpenTrepLib():
     and a few utilities.
 
     Log levels: 1. Critical; 2. Errors; 3: Warnings; 4: Info; 5: Verbose
+
+    The diagnostics are emitted through the 'OpenTrepWrapper' logger
+    (see the logging module), according to the log level. Displaying them
+    is left to the logging configuration of the application.
     """
 
     def __init__(self):
         # Default settings
-        self.por_filepath = '/tmp/opentraveldata/optd_por_public_all.csv'
-        self.xapian_index_filepath = '/tmp/opentrep/xapian_traveldb'
+        self.por_filepath = DEFAULT_POR
+        self.xapian_index_filepath = DEFAULT_IDX
         self.sql_db_type_list = set(['nodb', 'sqlite', 'mysql'])
         self.sql_db_type = 'nodb'
         self.sql_db_conn_str = ''
         self.deployment_nb = 0
-        self.output_available_formats = set(['I', 'J', 'F', 'S'])
-        self.output_format = 'S'
-        self.log_filepath = '/tmp/opentrep/opentrepwrapper.log'
+        self.output_available_formats = set(['I', 'J', 'F', 'S', 'P'])
+        self.output_format = DEFAULT_FMT
+        self.compact_first_only = True
+        self.log_filepath = DEFAULT_LOG
         self.log_level = 2
         self.flag_index_non_iata_por = False
         self.flag_init_xapian = True
         self.flag_add_por_to_db = False
+        self.ingest_workers = None
+        self.searcher_pool_size = 1
+        self.result_cache = None
+        self.persistent_cache = None
+        self.code_index = None
+        self.query_normalizer = None
+        self.batch_dedup_size = 0
+        self.metrics = None
+        self.slow_query_log = None
+        self._index_generation = 0
+        self.fingerprint_check_interval = 1.0
+        self._fingerprint = (None, None, 0.0, None)
         self._trep_lib = None
+        self._searcher_pool = None
+        self.init_report = None
+        self._pb_local = threading.local()
+        self._metrics_local = threading.local()
 
     def __str__(self):
         """
@@ -106,16 +207,15 @@ class OpenTrepLib():
 
     def get_log_pfx(self):
         """
-        Derive a prefix for logging purpose
+        Derive a prefix for logging purpose, e.g., for the error messages
+        of the exceptions. Only the frame of the caller is inspected
         """
         # 0 represents this line
         # 1 represents line at caller
-        callerframerecord = inspect.stack()[1]
-
-        frame = callerframerecord[0]
-        info = inspect.getframeinfo(frame)
-        filename = os.path.basename(info.filename)
-        log_pfx = f"[TREP][{filename}][{info.function}][{info.lineno}] -"
+        frame = sys._getframe(1)
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        log_pfx = f"[TREP][{filename}][{code.co_name}][{frame.f_lineno}] -"
         return log_pfx
 
     def derive_optd_por_test_filepath(self, pyotp_path=None):
@@ -126,7 +226,28 @@ class OpenTrepLib():
     def init_cpp_extension(self, por_path=None, xapian_index_path=None,
                            sql_db_type=None, sql_db_conn_str=None,
                            deployment_nb=None,
-                           log_path=None, log_level=None):
+                           log_path=None, log_level=None,
+                           searcher_pool_size=None, warm_start=False):
+        """
+        Initialize the OpenTrep Python extension.
+
+        With searcher_pool_size greater than 1, several threads may search
+        at the same time, each one with its own searcher handle on the
+        Xapian index. The additional handles are created lazily.
+
+        When deployment_nb is not given, the live deployment, as recorded
+        by the last blue/green switch (see the deployment module), is
+        searched, if any.
+
+        With warm_start=True, when the Xapian index has already been built
+        (see index()) from the same, unchanged, POR file and with the same
+        settings, it is opened as is, without being re-initialized.
+
+        Return an InitReport, telling whether the Xapian index has been
+        warm-started, and the duration (in seconds) of the initialization.
+        """
+        start = time.monotonic()
+
         if por_path:
             self.por_filepath = por_path
 
@@ -146,8 +267,14 @@ class OpenTrepLib():
         if sql_db_conn_str:
             self.sql_db_conn_str = sql_db_conn_str
 
-        if deployment_nb:
+        if deployment_nb is not None:
             self.deployment_nb = deployment_nb
+        else:
+            # The live deployment, as recorded by the last blue/green switch
+            # (see the deployment module), if any
+            from .indexing import read_active_deployment
+            self.deployment_nb = read_active_deployment(
+                self.xapian_index_filepath, self.deployment_nb)
 
         if log_path:
             self.log_filepath = log_path
@@ -155,6 +282,9 @@ class OpenTrepLib():
         if log_level:
             self.log_level = log_level
 
+        if searcher_pool_size:
+            self.searcher_pool_size = searcher_pool_size
+
         #
         does_xapian_dir_exist = os.path.isdir(self.xapian_index_filepath)
         if not does_xapian_dir_exist:
@@ -162,58 +292,231 @@ class OpenTrepLib():
             # probably means that the Xapian index has not been created yet.
             # First, the directory has to be created.
             if self.log_level >= 4:
-                log_pfx = self.get_log_pfx()
-                print(f"{log_pfx} Directory {self.xapian_index_path} did not" \
-                      " exist, creating it")
+                logger.info("Directory %s did not exist, creating it",
+                            self.xapian_index_filepath)
             self.mkdir_p(self.xapian_index_filepath)
 
-        #
-        try:
-            # Initialise the OpenTrep Python extension
-            import pyopentrep
+        # Initialise the OpenTrep Python extension
+        pyopentrep = self._getPyOpenTrep()
 
-        except ImportError:
-            #
-            log_pfx = self.get_log_pfx()
-            pypi_url = "https://pypi.org/project/opentrep/"
-            err_msg = f"{log_pfx} Error - The OpenTrep Python externsion " \
-                "cannot be properly initialized. See {pypi_url}"
-            raise ImportError(err_msg)
+        if not por_path:
+            # Derive the path to the test POR file
+            otpso_fp = pyopentrep.__file__
+            self.por_filepath = self.derive_optd_por_test_filepath(otpso_fp)
+
+        trep_lib = None
+        if warm_start and self._isIndexUpToDate():
+            open_start = time.monotonic()
+            try:
+                trep_lib = self._newSearcher(False)
+
+            except OPTInitError as error:
+                if self.log_level >= 3:
+                    logger.warning("The Xapian index cannot be warm-started, "
+                                   "it is re-initialized - %s", error)
+
+        is_warm = trep_lib is not None
+        if not is_warm:
+            open_start = time.monotonic()
+            trep_lib = self._newSearcher(self.flag_init_xapian)
+        open_duration = time.monotonic() - open_start
+        self._setSearcher(trep_lib)
+
+        self.init_report = InitReport(is_warm, time.monotonic() - start)
+        if self.metrics is not None:
+            self.metrics.observe('open', '', open_duration)
+            self.metrics.observe('init', '', self.init_report.duration)
+        if self.log_level >= 4:
+            logger.info("OpenTrep Python extension initialized in %.3fs "
+                        "(%s start)", self.init_report.duration,
+                        "warm" if is_warm else "cold")
+        return self.init_report
 
-        self._trep_lib = pyopentrep.OpenTrepSearcher()
+    def _indexSettings(self):
+        """
+        Settings the Xapian index is built with
+        """
+        return {'xapian_index_filepath': self.xapian_index_filepath,
+                'deployment_nb': self.deployment_nb,
+                'sql_db_type': self.sql_db_type,
+                'sql_db_conn_str': self.sql_db_conn_str,
+                'flag_index_non_iata_por': self.flag_index_non_iata_por,
+                'flag_add_por_to_db': self.flag_add_por_to_db}
+
+    def _isIndexUpToDate(self):
+        """
+        Whether the Xapian index has been built from the current POR file,
+        with the current settings
+        """
+        from . import indexing
 
-        # Derive the path to the test POR file
-        otpso_fp = inspect.getfile(pyopentrep)
-        optd_por_test_filepath = self.derive_optd_por_test_filepath(otpso_fp)
+        state = indexing.load_index_state(indexing.state_filepath(
+            self.xapian_index_filepath, self.deployment_nb))
+        return indexing.index_state_matches(state, self.por_filepath,
+                                            self._indexSettings())
+
+    def _newSearcher(self, flag_init_xapian=False, deployment_nb=None,
+                     por_filepath=None):
+        """
+        Create and initialize an OpenTrep searcher handle, on the Xapian
+        index of the given deployment (by default, the live one). The POR
+        file is the one indexed by the handle (by default, por_filepath)
+        """
+        if deployment_nb is None:
+            deployment_nb = self.deployment_nb
+        if por_filepath is None:
+            por_filepath = self.por_filepath
+
+        trep_lib = self._getPyOpenTrep().OpenTrepSearcher()
 
-        if not por_path:
-            self.por_filepath = optd_por_test_filepath
-        
         # sqlDBType = 'sqlite'
         # sqlDBConnStr = '/tmp/opentrep/sqlite_travel.db'
-        xapianDBActualPath = f"{self.xapian_index_filepath}{self.deployment_nb}"
-        initOK = self._trep_lib.init (self.por_filepath,
-                                      self.xapian_index_filepath,
-                                      self.sql_db_type,
-                                      self.sql_db_conn_str,
-                                      self.deployment_nb,
-                                      self.flag_index_non_iata_por,
-                                      self.flag_init_xapian,
-                                      self.flag_add_por_to_db,
-                                      self.log_filepath)
+        xapianDBActualPath = f"{self.xapian_index_filepath}{deployment_nb}"
+        if self.log_level >= 5:
+            logger.debug("Xapian database of the searcher handle: %s",
+                         xapianDBActualPath)
+
+        initOK = trep_lib.init (por_filepath,
+                                self.xapian_index_filepath,
+                                self.sql_db_type,
+                                self.sql_db_conn_str,
+                                deployment_nb,
+                                self.flag_index_non_iata_por,
+                                flag_init_xapian,
+                                self.flag_add_por_to_db,
+                                self.log_filepath)
 
         if not initOK:
             log_pfx = self.get_log_pfx()
             err_msg = f"{log_pfx} Error - The OpenTrep Python extension " \
-                f"cannot be initialized - OpenTrepLib object: {self}"
+                f"cannot be initialized on {xapianDBActualPath} - " \
+                f"OpenTrepLib object: {self}"
             raise OPTInitError(err_msg)
 
+        return trep_lib
+
+    def _setSearcher(self, trep_lib):
+        """
+        Use the given searcher handle as the main one, and as the first one
+        of the pool of handles used by the searches. The other handles of
+        the pool are created on the same Xapian index, without
+        re-initializing it
+        """
+        self._trep_lib = trep_lib
+        self._searcher_pool = self._newSearcherPool(trep_lib,
+                                                    self.deployment_nb)
+
+    def _newSearcherPool(self, trep_lib, deployment_nb):
+        """
+        Pool of searcher handles on the Xapian index of the given
+        deployment, trep_lib being its first handle
+        """
+        pool = SearcherPool(functools.partial(self._newSearcher,
+                                              False, deployment_nb),
+                            self.searcher_pool_size)
+        pool.add(trep_lib)
+        return pool
+
+    def _switchDeployment(self, deployment_nb, trep_lib, searcher_pool):
+        """
+        Make the given deployment (main searcher handle and pool of handles)
+        the live one, and return the former one, as a
+        (deployment_nb, trep_lib, searcher_pool) tuple.
+
+        Every search takes the pool once (see _rawSearch()), so that
+        the searches in flight complete on the former deployment, while
+        the next ones run on the new deployment. The pool is switched
+        before the deployment number, which is part of the token of the
+        result cache, so that no result of the former deployment may be
+        cached for the new one.
+        """
+        previous = (self.deployment_nb, self._trep_lib, self._searcher_pool)
+        self._searcher_pool = searcher_pool
+        self._trep_lib = trep_lib
+        self.deployment_nb = deployment_nb
+        return previous
+
+    def _rawSearch(self, opentrepOutputFormat, search_string):
+        """
+        Call the OpenTrep C++ library, with a searcher handle of the pool
+        """
+        if self.metrics is not None or self.slow_query_log is not None:
+            return self._timedRawSearch(opentrepOutputFormat, search_string)
+
+        pool = self._searcher_pool
+        try:
+            trep_lib = pool.checkout()
+        except SearcherPoolClosedError:
+            pool, trep_lib = self._checkoutLiveSearcher(pool)
+        try:
+            if opentrepOutputFormat == "P":
+                return trep_lib.searchToPB(search_string)
+            return trep_lib.search(opentrepOutputFormat, search_string)
+        finally:
+            pool.checkin(trep_lib)
+
+    def _checkoutLiveSearcher(self, pool):
+        """
+        Check a handle out of the live pool, when the given one has been
+        closed, the deployment having been switched meanwhile
+        """
+        while pool is not self._searcher_pool and self._searcher_pool:
+            pool = self._searcher_pool
+            try:
+                return pool, pool.checkout()
+            except SearcherPoolClosedError:
+                continue
+        raise SearcherPoolClosedError(
+            f"{self.get_log_pfx()} Error - The pool of searcher handles "
+            f"is closed - OpenTrepLib: {self}")
+
+    def _timedRawSearch(self, opentrepOutputFormat, search_string):
+        """
+        Same as _rawSearch(), timing the call to the OpenTrep C++ library
+        (see _timedSearcher()). The searches profiled by the slow-query
+        log are not observed
+        """
+        local = self._metrics_local
+        metrics = None if getattr(local, 'profiling', False) else self.metrics
+        pool = self._searcher_pool
+        try:
+            trep_lib = pool.checkout()
+        except SearcherPoolClosedError:
+            pool, trep_lib = self._checkoutLiveSearcher(pool)
+        start = time.perf_counter()
+        try:
+            if opentrepOutputFormat == "P":
+                return trep_lib.searchToPB(search_string)
+            return trep_lib.search(opentrepOutputFormat, search_string)
+        except Exception:
+            if metrics is not None:
+                metrics.count_error('library', opentrepOutputFormat)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            pool.checkin(trep_lib)
+            local.library = duration
+            if metrics is not None:
+                metrics.observe('library', opentrepOutputFormat, duration)
+
     def finalize(self):
         """
         Free the OpenTREP library resource
         """
-        if self._trep_lib:
+        # The search being profiled, if any, needs the searcher handles
+        if self.slow_query_log is not None:
+            self.slow_query_log.close()
+        if self._searcher_pool:
+            self._searcher_pool.close(release=self._releaseSearcher)
+        elif self._trep_lib:
             self._trep_lib.finalize()
+        self._searcher_pool = None
+        self._trep_lib = None
+        if self.persistent_cache is not None:
+            self.persistent_cache.close()
+
+    def _releaseSearcher(self, trep_lib):
+        trep_lib.finalize()
 
     def __enter__(self):
         """
@@ -241,7 +544,8 @@ class OpenTrepLib():
             raise OPTInitError(err_msg)
         
         # Calls the underlying OpenTrep library service
-        filePathStr = self._trep_lib.getPaths()
+        with self._searcher_pool.searcher() as trep_lib:
+            filePathStr = trep_lib.getPaths()
         filePathList = filePathStr.split(';')
 
         # Report the results
@@ -253,9 +557,33 @@ class OpenTrepLib():
         print(f"{log_pfx} Xapian-based travel database/index: " \
               f"'{xapian_filepath}'")
 
-    def index(self):
+    def index(self, incremental=False, ingest=False):
         '''
         Indexation
+
+        With incremental=True, the POR file is compared with the manifest
+        of the POR indexed so far (see the indexing module), and the Xapian
+        index is re-built only when some POR have been added, updated or
+        deleted, or when the settings of the indexation (e.g.,
+        flag_index_non_iata_por) have changed. As the OpenTrep library does
+        not allow to update single documents of the Xapian index, a change
+        triggers a full re-build. When the POR file is the one of the last
+        (incremental) indexation, unchanged since then (see
+        _isIndexUpToDate()), it is not even hashed row by row.
+
+        With ingest=True, the POR file is first parsed and filtered by
+        a pool of (ingest_workers) processes (see the ingest module), and
+        the OpenTrep library indexes the prepared POR file, i.e., only
+        the POR to be indexed (by default, the ones with an IATA code).
+
+        The Xapian index is re-built by a new searcher handle, initialized
+        with flag_init_xapian, which then becomes the main handle: the main
+        handle of a warm start or of a deployment only reads the index.
+
+        Return an IndexReport, with the number of indexed POR (None when
+        the re-build has been skipped), the IndexDelta (None when not
+        incremental), the duration (in seconds) and the IngestReport
+        (None without ingestion).
         '''
 
         # Check that the OpenTrep Python extension has been initialized
@@ -265,17 +593,179 @@ class OpenTrepLib():
                 "not been initialized properly - OpenTrepLib: {self}"
             raise OPTInitError(err_msg)
 
-        if self.log_level >= 4:
-            print("Perform the indexation of the (Xapian-based) travel database.")
-            print("That operation may take several minutes on some slow machines.")
-            print("It takes less than 20 seconds on fast ones...")
+        from . import indexing, persistent
 
-        # Calls the underlying OpenTrep library service
-        result = self._trep_lib.index()
+        metrics = self.metrics
+        start = time.monotonic()
+        manifest_fp = indexing.manifest_filepath(self.xapian_index_filepath,
+                                                 self.deployment_nb)
+        manifest, delta, ingest_report = None, None, None
 
+        if incremental and os.path.isfile(manifest_fp) \
+           and self._isIndexUpToDate():
+            duration = time.monotonic() - start
+            if metrics is not None:
+                metrics.observe('diff', '', duration)
+                metrics.observe('index', '', duration)
+            if self.log_level >= 4:
+                logger.info("The POR file (%s) has not changed since the "
+                            "last indexation. Skipping it (%.2fs)",
+                            self.por_filepath, duration)
+            return indexing.IndexReport(None, indexing.IndexDelta([], [], []),
+                                        duration)
+
+        if ingest:
+            from .ingest import prepared_filepath
+            prepared_fp = prepared_filepath(self.xapian_index_filepath,
+                                            self.deployment_nb)
+            manifest, ingest_report = self._ingestPORFile(prepared_fp)
+            if metrics is not None:
+                metrics.observe('ingest', '', ingest_report.duration)
+
+        if incremental:
+            diff_start = time.monotonic()
+            manifest, delta = self._diffPORFile(manifest_fp, manifest)
+            if metrics is not None:
+                metrics.observe('diff', '', time.monotonic() - diff_start)
+
+            if not (delta.added or delta.updated or delta.deleted):
+                duration = time.monotonic() - start
+                if metrics is not None:
+                    metrics.observe('index', '', duration)
+                if self.log_level >= 4:
+                    logger.info("The POR file (%s) has not changed since the "
+                                "last indexation. Skipping it (%.2fs)",
+                                self.por_filepath, duration)
+                return indexing.IndexReport(None, delta, duration,
+                                            ingest_report)
+
+        elif os.path.isfile(manifest_fp):
+            # The manifest will no longer describe the Xapian index
+            os.remove(manifest_fp)
+
+        # Until the indexation is complete, the Xapian index may not be
+        # warm-started (see init_cpp_extension())
+        state_fp = indexing.state_filepath(self.xapian_index_filepath,
+                                           self.deployment_nb)
+        if os.path.isfile(state_fp):
+            os.remove(state_fp)
+
+        if self.log_level >= 4:
+            logger.info("Perform the indexation of the (Xapian-based) travel "
+                        "database. That operation may take several minutes "
+                        "on some slow machines. It takes less than 20 seconds "
+                        "on fast ones...")
+
+        # Calls the underlying OpenTrep library service. No search may run
+        # meanwhile, and the other searcher handles are dropped afterwards,
+        # so that they get re-created on the new index
+        pool = self._searcher_pool
+        build_start = time.monotonic()
+        with pool.exclusive(keep=self._trep_lib,
+                            release=self._releaseSearcher):
+            # The OpenTrep library re-builds the Xapian index only with
+            # a handle initialized with flag_init_xapian, which the handles
+            # of a warm start or of a deployment are not. The POR file to
+            # be indexed is given when the handle is initialized
+            indexer = self._newSearcher(
+                True, por_filepath=prepared_fp if ingest else None)
+            pool.replace(self._trep_lib, indexer)
+            self._releaseSearcher(self._trep_lib)
+            self._trep_lib = indexer
+
+            result = indexer.index()
+
+        if metrics is not None:
+            metrics.observe('build', '', time.monotonic() - build_start)
+
+        # The results cached so far may no longer be valid. The stamp
+        # changes the fingerprint of the Xapian index for the persistent
+        # cache of all the processes
+        persistent.write_stamp(self.xapian_index_filepath, self.deployment_nb)
+        self._index_generation += 1
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        if self.code_index is not None:
+            self.code_index.reload(self.por_filepath)
+
+        if incremental:
+            indexing.save_manifest(manifest, manifest_fp,
+                                   self._indexSettings())
+        if os.path.isfile(self.por_filepath):
+            indexing.save_index_state(
+                indexing.index_state(self.por_filepath,
+                                     self._indexSettings()), state_fp)
+
+        duration = time.monotonic() - start
+        if metrics is not None:
+            metrics.observe('index', '', duration)
         if self.log_level >= 4:
             # Report the results
-            print(f"Done. Indexed {result} POR (points of reference)")
+            logger.info("Done. Indexed %s POR (points of reference) in %.2fs",
+                        result, duration)
+
+        return indexing.IndexReport(result, delta, duration, ingest_report)
+
+    def _ingestPORFile(self, prepared_fp):
+        """
+        Prepare the POR file to be indexed, with a pool of worker processes
+        """
+        from .ingest import ingest_por_file
+
+        start = time.monotonic()
+
+        def progress(nb_rows):
+            if self.log_level >= 5:
+                logger.debug("Ingested %d rows of the POR file so far (%.2fs)",
+                             nb_rows, time.monotonic() - start)
+
+        manifest, report = ingest_por_file(
+            self.por_filepath, prepared_fp,
+            keep_non_iata=self.flag_index_non_iata_por,
+            workers=self.ingest_workers, progress=progress)
+
+        if report.nb_malformed and self.log_level >= 3:
+            logger.warning("%d malformed rows of the POR file (%s) have been "
+                           "skipped", report.nb_malformed, self.por_filepath)
+        if self.log_level >= 4:
+            logger.info("Ingested %d rows of the POR file (%d kept) in "
+                        "%.2fs, i.e., %.0f rows/s. Peak memory: %s MB "
+                        "(workers: %s MB)", report.nb_rows, report.nb_kept,
+                        report.duration, report.rows_per_sec,
+                        _megaBytes(report.peak_memory),
+                        _megaBytes(report.peak_memory_workers))
+
+        return manifest, report
+
+    def _diffPORFile(self, manifest_fp, manifest=None):
+        """
+        Manifest of the POR file (unless already given), and POR changed
+        since the last indexation
+        """
+        from . import indexing
+
+        start = time.monotonic()
+
+        def progress(nb_rows):
+            if self.log_level >= 4:
+                logger.info("Hashed %d rows of the POR file so far (%.2fs)",
+                            nb_rows, time.monotonic() - start)
+
+        if manifest is None:
+            manifest = indexing.compute_manifest(self.por_filepath, progress)
+        # The manifest of the Xapian index built with other settings
+        # is empty, so that the Xapian index gets fully re-built
+        old_manifest = indexing.load_manifest(manifest_fp,
+                                              self._indexSettings())
+        delta = indexing.diff_manifests(old_manifest, manifest)
+
+        if self.log_level >= 4:
+            logger.info("POR file compared with the last indexation in %.2fs: "
+                        "%d added, %d updated and %d deleted POR",
+                        time.monotonic() - start, len(delta.added),
+                        len(delta.updated), len(delta.deleted))
+
+        return manifest, delta
 
     ##
     # JSON interpreter. The JSON structure contains a list with the main matches,
@@ -298,93 +788,141 @@ class OpenTrepLib():
     #      ]}
     #
     def interpretFromJSON(self, jsonFormattedResult):
-        parsedStruct = json.loads(jsonFormattedResult)
-        interpretedString = ""
-        for location in parsedStruct["locations"]:
-            interpretedString += location["iata_code"] + "-"
-            interpretedString += location["icao_code"] + "-"
-            interpretedString += location["geonames_id"] + " "
-            interpretedString += "(" + location["page_rank"] + "%) / "
-            interpretedString += location["cities"]["city_details"]["iata_code"] + ": "
-            interpretedString += location["lat"] + " "
-            interpretedString += location["lon"] + "; "
+        return format_json_places(jsonFormattedResult)
 
-        #
-        return interpretedString
+    def placesFromJSON(self, jsonFormattedResult):
+        """
+        Extract the main matches from a JSON result string, as a list
+        of PORMatch
+        """
+        return decode_json(jsonFormattedResult)
 
     ##
     # Protobuf interpreter. The Protobuf structure contains a list with the
     # main matches, along with their associated fields (weights, coordinates,
     # etc).
     def interpretFromProtobuf(self, protobufFormattedResult):
-        unmatchedKeywordString, interpretedString = "", ""
+        places, unmatchedKeywordString = \
+            self.placesFromProtobuf(protobufFormattedResult)
+        return unmatchedKeywordString, format_places(places)
 
-        # DEBUG
-        # print (f"DEBUG - Protobuf (array of bytes): {protobufFormattedResult}")
+    def placesFromProtobuf(self, protobufFormattedResult):
+        """
+        Extract the main matches (as a list of PORMatch) and
+        the un-matched keywords from a Protobuf result.
 
-        # Protobuf
-        import google.protobuf.message
-        
-        try:
-            import Travel_pb2
+        The serialized result may be given as bytes, bytearray or memoryview,
+        and is parsed without being copied. The QueryAnswer message object
+        is re-used by the following calls (of the same thread).
+        """
+        # DEBUG
+        # logger.debug("Protobuf (array of bytes): %s", protobufFormattedResult)
 
-        except ImportError:
-            #
-            log_pfx = self.get_log_pfx()
-            err_msg = f"{log_pfx} Error - The Travel Protobuf part of the " \
-                "OpenTrep Python externsion cannot be properly initialized. " \
-                "See https://pypi.org/project/opentrep/"
-            raise ImportError(err_msg)
+        queryAnswer = getattr(self._pb_local, "queryAnswer", None)
+        if queryAnswer is None:
+            # Protobuf
+            queryAnswer = self._getTravelProtobuf().QueryAnswer()
+            self._pb_local.queryAnswer = queryAnswer
 
-        queryAnswer = Travel_pb2.QueryAnswer()
         try:
+            # ParseFromString() clears the message beforehand
             queryAnswer.ParseFromString(protobufFormattedResult)
 
-        except google.protobuf.message.DecodeError as err:
+        except self._getProtobufDecodeError():
             #
-            log_pfx = self.get_log_pfx()
-            print(f"{log_pfx} Error - Issue with the decoding. Will continue " \
-                  "though")
-            print(f"{log_pfx} Protobuf QueryAnswer object: {queryAnswer}")
-
-        # List of recognised places
-        placeList = queryAnswer.place_list
+            logger.error("Issue with the decoding. Will continue though - "
+                         "Protobuf QueryAnswer object: %s", queryAnswer)
 
         # DEBUG
         if self.log_level >= 5:
-            print (f"DEBUG - Result: {placeList}")
-
-        for place in placeList.place:
-            airport_code = place.tvl_code
-            interpretedString += airport_code.code + "-"
-            icao_code = place.icao_code
-            interpretedString += icao_code.code + "-"
-            geoname_id = place.geonames_id
-            interpretedString += str(geoname_id.id) + " "
-            page_rank = place.page_rank
-            interpretedString += "(" + str(page_rank.rank) + "%) / "
-            city_list = place.city_list.city
-            city = Travel_pb2.City()
-            for svd_city in city_list:
-                city = svd_city
-            interpretedString += str(city.code.code) + ": "
-            geo_point = place.coord
-            interpretedString += str(geo_point.latitude) + " "
-            interpretedString += str(geo_point.longitude) + "; "
+            logger.debug("Result: %s", queryAnswer.place_list)
+
+        # List of recognised places
+        places = decode_protobuf(queryAnswer)
 
         # List of un-matched keywords
         unmatchedKeywords = queryAnswer.unmatched_keyword_list
-
-        for keyword in unmatchedKeywords.word:
-            unmatchedKeywordString += keyword
+        unmatchedKeywordString = ' '.join(unmatchedKeywords.word)
 
         #
-        return unmatchedKeywordString, interpretedString
-    
-    def search(self, search_string=None, outputFormat=None):
+        return places, unmatchedKeywordString
+
+    def _getPyOpenTrep(self):
+        """
+        OpenTrep Python extension (pyopentrep). It is imported only once
+        """
+        global _pyopentrep
+
+        if _pyopentrep is None:
+            try:
+                import pyopentrep
+
+            except ImportError:
+                #
+                log_pfx = self.get_log_pfx()
+                pypi_url = "https://pypi.org/project/opentrep/"
+                err_msg = f"{log_pfx} Error - The OpenTrep Python externsion " \
+                    f"cannot be properly initialized. See {pypi_url}"
+                raise ImportError(err_msg)
+
+            _pyopentrep = pyopentrep
+
+        return _pyopentrep
+
+    def _getTravelProtobuf(self):
+        """
+        Travel Protobuf module (Travel_pb2) of the OpenTrep Python extension.
+        It is imported only once
+        """
+        global _travel_pb2, _pb_decode_error
+
+        if _travel_pb2 is None:
+            try:
+                import google.protobuf.message
+                import Travel_pb2
+
+            except ImportError:
+                #
+                log_pfx = self.get_log_pfx()
+                err_msg = f"{log_pfx} Error - The Travel Protobuf part of " \
+                    "the OpenTrep Python externsion cannot be properly " \
+                    "initialized. See https://pypi.org/project/opentrep/"
+                raise ImportError(err_msg)
+
+            _pb_decode_error = google.protobuf.message.DecodeError
+            _travel_pb2 = Travel_pb2
+
+        return _travel_pb2
+
+    def _getProtobufDecodeError(self):
+        """
+        Protobuf decoding error (google.protobuf.message.DecodeError), resolved
+        even when _getTravelProtobuf() has been by-passed (e.g., when the
+        Travel Protobuf module is stood in for). When the Protobuf runtime
+        is not installed, an empty tuple is given, which catches nothing
+        """
+        global _pb_decode_error
+
+        if _pb_decode_error is None:
+            try:
+                import google.protobuf.message
+
+            except ImportError:
+                return ()
+
+            _pb_decode_error = google.protobuf.message.DecodeError
+
+        return _pb_decode_error
+
+    def search(self, search_string=None, outputFormat=None, display=False):
         """
         Search
 
+        Return a typed result (see the results module), depending on the
+        output format: CompactResult ('S'), FullResult ('F'), JSONResult ('J'),
+        InterpretedResult ('I') or ProtobufResult ('P'). When display is True,
+        the result is also displayed on the standard output.
+
         If no search string was supplied as arguments of the command-line,
         ask the user for some
 
@@ -394,10 +932,109 @@ class OpenTrepLib():
         of how to use the output generated by the OpenTrep library. Hence,
         that latter does not support that "output format". So, the raw JSON
         format is required, and the JSON string will then be parsed and
-        interpreted by the jsonResultParser() method, just to show how it
+        interpreted by the placesFromJSON() method, just to show how it
         works
         """
 
+        # Check that the OpenTrep Python extension has been initialized,
+        # and select the search method corresponding to the output format
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        searchFormat = self.getFormatSearcher(outputFormat)
+        if metrics is not None:
+            metrics.observe('dispatch', outputFormat or self.output_format,
+                            time.perf_counter() - start)
+
+        # If no search string was supplied as arguments of the command-line,
+        # ask the user for some
+        if not search_string:
+            # Ask for the user input
+            search_string = input(
+                "Enter a search string, e.g., 'rio de janero sna francisco'"
+            )
+        if search_string == "":
+            search_string = "nce sfo"
+
+        # DEBUG
+        if self.log_level >= 4:
+            logger.info("search_string: %s", search_string)
+
+        # Call the OpenTrep C++ library.
+        result = searchFormat(search_string)
+
+        if display:
+            start = time.perf_counter()
+            self.display(result)
+            if metrics is not None:
+                metrics.observe('display', result.output_format,
+                                time.perf_counter() - start)
+
+        return result
+
+    def search_many(self, search_strings, output_format=None):
+        """
+        Batch search
+
+        Return a generator of typed results (see search()), in the same
+        order as the given search strings. The search strings may be any
+        iterable, which is consumed lazily, so that arbitrarily large
+        streams of queries can be handled.
+
+        The initialization of the OpenTrep Python extension and the output
+        format are checked only once, when search_many() is called, rather
+        than for every search string, and the call to the OpenTrep library
+        and the parser are selected once as well. With the default settings,
+        on distinct search strings, that is about x1.2 ('S') and x1.4 ('F')
+        faster than a loop of search() (see benchmarks/bench_search_many.py).
+
+        When batch_dedup_size is set (e.g., to 4096), the search strings
+        which are identical once normalized (see enable_normalization())
+        are searched only once, among the last batch_dedup_size distinct
+        ones, their result being given back for each of them. That costs
+        a look-up per search string, which is only worth it when the
+        batch has many duplicates, hence it is off by default.
+        """
+
+        # Check that the OpenTrep Python extension has been initialized,
+        # and select the search method corresponding to the output format
+        searchFormat = self._getSearcher(output_format, batch=True)
+        if self.batch_dedup_size:
+            searchFormat = self._dedupSearcher(searchFormat,
+                                               self.batch_dedup_size)
+        elif self.query_normalizer is not None:
+            searchFormat = self._normalizedSearcher(searchFormat)
+
+        # DEBUG
+        if self.log_level >= 4:
+            return self._searchManyVerbose(searchFormat, search_strings)
+
+        return map(searchFormat, search_strings)
+
+    def _searchManyVerbose(self, searchFormat, search_strings):
+        for search_string in search_strings:
+            logger.info("search_string: %s", search_string)
+            yield searchFormat(search_string)
+
+    def getFormatSearcher(self, outputFormat=None):
+        """
+        Check that the OpenTrep Python extension has been initialized
+        and return the search method, taking a search string and returning
+        a typed result, corresponding to the given output format
+        """
+        searchFormat = self._getSearcher(outputFormat)
+        if self.query_normalizer is not None:
+            searchFormat = self._normalizedSearcher(searchFormat)
+        return searchFormat
+
+    def _getSearcher(self, outputFormat, batch=False):
+        """
+        Search method for the given output format, expecting normalized
+        search strings when a normalizer is set. For a batch, the call to
+        the OpenTrep library and the parser are selected once
+        (see _formatSearcher()), which is not worth it for a single search
+        """
+
         # Check that the OpenTrep Python extension has been initialized
         if not self._trep_lib:
             log_pfx = self.get_log_pfx()
@@ -407,91 +1044,540 @@ class OpenTrepLib():
 
         if not outputFormat:
             outputFormat = self.output_format
-            
+
         if outputFormat not in self.output_available_formats:
             log_pfx = self.get_log_pfx()
             err_msg = f"{log_pfx} Error - The given output format " \
                 f"('{outputFormat}') is invalid. It should be one of " \
                 f"{self.output_available_formats}."
             raise OutputFormatError(err_msg)
-        
-        # If no search string was supplied as arguments of the command-line,
-        # ask the user for some
-        if not search_string:
-            # Ask for the user input
-            search_string = raw_input(
-                "Enter a search string, e.g., 'rio de janero sna francisco'"
-            )
-        if search_string == "":
-            search_string = "nce sfo"
 
-        # DEBUG
-        if self.log_level >= 4:
-            print(f"search_string: {search_string}")
+        if batch:
+            searchFormat = self._formatSearcher(outputFormat)
+        else:
+            searchFormat = getattr(self, self._format_searchers[outputFormat])
+        fallbackSearch = searchFormat
 
-        ##
-        # Call the OpenTrep C++ library.
-        #
-        opentrepOutputFormat = outputFormat
-        result = None
+        if self.persistent_cache is not None:
+            fallbackSearch = self._persistentSearcher(
+                fallbackSearch, outputFormat, self.persistent_cache)
 
-        # The 'I' (Interpretation from JSON) output format is just an example
-        # of how to use the output generated by the OpenTrep library. Hence,
-        # that latter does not support that "output format". So, the raw JSON
-        # format is required, and the JSON string will then be parsed and
-        # interpreted by the interpretFromJSON() method, just to show how it
-        # works
-        if opentrepOutputFormat == "I":
-            opentrepOutputFormat = "J"
+        if self.result_cache is not None:
+            fallbackSearch = self._cachedSearcher(
+                fallbackSearch, outputFormat, self.result_cache)
 
-        #
-        if opentrepOutputFormat != "P":
-            result = self._trep_lib.search(opentrepOutputFormat, search_string)
+        if self.code_index is not None:
+            fallbackSearch = self._codeSearcher(searchFormat, fallbackSearch,
+                                                outputFormat)
+
+        if self.metrics is not None or self.slow_query_log is not None:
+            return self._timedSearcher(fallbackSearch, outputFormat,
+                                       self.metrics, self.slow_query_log)
+
+        return fallbackSearch
 
+    def _indexToken(self):
+        """
+        Description of the Xapian index the searches currently run on,
+        the results computed on another index being no longer valid
+        """
+        return (self.xapian_index_filepath, self.deployment_nb,
+                self._index_generation)
+
+    def _indexFingerprint(self):
+        """
+        Fingerprint of the Xapian index the searches currently run on,
+        shared by all the processes (see persistent.index_fingerprint()).
+        It is computed again when the Xapian index changes, i.e., when it
+        is re-built by this process or, as told by its stamp (checked at
+        most every fingerprint_check_interval seconds), by another process
+        """
+        token, signature, checked, fingerprint = self._fingerprint
+        current_token = self._indexToken()
+        now = time.monotonic()
+        if token == current_token \
+           and now - checked < self.fingerprint_check_interval:
+            return fingerprint
+
+        from . import persistent
+        current_signature = persistent.stamp_signature(
+            self.xapian_index_filepath, self.deployment_nb)
+        if token != current_token or signature != current_signature:
+            fingerprint = persistent.index_fingerprint(
+                self.xapian_index_filepath, self.deployment_nb)
+        self._fingerprint = (current_token, current_signature, now,
+                             fingerprint)
+        return fingerprint
+
+    def enable_cache(self, maxsize=4096, ttl=None):
+        """
+        Cache the search results in memory, keyed on the normalized search
+        string and the output format. At most maxsize results are kept,
+        the least recently used ones being evicted first, and, when ttl
+        is given, the results expire after ttl seconds.
+
+        The cache is emptied when the Xapian index is re-built (see index())
+        or when the deployment number changes.
+        """
+        self.result_cache = QueryCache(maxsize=maxsize, ttl=ttl)
+
+    def disable_cache(self):
+        """
+        Stop caching the search results
+        """
+        self.result_cache = None
+
+    def cache_stats(self):
+        """
+        Hit, miss and eviction counters of the result cache, or None
+        when the cache is not enabled
+        """
+        if self.result_cache is None:
+            return None
+        return self.result_cache.stats()
+
+    def enable_persistent_cache(self, filepath=None, max_bytes=256 * 2**20):
+        """
+        Cache the search results on disk (by default, next to the Xapian
+        index, see the persistent module), so that they are shared by all
+        the processes searching the same Xapian index, and survive their
+        restarts. The results are keyed on the normalized search string,
+        the output format and a fingerprint of the Xapian index, which
+        changes whenever it is re-built. When the results take more than
+        max_bytes, the oldest ones are evicted.
+
+        When the (in-memory) result cache is enabled as well, it is looked
+        up first.
+        """
+        from . import persistent
+
+        self.disable_persistent_cache()
+        self.persistent_cache = persistent.PersistentCache(
+            filepath or persistent.cache_filepath(self.xapian_index_filepath),
+            max_bytes=max_bytes)
+
+    def disable_persistent_cache(self):
+        """
+        Stop caching the search results on disk. The cached results are kept
+        """
+        if self.persistent_cache is not None:
+            self.persistent_cache.close()
+            self.persistent_cache = None
+
+    def _cachedSearcher(self, searchFormat, outputFormat, cache):
+        """
+        Search method looking up the result cache first. The token of the
+        Xapian index (see _indexToken()) is read on every search, so that
+        a deployment switch or a re-indexation is noticed even within
+        a batch
+        """
+        indexToken = self._indexToken
+
+        # The search strings have already been normalized, if needed
+        normalize = normalize_query if self.query_normalizer is None \
+            else str
+
+        def cachedSearch(search_string):
+            token = cache.bind(indexToken())
+            key = (normalize(search_string), outputFormat)
+            result = cache.get(key)
+            if result is None:
+                result = searchFormat(search_string)
+                cache.put(key, result, token)
+            elif result.query != search_string:
+                result = result._replace(query=search_string)
+            return result
+
+        return cachedSearch
+
+    def _persistentSearcher(self, searchFormat, outputFormat, cache):
+        """
+        Search method looking up the persistent cache first. The raw
+        results of the OpenTrep library are cached, and parsed again
+        on a hit. The fingerprint of the Xapian index is checked on every
+        search (see _indexFingerprint()), so that a re-indexation by
+        another process is noticed even within a batch
+        """
+        parse = getattr(self, self._format_parsers[outputFormat])
+        indexFingerprint = self._indexFingerprint
+
+        # The search strings have already been normalized, if needed
+        normalize = normalize_query if self.query_normalizer is None \
+            else str
+
+        def persistentSearch(search_string):
+            token = cache.bind(indexFingerprint())
+            key = (normalize(search_string), outputFormat)
+            rawResult = cache.get(key)
+            if rawResult is not None:
+                return parse(search_string, rawResult)
+
+            result = searchFormat(search_string)
+            if result.raw is not None:
+                cache.put(key, result.raw, token)
+            return result
+
+        return persistentSearch
+
+    def enable_code_index(self, por_filepath=None, include_icao=True,
+                          prime_formats=()):
+        """
+        Answer the search strings made of a single IATA (or, with
+        include_icao, ICAO) code of the POR file (by default, por_filepath)
+        with a look-up table, without going through the full-text matching
+        of the Xapian index. The answer for every code and output format
+        is the one of the OpenTrep library, obtained once: on the first
+        search of that code or, for the given output formats, right now.
+
+        The codes are read again, and the answers dropped, when the Xapian
+        index is re-built (see index()); the answers are also dropped when
+        the deployment number changes.
+        """
+        from .codes import CodeIndex
+
+        self.code_index = CodeIndex.from_por_file(
+            por_filepath or self.por_filepath, include_icao)
+
+        for outputFormat in prime_formats:
+            codeSearch = self.getFormatSearcher(outputFormat)
+            for code in self.code_index.records:
+                codeSearch(code)
+
+    def disable_code_index(self):
+        """
+        Stop answering the codes with the look-up table
+        """
+        self.code_index = None
+
+    def _codeSearcher(self, searchFormat, fallbackSearch, outputFormat):
+        code_index = self.code_index
+        indexToken = self._indexToken
+
+        def codeSearch(search_string):
+            code = code_index.lookup(search_string)
+            if code is None:
+                return fallbackSearch(search_string)
+
+            # The token is read on every search, as a deployment switch
+            # may happen within a batch (see _cachedSearcher())
+            token = code_index.bind(indexToken())
+            result = code_index.answer(code, outputFormat)
+            if result is None:
+                result = searchFormat(code)
+                code_index.store(code, outputFormat, result, token)
+            if result.query != search_string:
+                result = result._replace(query=search_string)
+            return result
+
+        return codeSearch
+
+    def enable_normalization(self, normalizer=None):
+        """
+        Normalize the search strings before they are given to the OpenTrep
+        library (by default, with normalize.fold_query()), so that the search
+        strings differing only by their case, accents, white spaces or
+        punctuation are searched, cached and looked up (see enable_cache()
+        and enable_code_index()) as one. The query field of the results
+        is the given (not normalized) search string
+        """
+        if normalizer is None:
+            from .normalize import fold_query
+            normalizer = fold_query
+
+        self.query_normalizer = normalizer
+
+    def disable_normalization(self):
+        """
+        Give the search strings as is to the OpenTrep library
+        """
+        self.query_normalizer = None
+
+    def enable_metrics(self, metrics=None):
+        """
+        Time the stages of the searches, indexations and initializations
+        (see the metrics module), into the given Metrics instance (by
+        default, a new one). Return the Metrics instance
+        """
+        from .metrics import Metrics
+
+        if metrics is None:
+            metrics = Metrics()
+        self.metrics = metrics
+        return metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+
+    def enable_slow_query_log(self, threshold=0.1, filepath=None,
+                              profile=None, **kwargs):
+        """
+        Record the searches taking more than threshold seconds in
+        a rotating slow-query log (by default, next to the log file),
+        optionally profiling them (see the slowlog module). The other
+        parameters are the ones of SlowQueryLog. Return the SlowQueryLog
+        instance
+        """
+        from .slowlog import SlowQueryLog, slow_query_filepath
+
+        if filepath is None:
+            filepath = slow_query_filepath(self.log_filepath)
+        self.disable_slow_query_log()
+        self.slow_query_log = SlowQueryLog(filepath, threshold,
+                                           profile=profile, **kwargs)
+        return self.slow_query_log
+
+    def disable_slow_query_log(self):
+        if self.slow_query_log is not None:
+            self.slow_query_log.close()
+        self.slow_query_log = None
+
+    def _timedSearcher(self, searchFormat, outputFormat, metrics, slow_log):
+        """
+        Time the searches: the whole search and, depending on whether
+        the OpenTrep library has been called (see _timedRawSearch()),
+        the parsing of its result or the answer of a cache. The timings
+        go to the metrics and, for the slow searches, to the slow-query log
+        """
+        local = self._metrics_local
+        clock = time.perf_counter
+
+        def timedSearch(search_string):
+            local.library = None
+            start = clock()
+            try:
+                result = searchFormat(search_string)
+            except Exception:
+                if metrics is not None:
+                    metrics.count_error('search', outputFormat)
+                raise
+            duration = clock() - start
+
+            # The call to the OpenTrep library has been observed already
+            library = local.library
+            if library is None:
+                stage, timing = 'cache', duration
+                timings = {'cache': duration}
+            else:
+                stage, timing = 'parse', duration - library
+                timings = {'library': library, 'parse': timing}
+
+            if metrics is not None:
+                metrics.observe(stage, outputFormat, timing)
+                metrics.observe('search', outputFormat, duration)
+
+            if slow_log is not None and duration >= slow_log.threshold:
+                self._recordSlowQuery(slow_log, search_string, outputFormat,
+                                      duration, timings, result)
+            return result
+
+        return timedSearch
+
+    def _recordSlowQuery(self, slow_log, search_string, outputFormat,
+                         duration, timings, result):
+        slow_log.record(search_string, outputFormat, self.deployment_nb,
+                        duration, timings,
+                        len(result.raw) if result.raw is not None else 0,
+                        rerun=functools.partial(self._profiledSearch,
+                                                outputFormat, search_string))
+
+    def _profiledSearch(self, outputFormat, search_string):
+        """
+        Search again a slow search string, in the thread of the profiler
+        of the slow-query log, without the caches nor the metrics
+        (see _timedRawSearch())
+        """
+        self._metrics_local.profiling = True
+        uncachedSearch = getattr(self, self._format_searchers[outputFormat])
+        return uncachedSearch(search_string)
+
+    def _normalizedSearcher(self, searchFormat):
+        normalizer = self.query_normalizer
+
+        def normalizedSearch(search_string):
+            result = searchFormat(normalizer(search_string))
+            if result.query != search_string:
+                result = result._replace(query=search_string)
+            return result
+
+        return normalizedSearch
+
+    def _dedupSearcher(self, searchFormat, maxsize):
+        """
+        Search method of a batch, searching only once the search strings
+        which are identical once normalized, among the last maxsize ones
+        """
+        normalizer = self.query_normalizer
+        results = OrderedDict()
+        getResult, move_to_end, popitem = \
+            results.get, results.move_to_end, results.popitem
+
+        def dedupSearch(search_string):
+            key = normalizer(search_string) if normalizer else search_string
+            result = getResult(key)
+            if result is None:
+                result = results[key] = searchFormat(key)
+                if len(results) > maxsize:
+                    popitem(last=False)
+            else:
+                move_to_end(key)
+
+            if result.query != search_string:
+                result = result._replace(query=search_string)
+            return result
+
+        return dedupSearch
+
+    # Search method for every output format
+    _format_searchers = {
+        'S': '_searchCompact',
+        'F': '_searchFull',
+        'J': '_searchJSON',
+        'I': '_searchInterpreted',
+        'P': '_searchProtobuf',
+    }
+
+    def _formatSearcher(self, outputFormat):
+        """
+        Same as the search method of the output format (e.g., _searchCompact()),
+        the call to the OpenTrep library (see _rawSearch()) and the parser of
+        its result being selected once, rather than for every search string
+        """
+        opentrepOutputFormat = "J" if outputFormat == "I" else outputFormat
+        if outputFormat == "S":
+            compactResultParser = self.compactResultParser
+            first_only = self.compact_first_only
+
+            def parse(search_string, rawResult):
+                matches, unmatched = compactResultParser(rawResult, first_only)
+                return _new_tuple(CompactResult, (search_string, matches,
+                                                  unmatched, rawResult))
+        else:
+            parse = getattr(self, self._format_parsers[outputFormat])
+
+        if self.metrics is not None or self.slow_query_log is not None:
+            timedRawSearch = self._timedRawSearch
+
+            def timedSearch(search_string):
+                return parse(search_string, timedRawSearch(
+                    opentrepOutputFormat, search_string))
+            return timedSearch
+
+        checkoutLiveSearcher = self._checkoutLiveSearcher
+        protobuf = opentrepOutputFormat == "P"
+
+        def search(search_string):
+            pool = self._searcher_pool
+            try:
+                trep_lib = pool.checkout()
+            except SearcherPoolClosedError:
+                pool, trep_lib = checkoutLiveSearcher(pool)
+            try:
+                if protobuf:
+                    rawResult = trep_lib.searchToPB(search_string)
+                else:
+                    rawResult = trep_lib.search(opentrepOutputFormat,
+                                                search_string)
+            finally:
+                pool.checkin(trep_lib)
+            return parse(search_string, rawResult)
+
+        return search
+
+    def _searchCompact(self, search_string):
+        return self._parseCompact(search_string,
+                                  self._rawSearch("S", search_string))
+
+    def _searchFull(self, search_string):
+        return self._parseFull(search_string,
+                               self._rawSearch("F", search_string))
+
+    def _searchJSON(self, search_string):
+        return self._parseJSON(search_string,
+                               self._rawSearch("J", search_string))
+
+    def _searchInterpreted(self, search_string):
+        return self._parseInterpreted(search_string,
+                                      self._rawSearch("J", search_string))
+
+    def _searchProtobuf(self, search_string):
+        return self._parseProtobuf(search_string,
+                                   self._rawSearch("P", search_string))
+
+    # Parser of the raw result of the OpenTrep library, for every output
+    # format (also used for the raw results of the persistent cache)
+    _format_parsers = {
+        'S': '_parseCompact',
+        'F': '_parseFull',
+        'J': '_parseJSON',
+        'I': '_parseInterpreted',
+        'P': '_parseProtobuf',
+    }
+
+    def _parseCompact(self, search_string, rawResult):
         # When the compact format is selected, the result string has to be
         # parsed accordingly.
-        if outputFormat == "S":
-            parsedStruct = self.compactResultParser(result)
-            print("Compact format => recognised place (city/airport) codes:")
-            print(parsedStruct)
-            print("------------------")
+        matches, unmatched = self.compactResultParser(rawResult,
+                                                      self.compact_first_only)
+        return CompactResult(search_string, matches, unmatched, rawResult)
 
+    def _parseFull(self, search_string, rawResult):
         # When the full details have been requested, the result string is
         # potentially big and complex, and is not aimed to be
-        # parsed. So, the result string is just displayed/dumped as is.
-        elif outputFormat == "F":
-            print("Raw result from the OpenTrep library:")
-            print(result)
-            print("------------------")
+        # parsed. So, the result string is just given as is.
+        return FullResult(search_string, rawResult)
 
+    def _parseJSON(self, search_string, rawResult):
         # When the raw JSON format has been requested, no handling is necessary.
-        elif outputFormat == "J":
-            print("Raw (JSON) result from the OpenTrep library:")
-            print(result)
-            print("------------------")
-
-        # The interpreted JSON format is an example of how to extract relevant
-        # information from the corresponding Python structure. That code can be
-        # copied/pasted by clients to the OpenTREP library.
-        elif outputFormat == "I":
-            interpretedString = self.interpretFromJSON(result)
-            print("JSON format => recognised place (city/airport) codes:")
-            print(interpretedString)
-            print("------------------")
+        return JSONResult(search_string, rawResult)
 
+    def _parseInterpreted(self, search_string, rawResult):
+        # The 'I' (Interpretation from JSON) output format is just an example
+        # of how to use the output generated by the OpenTrep library. Hence,
+        # that latter does not support that "output format". So, the raw JSON
+        # format is required, and the JSON string will then be parsed and
+        # interpreted by the placesFromJSON() method, just to show how it
+        # works. That code can be copied/pasted by clients to the OpenTREP
+        # library.
+        return InterpretedResult(search_string,
+                                 self.placesFromJSON(rawResult), rawResult)
+
+    def _parseProtobuf(self, search_string, rawResult):
         # The interpreted Protobuf format is an example of how to extract
         # relevant information from the corresponding Python structure.
         # That code can be copied/pasted by clients to the OpenTREP library.
-        elif outputFormat == "P":
-            result = self._trep_lib.searchToPB(search_string)
-            unmatchedKeywords, interpretedString = interpretFromProtobuf(result)
+        matches, unmatched = self.placesFromProtobuf(rawResult)
+        return ProtobufResult(search_string, matches, unmatched, rawResult)
+
+    def display(self, result):
+        """
+        Display a search result on the standard output, in a way depending
+        on its output format
+        """
+        if result.output_format == "S":
+            print("Compact format => recognised place (city/airport) codes:")
+            print((result.matches, result.unmatched))
+
+        elif result.output_format == "F":
+            print("Raw result from the OpenTrep library:")
+            print(result.raw)
+
+        elif result.output_format == "J":
+            print("Raw (JSON) result from the OpenTrep library:")
+            print(result.raw)
+
+        elif result.output_format == "I":
+            print("JSON format => recognised place (city/airport) codes:")
+            print(result.text)
+
+        elif result.output_format == "P":
             print("Protobuf format => recognised place (city/airport) codes:")
-            print(interpretedString)
+            print(result.text)
             print("Unmatched keywords:")
-            print(unmatchedKeywords)
-            print("------------------")
+            print(result.unmatched)
 
-    def compactResultParser(self, resultString):
+        print("------------------")
+
+    def compactResultParser(self, resultString, first_only=True):
         """
         Compact result parser. The result string contains the main matches,
         separated by commas (','), along with their associated weights, given
@@ -502,6 +1588,15 @@ class OpenTrepLib():
         - Dashes ('-') separate potential alternate matches (i.e., matches with lower
         matching percentages).
 
+        When first_only is True, only the first code of every main match
+        is kept (as a CompactMatch). Otherwise, the whole tree of matches is
+        given, as a list of CompactLocation, each one with its extra matches
+        (codes) and its alternate matches (CompactLocation).
+
+        The result string is scanned only once, with str.partition(),
+        which stops at the first separator, rather than splitting every
+        alternate and extra match.
+
         Samples of result string to be parsed:
 
         % python3 pyopentrep.py -f S nice sna francisco vancouver niznayou
@@ -511,11 +1606,17 @@ class OpenTrepLib():
 
         >>> test_1 = 'nce/100,sfo/100-emb/98-jcc/97,yvr/100-cxh/83-xea/83-ydt/83;niznayou'
         >>> compactResultParser(test_1)
-        ([(1.0, 'NCE'), (1.0, 'SFO'), (1.0, 'YVR')], 'niznayou')
+        ([CompactMatch(score=1.0, code='NCE'), CompactMatch(score=1.0, code='SFO'), CompactMatch(score=1.0, code='YVR')], 'niznayou')
+
+        >>> compactResultParser('sfo/100-emb/98', first_only=False)
+        ([CompactLocation(score=1.0, code='SFO', extras=(), alternates=(CompactLocation(score=0.98, code='EMB', extras=(), alternates=()),))], '')
 
         >>> test_2 = 'aur:avf:bae:bou:chr:cmf:cqf:csf:cvf:dij/100'
         >>> compactResultParser(test_2)
-        ([(1.0, 'AUR')], '')
+        ([CompactMatch(score=1.0, code='AUR')], '')
+
+        >>> compactResultParser(test_2, first_only=False)
+        ([CompactLocation(score=1.0, code='AUR', extras=('AVF', 'BAE', 'BOU', 'CHR', 'CMF', 'CQF', 'CSF', 'CVF', 'DIJ'), alternates=())], '')
 
         >>> test_3 = ';eeee'
         >>> compactResultParser(test_3)
@@ -523,33 +1624,34 @@ class OpenTrepLib():
         """
 
         # Strip out the unrecognised keywords
-        if ';' in resultString:
-            str_matches, unrecognized = resultString.split(';', 1)
-        else:
-            str_matches, unrecognized = resultString, ''
+        str_matches, _, unrecognized = resultString.partition(';')
 
         if not str_matches:
             return [], unrecognized
 
-        codes = []
-
-        for alter_loc in str_matches.split(','):
-
-            for extra_loc in alter_loc.split('-'):
-
-                extra_loc, score = extra_loc.split('/', 1)
-
-                for code in extra_loc.split(':'):
-
-                    codes.append((float(score) / 100.0, code.upper()))
-
-                    # We break because we only want to first
-                    break
-
-                # We break because we only want to first
-                break
+        main_matches = str_matches.upper().split(',')
+
+        if first_only:
+            codes = []
+            for main_match in main_matches:
+                # We only want the first code of the first match
+                extra_codes, _, score = \
+                    main_match.partition('-')[0].partition('/')
+                codes.append(_new_tuple(CompactMatch, (
+                    float(score) / 100.0, extra_codes.partition(':')[0])))
+            return codes, unrecognized
+
+        locations = []
+        for main_match in main_matches:
+            if '-' in main_match:
+                main_match, *alternate_matches = main_match.split('-')
+                locations.append(_compactLocation(main_match, tuple([
+                    _compactLocation(alternate_match)
+                    for alternate_match in alternate_matches])))
+            else:
+                locations.append(_compactLocation(main_match))
 
-        return codes, unrecognized
+        return locations, unrecognized
 
     def jsonResultParser(self, resultString):
         '''
@@ -620,25 +1722,21 @@ class OpenTrepLib():
         ORY-LFPO-2988500-23.53%-PAR-48.73-2.36; CDG-LFPG-6269554-64.70%-PAR-49.01-2.55
         '''
 
-        return '; '.join(
-            '-'.join([
-                loc['iata_code'],
-                loc['icao_code'],
-                loc['geonames_id'],
-                '%.2f%%' % float(loc['page_rank']),
-                loc['cities']['city_details']['iata_code'],
-                '%.2f' % float(loc['lat']),
-                '%.2f' % float(loc['lon'])
-            ])
-            for loc in json.loads(resultString)['locations']
-        )
+        # The Geonames ID is rendered as given (it may be empty)
+        return '; '.join([
+            f"{loc['iata_code']}-{loc['icao_code']}-{loc['geonames_id']}-"
+            f"{float(loc['page_rank']):.2f}%-"
+            f"{loc['cities']['city_details']['iata_code']}-"
+            f"{float(loc['lat']):.2f}-{float(loc['lon']):.2f}"
+            for loc in jsonlib.loads(resultString)['locations']
+        ])
 
     def mkdir_p(self, path):
         """
         mkdir -p behavior.
         """
         
-        pathlib.Path(path).mkdir(parents=True, exist_ok=True)
+        os.makedirs(path, exist_ok=True)
         does_path_exist = os.path.isdir(path)
         
         if not does_path_exist:
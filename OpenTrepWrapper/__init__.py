@@ -2,6 +2,50 @@
 # Source: 
 #
 
-from .OpenTrepWrapper import OpenTrepLib
-from .cli import main
+'''
+The public names of the package, e.g., OpenTrepLib, and its sub-modules
+(e.g., OpenTrepWrapper.parallel) are imported on their first use, so that
+importing the package stays fast.
+'''
 
+import importlib
+
+# Public names, and the sub-modules defining them
+_lazy_names = {
+    'OpenTrepLib': 'OpenTrepWrapper',
+    'InitReport': 'OpenTrepWrapper',
+    'CompactMatch': 'results',
+    'CompactLocation': 'results',
+    'PORMatch': 'results',
+    'CompactResult': 'results',
+    'FullResult': 'results',
+    'JSONResult': 'results',
+    'InterpretedResult': 'results',
+    'ProtobufResult': 'results',
+    'main': 'cli',
+}
+
+_submodules = {'OpenTrepWrapper', 'aio', 'cache', 'cli', 'codes', 'columnar',
+               'daemon', 'deployment', 'indexing', 'ingest', 'jsonlib',
+               'metrics', 'normalize', 'parallel', 'persistent', 'pool',
+               'results', 'slowlog', 'utilities'}
+
+__all__ = list(_lazy_names)
+
+
+def __getattr__(name):
+    module_name = _lazy_names.get(name)
+    if module_name is not None:
+        value = getattr(importlib.import_module(f".{module_name}", __name__),
+                        name)
+    elif name in _submodules:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names) | _submodules)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/aio.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+asyncio-native search. The (blocking) calls to the OpenTrep C++ library
+are run by a bounded pool of threads, each one of them taking a searcher
+handle of the OpenTrepLib pool (see OpenTrepLib.init_cpp_extension()),
+so that the event loop is never blocked.
+
+ >>> import asyncio
+ >>> from OpenTrepWrapper.aio import AsyncOpenTrepLib
+
+ >>> async def resolve(queries):
+ ...     async with AsyncOpenTrepLib(max_concurrency=4, timeout=1.0) as aotp:
+ ...         await aotp.init_cpp_extension(
+ ...             xapian_index_path="/tmp/opentrep/xapian_traveldb")
+ ...         res = await aotp.search("nce sfo", output_format="S")
+ ...         print(res.codes)
+ ...         async for res in aotp.search_stream(queries):
+ ...             print(res.codes)
+
+ >>> asyncio.run(resolve(["rio", "yvr"]))
+ ['NCE', 'SFO']
+ ['RIO']
+ ['YVR']
+'''
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .OpenTrepWrapper import OpenTrepLib
+
+
+class AsyncOpenTrepLib():
+    """
+    This class wraps an OpenTrepLib instance for asyncio applications.
+
+    At most max_concurrency searches run at the same time (by default,
+    as many as the searcher handles of the OpenTrepLib pool). When given,
+    timeout is the maximum time (in seconds) of every search, after which
+    asyncio.TimeoutError is raised.
+    """
+
+    def __init__(self, otp=None, max_concurrency=None, timeout=None):
+        self.otp = otp or OpenTrepLib()
+        self.max_concurrency = max_concurrency or self.otp.searcher_pool_size
+        self.timeout = timeout
+        self._executor = None
+        self._semaphore = None
+
+    def __str__(self):
+        return f"Max concurrency: {self.max_concurrency}; {self.otp}"
+
+    def _getExecutor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix="opentrep")
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._executor
+
+    async def init_cpp_extension(self, **kwargs):
+        """
+        Initialize the OpenTrep Python extension, without blocking the
+        event loop. The parameters are the ones of
+        OpenTrepLib.init_cpp_extension(); by default, the pool of searcher
+        handles is sized after max_concurrency
+        """
+        kwargs.setdefault("searcher_pool_size", self.max_concurrency)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._getExecutor(),
+            lambda: self.otp.init_cpp_extension(**kwargs))
+
+    async def finalize(self):
+        """
+        Wait for the running searches and free the OpenTREP library resource
+        """
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, executor.shutdown)
+        self.otp.finalize()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type_, value, traceback):
+        await self.finalize()
+
+    async def search(self, search_string, output_format=None, timeout=None):
+        """
+        Search, without blocking the event loop, and return the typed result
+        (see OpenTrepLib.search())
+        """
+        searchFormat = self.otp.getFormatSearcher(output_format)
+        return await self._search(searchFormat, search_string, timeout)
+
+    async def search_stream(self, search_strings, output_format=None,
+                            timeout=None, max_pending=None):
+        """
+        Batch search
+
+        The search strings are given by an (asynchronous or not) iterable,
+        and the typed results are yielded in the same order. At most
+        max_pending searches (by default, twice max_concurrency) are
+        in flight, and the next search strings are read only when the
+        results are consumed.
+        """
+        searchFormat = self.otp.getFormatSearcher(output_format)
+        if max_pending is None:
+            max_pending = 2 * self.max_concurrency
+
+        pending = deque()
+        try:
+            async for search_string in _aiter(search_strings):
+                pending.append(asyncio.ensure_future(
+                    self._search(searchFormat, search_string, timeout)))
+                if len(pending) >= max_pending:
+                    yield await pending.popleft()
+
+            while pending:
+                yield await pending.popleft()
+
+        finally:
+            # The consumer has stopped early, or a search has failed
+            for task in pending:
+                task.cancel()
+
+    async def _search(self, searchFormat, search_string, timeout):
+        executor = self._getExecutor()
+        if timeout is None:
+            timeout = self.timeout
+
+        # The concurrency slot is released only once the thread is done,
+        # and not when the caller is cancelled or times out, as the call
+        # to the C++ library cannot be interrupted. The searcher handle
+        # is given back to the pool by the thread itself.
+        await self._semaphore.acquire()
+        try:
+            cfuture = executor.submit(searchFormat, search_string)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        loop = asyncio.get_running_loop()
+        cfuture.add_done_callback(
+            lambda _: _callSoon(loop, self._semaphore.release))
+
+        # Cancelling the asyncio future cancels the thread call, if it
+        # has not started yet
+        return await asyncio.wait_for(asyncio.wrap_future(cfuture), timeout)
+
+
+def _callSoon(loop, callback):
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        # The event loop has been closed in the meantime
+        pass
+
+
+async def _aiter(iterable):
+    if hasattr(iterable, "__aiter__"):
+        async for item in iterable:
+            yield item
+    else:
+        for item in iterable:
+            yield item
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/cache.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+In-process cache of the search results, with a bounded size,
+LRU (least recently used) eviction and an optional TTL (time to live).
+
+ >>> from OpenTrepWrapper.cache import QueryCache
+
+ >>> cache = QueryCache(maxsize=2)
+
+ >>> cache.put(('nce', 'S'), 'NCE')
+
+ >>> cache.get(('nce', 'S')), cache.get(('sfo', 'S'))
+ ('NCE', None)
+
+ >>> cache.stats()
+ CacheStats(hits=1, misses=1, evictions=0, size=1, maxsize=2)
+'''
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+
+CacheStats = namedtuple('CacheStats', ['hits', 'misses', 'evictions',
+                                       'size', 'maxsize'])
+
+
+def normalize_query(search_string):
+    """
+    Normalized form of a search string, used as a cache key: lower-cased
+    and with the white spaces collapsed
+    """
+    return ' '.join(search_string.lower().split())
+
+
+class QueryCache():
+    """
+    Bounded LRU cache of the search results, with an optional TTL
+    (in seconds). The cache is bound to a token describing the Xapian
+    index (see bind()), and is emptied whenever that token changes.
+
+    The cache may be shared by several threads.
+    """
+
+    def __init__(self, maxsize=4096, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._token = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bind(self, token):
+        """
+        Bind the cache to the given token (e.g., the Xapian index path
+        and deployment number). When the token differs from the previous
+        one, the cached results are no longer valid and the cache is emptied.
+        Return the token
+        """
+        if token != self._token:
+            with self._lock:
+                self._entries.clear()
+                self._token = token
+        return token
+
+    def get(self, key):
+        """
+        Cached value for the given key, or None when there is none
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expiry, value = entry
+            if expiry is not None and expiry < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, token=None):
+        """
+        Store a value, evicting the least recently used entry when
+        the cache is full. When a token is given, the value is dropped
+        if the cache has been bound to another token in the meantime,
+        i.e., when the value has been computed on a former Xapian index
+        """
+        expiry = None
+        if self.ttl is not None:
+            expiry = time.monotonic() + self.ttl
+
+        with self._lock:
+            if token is not None and token != self._token:
+                return
+            self._entries[key] = (expiry, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Empty the cache. The counters are kept
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Counters, allowing to size the cache
+        """
+        return CacheStats(self.hits, self.misses, self.evictions,
+                          len(self._entries), self.maxsize)
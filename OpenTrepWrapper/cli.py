@@ -1,77 +1,274 @@
 # -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/cli.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
 
 '''
-This module is the OpenTrep binding main script.
+This module is the OpenTrep binding main script (OpenTrep).
+
+The search string is given by the arguments or, when there is none,
+one search string per line of an input file or of the standard input
+(batch mode). The input is read as a stream, the blank lines being
+skipped, and the results are written in the same order, as JSON lines,
+CSV or TSV. With -j, the searches are spread over a pool of worker
+processes (see the parallel module). At the end, a summary of the
+throughput and of the latencies of the searches (timed where they run,
+in the worker processes with -j) is written on the standard error.
+
+ % OpenTrep -i -p /tmp/opentraveldata/optd_por_public_all.csv
+
+ % OpenTrep rio de janero lso angles reykyavki
+
+ % zcat queries.txt.gz | OpenTrep -j 8 -t csv > matches.csv
+ 12000000 search strings in 754.302s (15909 per second);
+ search latency (ms): p50 0.412, p95 0.980, p99 1.873
 '''
 
-import OpenTrepWrapper
+import os
+import sys
+import time
+
+from .utilities import DEFAULT_POR, DEFAULT_IDX, DEFAULT_FMT, DEFAULT_LOG
+
+# Types of output of the batch mode
+OUTPUT_TYPES = ('jsonl', 'csv', 'tsv')
+
+# Columns of the CSV and TSV outputs
+CSV_COLUMNS = ('query', 'codes', 'unmatched')
+
+
+def read_search_strings(stream):
+    """
+    Search strings of a text stream, one per line, the blank lines
+    being skipped. The stream is read lazily
+    """
+    for line in stream:
+        search_string = line.strip()
+        if search_string:
+            yield search_string
+
+
+def output_type_of(filepath):
+    """
+    Type of output corresponding to the extension of a file-path,
+    JSON lines by default
+    """
+    extension = filepath.rpartition('.')[2].lower() if filepath else ''
+    return extension if extension in OUTPUT_TYPES else 'jsonl'
+
+
+def result_codes(result):
+    """
+    Codes of the main matches of a typed result (none for the 'F'
+    output format)
+    """
+    if result.output_format == 'S':
+        return result.codes
+    if result.output_format == 'F':
+        return []
+    return [match.iata_code for match in result.matches]
+
+
+def make_writer(stream, output_type='jsonl'):
+    """
+    Function writing a typed result on the given text stream. The JSON
+    lines are the responses of the search daemon (see daemon.encode_result()),
+    and the CSV and TSV rows have the CSV_COLUMNS, the codes being
+    separated by spaces
+    """
+    if output_type == 'jsonl':
+        import json
+        from .daemon import encode_result
+
+        dumps = json.JSONEncoder(ensure_ascii=False,
+                                 separators=(',', ':')).encode
+        write = stream.write
 
-def main():
+        def writeJSON(result):
+            write(dumps(encode_result(result)) + '\n')
+        return writeJSON
+
+    if output_type not in OUTPUT_TYPES:
+        err_msg = f"[OTP] Error - The given type of output " \
+            f"('{output_type}') is invalid. It should be one of " \
+            f"{OUTPUT_TYPES}."
+        raise ValueError(err_msg)
+
+    import csv
+
+    writer = csv.writer(stream, delimiter=',' if output_type == 'csv' else '\t',
+                        lineterminator='\n')
+    writer.writerow(CSV_COLUMNS)
+    writerow = writer.writerow
+
+    def writeRow(result):
+        writerow((result.query, ' '.join(result_codes(result)),
+                  getattr(result, 'unmatched', '')))
+    return writeRow
+
+
+def run_batch(otp, search_strings, output_format, write, metrics=None):
+    """
+    Search for the given search strings (see OpenTrepLib.search_many()
+    or ParallelOpenTrepLib.search_many()), and write the results in the
+    same order. Every search is timed by metrics (as the 'search' stage),
+    in the worker processes with a ParallelOpenTrepLib, so that the
+    latencies do not depend on the reading of the input, on the writing
+    of the output nor on the number of workers. Return the number of
+    search strings and the elapsed time (in seconds)
+    """
+    clock = time.perf_counter
+    if metrics is not None:
+        otp.enable_metrics(metrics)
+
+    nb_results = 0
+    start = clock()
+    for result in otp.search_many(search_strings, output_format):
+        write(result)
+        nb_results += 1
+
+    return nb_results, clock() - start
+
+
+def summary(nb_results, elapsed, stats=None):
+    """
+    Human-readable summary of a batch: throughput and, from the StageStats
+    of the 'search' stage (see run_batch()), p50/p95/p99 search latencies
+    """
+    text = f"{nb_results} search strings in {elapsed:.3f}s " \
+        f"({nb_results / elapsed if elapsed else 0.0:.0f} per second)"
+    if stats is not None and stats.count:
+        text += "; search latency (ms): " + ", ".join(
+            f"{name} {1e3 * stats.quantile(ratio):.3f}"
+            for name, ratio in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)))
+    return text
+
+
+def main(argv=None):
     '''
     Main function.
     '''
 
     import argparse
 
-    parser = argparse.ArgumentParser(description='Python OpenTrep binding.')
+    from .metrics import Metrics
+    from .OpenTrepWrapper import OpenTrepLib, setup_logging
 
-    parser.epilog = 'Example: python %s rio de janero lso angles reykyavki' % \
-            parser.prog
+    parser = argparse.ArgumentParser(description='Python OpenTrep binding.')
 
-    parser.add_argument('keys',
-        help='Main argument, free text.',
-        nargs='*'
-    )
+    parser.epilog = 'Example: %s rio de janero lso angles reykyavki' % \
+        parser.prog
 
-    parser.add_argument('-f', '--format',
-        help = '''Choose a different format.
-                        Must be either F, S, J, I.
-                        Default is "%s"''' % OpenTrepWrapper.DEFAULT_FMT,
-        default = OpenTrepWrapper.DEFAULT_FMT
-    )
+    parser.add_argument('keys', nargs='*',
+                        help='Search string. By default, one search string '
+                        'per line of the input file (or standard input)')
+    parser.add_argument('-f', '--format', default=DEFAULT_FMT,
+                        help='Output format, among S, F, J, I and P. '
+                        f'Default is "{DEFAULT_FMT}"')
+    parser.add_argument('-p', '--por', default=DEFAULT_POR,
+                        help=f'POR file. Default is "{DEFAULT_POR}"')
+    parser.add_argument('-x', '--xapiandb', default=DEFAULT_IDX,
+                        help=f'Xapian index. Default is "{DEFAULT_IDX}"')
+    parser.add_argument('-d', '--deployment', type=int, default=None,
+                        help='Deployment number. Default is the live one '
+                        '(see the deployment module), or 0')
+    parser.add_argument('-l', '--log', default=DEFAULT_LOG,
+                        help=f'Log file. Default is "{DEFAULT_LOG}"')
+    parser.add_argument('-i', '--index', action='store_true',
+                        help='Index the POR file, then exit')
+    parser.add_argument('--input', default='-',
+                        help='File of search strings, one per line. '
+                        'Default is the standard input')
+    parser.add_argument('-o', '--output', default='-',
+                        help='Output file. Default is the standard output')
+    parser.add_argument('-t', '--output-type', choices=OUTPUT_TYPES,
+                        help='Type of output. Default is given by the '
+                        'extension of the output file, or is jsonl')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes. Default is 1')
+    parser.add_argument('--chunksize', type=int, default=256,
+                        help='Number of search strings given at once to '
+                        'a worker process, with -j. Default is 256')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Do not write the summary')
+    args = parser.parse_args(argv)
 
-    parser.add_argument('-x', '--xapiandb',
-        help = '''Specify the xapian db location.
-                        Default is "%s"''' % OpenTrepWrapper.DEFAULT_DB,
-        default = OpenTrepWrapper.DEFAULT_DB
-    )
+    setup_logging()
 
-    parser.add_argument('-l', '--log',
-        help = '''Specify a log file. 
-                        Default is "%s"''' % OpenTrepWrapper.DEFAULT_LOG,
-        default = OpenTrepWrapper.DEFAULT_LOG
-    )
+    output_type = args.output_type or output_type_of(args.output)
+    if output_type != 'jsonl' and args.format == 'F':
+        parser.error("The F output format may only be written as jsonl")
 
-    parser.add_argument('-q', '--quiet',
-        help = '''Turn off verbose output.''',
-        action='store_true'
-    )
+    if args.index:
+        otp = OpenTrepLib()
+        with otp:
+            otp.init_cpp_extension(por_path=args.por,
+                                   xapian_index_path=args.xapiandb,
+                                   deployment_nb=args.deployment,
+                                   log_path=args.log)
+            start = time.perf_counter()
+            otp.index()
+            if not args.quiet:
+                print(f"{otp.por_filepath} indexed in {otp.xapian_index_filepath} "
+                      f"in {time.perf_counter() - start:.3f}s",
+                      file=sys.stderr)
+        return
 
-    parser.add_argument('-i', '--index',
-        help = '''Index the base then exit.''',
-        action='store_true'
-    )
+    if args.jobs > 1:
+        from .parallel import ParallelOpenTrepLib
+        otp = ParallelOpenTrepLib(workers=args.jobs, chunksize=args.chunksize)
+    else:
+        otp = OpenTrepLib()
+        # The Xapian index is searched, not re-built
+        otp.flag_init_xapian = False
+    otp.init_cpp_extension(por_path=args.por,
+                           xapian_index_path=args.xapiandb,
+                           deployment_nb=args.deployment,
+                           log_path=args.log)
 
-    args = vars(parser.parse_args())
+    input_file = output_file = None
+    try:
+        if args.keys:
+            search_strings = [' '.join(args.keys)]
+        elif args.input == '-':
+            search_strings = read_search_strings(sys.stdin)
+        else:
+            input_file = open(args.input, encoding='utf-8')
+            search_strings = read_search_strings(input_file)
 
-    ot = OpenTrepWrapper()
+        if args.output == '-':
+            output = sys.stdout
+        else:
+            output = output_file = open(args.output, 'w', encoding='utf-8',
+                                        newline='', buffering=2**20)
 
-    if args['index']:
+        metrics = None if args.quiet else Metrics()
+        nb_results, elapsed = run_batch(otp, search_strings, args.format,
+                                        make_writer(output, output_type),
+                                        metrics)
+        output.flush()
 
-        ot.index_trep(xapianDBPath=args['xapiandb'],
-                      logFilePath=args['log'],
-                      verbose=not(args['quiet']))
+    except BrokenPipeError:
+        # The reader of the standard output (e.g., head) has exited: the
+        # rest of the output is discarded, rather than failing at exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
 
-        exit()
+    finally:
+        otp.finalize()
+        if input_file is not None:
+            input_file.close()
+        if output_file is not None:
+            output_file.close()
 
-    ot.main_trep(searchString=' '.join(args['keys']),
-                 outputFormat=args['format'],
-                 xapianDBPath=args['xapiandb'],
-                 logFilePath=args['log'],
-                 verbose=not(args['quiet']))
+    if metrics is not None:
+        stats = metrics.snapshot().stages.get(('search', args.format))
+        print(summary(nb_results, elapsed, stats), file=sys.stderr)
 
 
 if __name__ == '__main__':
 
     main()
-
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/codes.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Look-up table of the exact IATA (3-letter) and ICAO (4-letter) codes
+of the POR file, allowing to answer the search strings made of a single
+code without going through the full-text matching of the Xapian index.
+
+The answer for a given code and output format is the one of the OpenTrep
+library, obtained once (either on the first search, or when the table is
+primed) and then given back for every search of that code.
+
+ >>> from OpenTrepWrapper.codes import CodeIndex, CodeRecord
+
+ >>> code_index = CodeIndex({'NCE': CodeRecord('NCE', ('A', 'C'), (6299418, 2990440))})
+
+ >>> code_index.lookup(' nce ')
+ 'NCE'
+
+ >>> code_index.lookup('nce sfo') is None
+ True
+'''
+
+import threading
+from collections import namedtuple
+
+from . import indexing
+
+# Longest code, i.e., an ICAO code
+_MAX_CODE_LENGTH = 4
+
+
+class CodeRecord(namedtuple('CodeRecord', [
+        'code', 'location_types', 'geonames_ids'])):
+    """
+    POR sharing a code: their location types (e.g., 'A' for airport,
+    'C' for city) and Geonames IDs
+    """
+    __slots__ = ()
+
+
+def read_codes(por_filepath, include_icao=True):
+    """
+    Records of the IATA (and ICAO) codes of the POR file, by code
+    """
+    fields = (b'iata_code', b'icao_code', b'location_type', b'geoname_id')
+    grouped = {}
+    with open(por_filepath, 'rb') as por_file:
+        header = por_file.readline().rstrip(b'\r\n')
+        try:
+            indices = [header.split(indexing.POR_SEPARATOR).index(field)
+                       for field in fields]
+        except ValueError:
+            raise indexing.PORFileError(
+                f"The POR file header should contain the {fields} fields - "
+                f"Header: {header[:200]}")
+        iata_idx, icao_idx, type_idx, geo_idx = indices
+        maxsplit = max(indices) + 1
+
+        for row in por_file:
+            values = row.rstrip(b'\r\n').split(indexing.POR_SEPARATOR,
+                                               maxsplit)
+            if len(values) < maxsplit:
+                continue
+            location = (values[type_idx].decode(),
+                        int(values[geo_idx] or 0))
+            codes = [values[iata_idx]]
+            if include_icao:
+                codes.append(values[icao_idx])
+            for code in codes:
+                if code:
+                    grouped.setdefault(code.decode().upper(), []).append(
+                        location)
+
+    return {code: CodeRecord(code, *map(tuple, zip(*locations)))
+            for code, locations in grouped.items()}
+
+
+class CodeIndex():
+    """
+    Look-up table of the codes of the POR file, with the answers of
+    the OpenTrep library for those codes. The answers are bound to
+    a token describing the Xapian index (see bind()), and are dropped
+    whenever that token changes.
+    """
+
+    def __init__(self, records=None, include_icao=True):
+        self.records = records or {}
+        self.include_icao = include_icao
+        self._answers = {}
+        self._token = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, code):
+        return code in self.records
+
+    @classmethod
+    def from_por_file(cls, por_filepath, include_icao=True):
+        return cls(read_codes(por_filepath, include_icao), include_icao)
+
+    def reload(self, por_filepath):
+        """
+        Read the codes of the (new version of the) POR file, and drop
+        the answers
+        """
+        records = read_codes(por_filepath, self.include_icao)
+        with self._lock:
+            self.records = records
+            self._answers = {}
+
+    def lookup(self, search_string):
+        """
+        Code given by the search string, when it is a single code of
+        the POR file, None otherwise
+        """
+        # Most of the free-text search strings are rejected at once
+        if len(search_string) > _MAX_CODE_LENGTH:
+            search_string = search_string.strip()
+            if len(search_string) > _MAX_CODE_LENGTH:
+                return None
+
+        code = search_string.strip().upper()
+        return code if code in self.records else None
+
+    def bind(self, token):
+        """
+        Bind the answers to the given token (see QueryCache.bind())
+        """
+        if token != self._token:
+            with self._lock:
+                self._answers = {}
+                self._token = token
+        return token
+
+    def answer(self, code, output_format):
+        return self._answers.get((code, output_format))
+
+    def store(self, code, output_format, result, token=None):
+        """
+        Store the answer of the OpenTrep library for the given code. When
+        a token is given, the answer is dropped if the table has been bound
+        to another token in the meantime
+        """
+        with self._lock:
+            if token is None or token == self._token:
+                self._answers[(code, output_format)] = result
+
+    def clear(self):
+        """
+        Drop the answers, the codes being kept
+        """
+        with self._lock:
+            self._answers = {}
+
+    def nb_answers(self):
+        return len(self._answers)
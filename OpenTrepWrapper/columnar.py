@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/columnar.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Columnar output of the batch searches: the main matches are written
+straight into column buffers (one row per main match), rather than into
+Python tuples, and are given back as a NumPy structured array or as an
+Arrow table, or are streamed, by row groups, into a Parquet file.
+
+The columns are:
+ * query_index: index of the search string in the batch, so that the
+   matches may be joined back with the searched table (a search string
+   without any match has no row);
+ * iata_code: code of the recognised place;
+ * score: matching score (as a ratio), for the compact ('S') output format;
+ * lat, lon and page_rank: coordinates and PageRank, for the JSON- and
+   Protobuf-based output formats ('J', 'I' and 'P').
+The columns which are not given by the output format are NaN in the
+NumPy arrays, and null in the Arrow tables.
+
+NumPy and PyArrow are optional dependencies
+(pip install OpenTrepWrapper[columnar]), imported on the first use.
+
+ >>> from OpenTrepWrapper import columnar
+
+ >>> res = columnar.search_columnar(otp, ["nce sfo", "niznayou", "rio"])
+
+ >>> res.to_numpy()
+ array([(0, 'NCE', 1., nan, nan, nan), (0, 'SFO', 1., nan, nan, nan),
+        (2, 'RIO', 1., nan, nan, nan)], dtype=[...])
+
+ >>> columnar.write_parquet(otp, queries, "/tmp/opentrep/matches.parquet",
+ ...                        output_format="I", row_group_size=2**16)
+ 123456
+'''
+
+import array
+import importlib
+
+from .OpenTrepWrapper import OutputFormatError
+
+# Output formats giving the main matches
+COLUMNAR_FORMATS = ('S', 'J', 'I', 'P')
+
+# Names of the columns, and NumPy types
+COLUMNS = (('query_index', '<i8'), ('iata_code', 'U'), ('score', '<f8'),
+           ('lat', '<f8'), ('lon', '<f8'), ('page_rank', '<f8'))
+
+# Number of rows of the row groups of the Parquet files
+DEFAULT_ROW_GROUP_SIZE = 2**16
+
+
+def _import(name):
+    """
+    Import an optional dependency of the columnar output
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        err_msg = f"[OTP] Error - The columnar output requires {name}. " \
+            "It may be installed with: pip install OpenTrepWrapper[columnar]"
+        raise ImportError(err_msg) from None
+
+
+def check_format(output_format):
+    if output_format not in COLUMNAR_FORMATS:
+        err_msg = f"[OTP] Error - The given output format " \
+            f"('{output_format}') has no columnar output. It should be " \
+            f"one of {COLUMNAR_FORMATS}."
+        raise OutputFormatError(err_msg)
+
+
+class ColumnarResults():
+    """
+    Column buffers of the main matches of the results of a given output
+    format. The numbers are stored in array.array buffers, and the codes
+    in the layout of the Arrow strings (UTF-8 bytes and offsets), so that
+    they are converted without copy into Arrow, and with a few vectorized
+    operations into NumPy
+    """
+
+    def __init__(self, output_format='S'):
+        check_format(output_format)
+        self.output_format = output_format
+        self.clear()
+
+    def __str__(self):
+        return f"Columnar results ('{self.output_format}'): " \
+            f"{len(self)} rows"
+
+    def __len__(self):
+        return len(self.query_index)
+
+    def clear(self):
+        self.query_index = array.array('q')
+        self.score = array.array('d')
+        self.lat = array.array('d')
+        self.lon = array.array('d')
+        self.page_rank = array.array('d')
+        self._code_offsets = array.array('i', [0])
+        self._code_data = bytearray()
+
+    @property
+    def iata_codes(self):
+        data, offsets = self._code_data, self._code_offsets
+        return [data[offsets[idx]:offsets[idx + 1]].decode('utf-8')
+                for idx in range(len(self))]
+
+    def append(self, query_index, result):
+        """
+        Append the main matches of a typed result (see OpenTrepLib.search())
+        """
+        if result.output_format != self.output_format:
+            err_msg = f"[OTP] Error - The output format of the result " \
+                f"('{result.output_format}') is not the one of the " \
+                f"columnar results ('{self.output_format}')."
+            raise OutputFormatError(err_msg)
+
+        code_data, code_offsets = self._code_data, self._code_offsets
+        query_indexes = self.query_index
+        if self.output_format == 'S':
+            scores = self.score
+            for match in result.matches:
+                query_indexes.append(query_index)
+                scores.append(match.score)
+                code_data += match.code.encode('utf-8')
+                code_offsets.append(len(code_data))
+            return
+
+        lats, lons, page_ranks = self.lat, self.lon, self.page_rank
+        for match in result.matches:
+            query_indexes.append(query_index)
+            lats.append(match.lat)
+            lons.append(match.lon)
+            page_ranks.append(match.page_rank)
+            code_data += match.iata_code.encode('utf-8')
+            code_offsets.append(len(code_data))
+
+    def extend(self, results, start=0):
+        """
+        Append the main matches of the given typed results, the first one
+        being the one of the start-th search string
+        """
+        append = self.append
+        for query_index, result in enumerate(results, start):
+            append(query_index, result)
+
+    def _hasColumn(self, name):
+        if name == 'score':
+            return self.output_format == 'S'
+        if name in ('lat', 'lon', 'page_rank'):
+            return self.output_format != 'S'
+        return True
+
+    def to_numpy(self):
+        """
+        Matches as a NumPy structured array (see COLUMNS); the codes
+        are Unicode strings of the width of the longest one
+        """
+        np = _import('numpy')
+
+        nb_rows = len(self)
+        offsets = np.frombuffer(self._code_offsets, dtype=np.int32)
+        lengths = np.diff(offsets)
+        width = max(int(lengths.max()), 1) if nb_rows else 1
+
+        # Scatter the bytes of the codes into fixed-width (null-padded) ones
+        data = np.frombuffer(bytes(self._code_data), dtype=np.uint8)
+        padded = np.zeros((nb_rows, width), dtype=np.uint8)
+        rows = np.repeat(np.arange(nb_rows), lengths)
+        padded[rows, np.arange(len(data)) - offsets[:-1][rows]] = data
+        codes = padded.view(f"S{width}").ravel()
+
+        dtype = [(name, f"U{width}" if kind == 'U' else kind)
+                 for name, kind in COLUMNS]
+        matches = np.empty(nb_rows, dtype=dtype)
+        matches['query_index'] = np.frombuffer(self.query_index,
+                                               dtype=np.int64)
+        matches['iata_code'] = np.char.decode(codes, 'utf-8')
+        for name in ('score', 'lat', 'lon', 'page_rank'):
+            if self._hasColumn(name):
+                matches[name] = np.frombuffer(getattr(self, name),
+                                              dtype=np.float64)
+            else:
+                matches[name] = np.nan
+        return matches
+
+    def to_arrow(self):
+        """
+        Matches as an Arrow table (see COLUMNS). The buffers are shared
+        with the table, without copy: while the table is in use, the
+        results may be cleared, but not appended to
+        """
+        pa = _import('pyarrow')
+
+        nb_rows = len(self)
+        columns = {
+            'query_index': pa.Array.from_buffers(
+                pa.int64(), nb_rows, [None, pa.py_buffer(self.query_index)]),
+            'iata_code': pa.Array.from_buffers(
+                pa.string(), nb_rows,
+                [None, pa.py_buffer(self._code_offsets),
+                 pa.py_buffer(self._code_data)]),
+        }
+        for name in ('score', 'lat', 'lon', 'page_rank'):
+            if self._hasColumn(name):
+                columns[name] = pa.Array.from_buffers(
+                    pa.float64(), nb_rows,
+                    [None, pa.py_buffer(getattr(self, name))])
+            else:
+                columns[name] = pa.nulls(nb_rows, pa.float64())
+        return pa.table(columns)
+
+
+def search_columnar(otp, search_strings, output_format='S'):
+    """
+    Batch search (see OpenTrepLib.search_many(), or
+    ParallelOpenTrepLib.search_many()), the main matches being given
+    as ColumnarResults
+    """
+    check_format(output_format)
+    matches = ColumnarResults(output_format)
+    matches.extend(otp.search_many(search_strings, output_format))
+    return matches
+
+
+def write_parquet(otp, search_strings, filepath, output_format='S',
+                  row_group_size=DEFAULT_ROW_GROUP_SIZE, compression='zstd'):
+    """
+    Batch search, the main matches being streamed into a Parquet file,
+    by row groups of (about) row_group_size rows, so that only a row group
+    is held in memory at a time. Return the number of rows
+    """
+    check_format(output_format)
+    pq = _import('pyarrow.parquet')
+
+    matches = ColumnarResults(output_format)
+    nb_rows = 0
+    writer = None
+    try:
+        results = otp.search_many(search_strings, output_format)
+        for query_index, result in enumerate(results):
+            matches.append(query_index, result)
+            if len(matches) >= row_group_size:
+                table = matches.to_arrow()
+                if writer is None:
+                    writer = pq.ParquetWriter(filepath, table.schema,
+                                              compression=compression)
+                writer.write_table(table)
+                nb_rows += len(matches)
+                matches.clear()
+
+        # Last (or single) row group, even empty, so that the file
+        # has a schema
+        if len(matches) or writer is None:
+            table = matches.to_arrow()
+            if writer is None:
+                writer = pq.ParquetWriter(filepath, table.schema,
+                                          compression=compression)
+            writer.write_table(table)
+            nb_rows += len(matches)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return nb_rows
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/daemon.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Long-running search daemon, keeping an initialized OpenTrepLib resident
+and serving the searches over a Unix domain socket (or a localhost TCP
+socket), so that the searches of short-lived processes (e.g., shell
+pipelines) do not pay for the initialization of the OpenTrep library.
+
+The protocol is line-based. Every request is a line made of a search
+string, optionally prefixed by an output format and a tab
+(e.g., "J\\tnce sfo"). Every response is a line made of a JSON object
+(see encode_result()), or of {"error": ...} when the search failed.
+The responses are given in the order of the requests, so that a client
+may send many requests before reading the responses (pipelining).
+Every client connection is served by its own thread.
+
+ % OpenTrep-daemon -x /tmp/opentrep/xapian_traveldb --warm-start &
+
+ % printf 'nce sfo\\nJ\\trio\\n' | OpenTrep-client
+ {"query":"nce sfo","format":"S","codes":["NCE","SFO"],...}
+ {"query":"rio","format":"J","raw":"{ \\"locations\\":[..."}
+
+ >>> from OpenTrepWrapper.daemon import DaemonClient
+
+ >>> with DaemonClient() as client:
+ ...     client.search("nce sfo")["codes"]
+ ['NCE', 'SFO']
+'''
+
+import os
+import sys
+import json
+import queue
+import base64
+import socket
+import logging
+import threading
+import socketserver
+
+from . import jsonlib
+from .utilities import DEFAULT_POR, DEFAULT_IDX, DEFAULT_FMT, DEFAULT_LOG
+
+DEFAULT_ADDRESS = '/tmp/opentrep/opentrepwrapper.sock'
+
+logger = logging.getLogger(__name__)
+
+
+class DaemonError(Exception):
+    """
+    Error of the search daemon, or error answered by the search daemon
+    """
+    pass
+
+
+def parse_address(address):
+    """
+    Socket family and address of the daemon: a (host, port) tuple or
+    a "host:port" string for TCP, a file-path for a Unix domain socket
+    """
+    if isinstance(address, tuple):
+        return socket.AF_INET, address
+
+    host, sep, port = address.rpartition(':')
+    if sep and '/' not in address and port.isdigit():
+        return socket.AF_INET, (host or 'localhost', int(port))
+
+    return socket.AF_UNIX, address
+
+
+def encode_result(result):
+    """
+    JSON-serializable form of a typed result (see the results module):
+    the search string, the output format and the raw result of the OpenTrep
+    library (base64-encoded for the 'P' output format), along with
+    the main codes ('S') or the main matches ('I' and 'P')
+    """
+    response = {'query': result.query, 'format': result.output_format}
+
+    if result.output_format == 'S':
+        response['codes'] = result.codes
+        response['unmatched'] = result.unmatched
+    elif result.output_format in ('I', 'P'):
+        response['matches'] = [match._asdict() for match in result.matches]
+
+    raw = result.raw
+    if isinstance(raw, bytes):
+        raw = base64.b64encode(raw).decode('ascii')
+    response['raw'] = raw
+    return response
+
+
+def _dumps(response):
+    return json.dumps(response, ensure_ascii=False,
+                      separators=(',', ':')).encode() + b'\n'
+
+
+class _SearchHandler(socketserver.StreamRequestHandler):
+    """
+    Connection of a client: the requests are answered one after
+    the other, as they are read
+    """
+
+    def setup(self):
+        super().setup()
+        if self.server.address_family == socket.AF_INET:
+            # The (small) responses must not wait for the acknowledgement
+            # of the former ones
+            self.connection.setsockopt(socket.IPPROTO_TCP,
+                                       socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        answer = self.server.search_daemon.answer
+        try:
+            for request in self.rfile:
+                self.wfile.write(answer(request))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client has closed the connection without reading all
+            # the responses (see DaemonClient.search_many_raw())
+            pass
+
+
+class _UnixSearchServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPSearchServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SearchDaemon():
+    """
+    This class serves the searches of an (initialized) OpenTrepLib
+    instance over a socket (see the module documentation for
+    the protocol). The socket is bound as soon as the daemon is created;
+    the searches are served by serve_forever(), until shutdown() is called.
+
+    With a Unix domain socket, the socket file left by a daemon which
+    is no longer running is replaced, and the socket file is removed
+    by close().
+    """
+
+    def __init__(self, otp, address=DEFAULT_ADDRESS, output_format=None):
+        self.otp = otp
+        self.output_format = output_format or otp.output_format
+        self.family, address = parse_address(address)
+
+        if self.family == socket.AF_UNIX:
+            self._removeStaleSocket(address)
+            self._server = _UnixSearchServer(address, _SearchHandler)
+        else:
+            self._server = _TCPSearchServer(address, _SearchHandler)
+        self._server.search_daemon = self
+
+    def __str__(self):
+        return f"Search daemon: {self.address}; {self.otp}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @staticmethod
+    def _removeStaleSocket(filepath):
+        dirpath = os.path.dirname(filepath)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        if not os.path.exists(filepath):
+            return
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(filepath)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(filepath)
+            return
+        finally:
+            probe.close()
+
+        err_msg = f"[OTP] Error - A search daemon is already listening " \
+            f"on {filepath}"
+        raise DaemonError(err_msg)
+
+    def answer(self, request):
+        """
+        Response line (in bytes) to the given request line (in bytes)
+        """
+        search_string = request.decode('utf-8', 'replace').rstrip('\r\n')
+        output_format = self.output_format
+        if search_string[1:2] == '\t':
+            output_format, search_string = search_string[0], search_string[2:]
+
+        try:
+            searchFormat = self.otp.getFormatSearcher(output_format)
+            return _dumps(encode_result(searchFormat(search_string)))
+
+        except Exception as error:
+            # The daemon keeps serving the other requests
+            logger.warning("The search of '%s' failed - %s",
+                           search_string, error)
+            return _dumps({'query': search_string, 'format': output_format,
+                           'error': str(error)})
+
+    def serve_forever(self, poll_interval=0.5):
+        self._server.serve_forever(poll_interval)
+
+    def serve_in_background(self):
+        """
+        Serve the searches in a (daemon) thread, which is returned
+        """
+        thread = threading.Thread(target=self.serve_forever,
+                                  name="opentrep-daemon", daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        """
+        Stop serve_forever(), from another thread
+        """
+        self._server.shutdown()
+
+    def close(self):
+        """
+        Close the socket. The OpenTrepLib instance is not finalized
+        """
+        self._server.server_close()
+        if self.family == socket.AF_UNIX:
+            try:
+                os.remove(self.address)
+            except FileNotFoundError:
+                pass
+
+
+class DaemonClient():
+    """
+    This class is a client of the search daemon. The responses are
+    decoded JSON objects (see encode_result()).
+
+    search_many() pipelines the requests: they are sent by a separate
+    thread, at most window requests ahead of the responses.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=None):
+        family, address = parse_address(address)
+        self._sock = socket.socket(family, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        if family == socket.AF_INET:
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self._sock.connect(address)
+        except OSError as error:
+            self._sock.close()
+            err_msg = f"[OTP] Error - No search daemon is listening " \
+                f"on {address} - {error}"
+            raise DaemonError(err_msg)
+        self._rfile = self._sock.makefile('rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
+
+    @staticmethod
+    def _request(search_string, output_format):
+        request = search_string.replace('\n', ' ')
+        if output_format:
+            request = f"{output_format}\t{request}"
+        return f"{request}\n".encode()
+
+    def _readResponse(self):
+        response = self._rfile.readline()
+        if not response:
+            raise DaemonError("[OTP] Error - The search daemon has closed "
+                              "the connection")
+        return response
+
+    def search(self, search_string, output_format=None):
+        """
+        Search. DaemonError is raised when the search failed
+        """
+        self._sock.sendall(self._request(search_string, output_format))
+        response = jsonlib.loads(self._readResponse())
+        if 'error' in response:
+            raise DaemonError(response['error'])
+        return response
+
+    def search_many(self, search_strings, output_format=None, window=1024):
+        """
+        Batch search, pipelined. Return a generator of the responses,
+        in the same order as the search strings (the failed searches
+        being answered by {"error": ...})
+        """
+        for response in self.search_many_raw(search_strings, output_format,
+                                             window):
+            yield jsonlib.loads(response)
+
+    def search_many_raw(self, search_strings, output_format=None,
+                        window=1024):
+        """
+        Same as search_many(), the responses being given as JSON lines
+        (in bytes), without being decoded.
+
+        When the responses are not all read (e.g., the generator is closed
+        early, or a response could not be read), the connection is shut
+        down, as responses would still be in flight, so that the sending
+        thread does not stay blocked. The client may then no longer be used
+        """
+        sent = queue.Queue(window)
+        stopped = threading.Event()
+        errors = []
+
+        def put(item):
+            # Gives up when the responses are no longer read
+            while not stopped.is_set():
+                try:
+                    sent.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def send():
+            try:
+                for search_string in search_strings:
+                    request = self._request(search_string, output_format)
+                    if not put(True):
+                        return
+                    self._sock.sendall(request)
+            except Exception as error:
+                if not stopped.is_set():
+                    errors.append(error)
+            finally:
+                put(None)
+
+        sender = threading.Thread(target=send, name="opentrep-client",
+                                  daemon=True)
+        sender.start()
+        completed = False
+        try:
+            for _ in iter(sent.get, None):
+                yield self._readResponse()
+            completed = True
+        finally:
+            if not completed:
+                stopped.set()
+                try:
+                    self._sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        sender.join()
+
+        if errors:
+            raise errors[0]
+
+
+def main():
+    """
+    Start the search daemon
+    """
+    import argparse
+
+    from .OpenTrepWrapper import OpenTrepLib, setup_logging
+
+    parser = argparse.ArgumentParser(
+        description='OpenTrep search daemon, serving the searches '
+        'over a Unix domain socket or a localhost TCP socket.')
+    parser.add_argument('-a', '--address', default=DEFAULT_ADDRESS,
+                        help='Unix domain socket file-path, or host:port '
+                        f'for TCP. Default is "{DEFAULT_ADDRESS}"')
+    parser.add_argument('-p', '--por', default=DEFAULT_POR,
+                        help=f'POR file. Default is "{DEFAULT_POR}"')
+    parser.add_argument('-x', '--xapiandb', default=DEFAULT_IDX,
+                        help=f'Xapian index. Default is "{DEFAULT_IDX}"')
+    parser.add_argument('-d', '--deployment', type=int, default=None,
+                        help='Deployment number. Default is the live one '
+                        '(see the deployment module), or 0')
+    parser.add_argument('-f', '--format', default=DEFAULT_FMT,
+                        help='Default output format, among S, F, J, I and P. '
+                        f'Default is "{DEFAULT_FMT}"')
+    parser.add_argument('-l', '--log', default=DEFAULT_LOG,
+                        help=f'Log file. Default is "{DEFAULT_LOG}"')
+    parser.add_argument('-j', '--searchers', type=int, default=4,
+                        help='Number of searcher handles, i.e., of searches '
+                        'which may run at the same time. Default is 4')
+    parser.add_argument('-w', '--warm-start', action='store_true',
+                        help='Do not re-initialize the Xapian index when '
+                        'it is up to date')
+    parser.add_argument('-c', '--cache', type=int, default=4096,
+                        help='Size of the result cache (0 to disable it). '
+                        'Default is 4096')
+    args = parser.parse_args()
+
+    setup_logging()
+
+    otp = OpenTrepLib()
+    report = otp.init_cpp_extension(por_path=args.por,
+                                    xapian_index_path=args.xapiandb,
+                                    deployment_nb=args.deployment,
+                                    log_path=args.log,
+                                    searcher_pool_size=args.searchers,
+                                    warm_start=args.warm_start)
+    if args.cache:
+        otp.enable_cache(maxsize=args.cache)
+
+    with otp, SearchDaemon(otp, args.address, args.format) as search_daemon:
+        print(f"Serving on {search_daemon.address} (initialized in "
+              f"{report.duration:.3f}s)", file=sys.stderr)
+        try:
+            search_daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def client_main():
+    """
+    Search through the search daemon. The search strings are the arguments
+    or, when there is none, the lines of the standard input. The responses
+    are written as JSON lines on the standard output
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Client of the OpenTrep search daemon.')
+    parser.add_argument('keys', nargs='*',
+                        help='Search string. By default, one search '
+                        'string per line of the standard input')
+    parser.add_argument('-a', '--address', default=DEFAULT_ADDRESS,
+                        help='Unix domain socket file-path, or host:port '
+                        f'for TCP. Default is "{DEFAULT_ADDRESS}"')
+    parser.add_argument('-f', '--format', default=None,
+                        help='Output format, among S, F, J, I and P. '
+                        'Default is the one of the daemon')
+    args = parser.parse_args()
+
+    if args.keys:
+        search_strings = [' '.join(args.keys)]
+    else:
+        search_strings = (line.rstrip('\r\n') for line in sys.stdin)
+
+    try:
+        with DaemonClient(args.address) as client:
+            out = sys.stdout.buffer
+            for response in client.search_many_raw(search_strings,
+                                                   args.format):
+                out.write(response)
+            out.flush()
+    except DaemonError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
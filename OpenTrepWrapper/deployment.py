@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/deployment.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Blue/green deployments of the Xapian index, allowing to re-index without
+interrupting the searches.
+
+The OpenTrep library stores the Xapian index of every deployment in its
+own directory, i.e., {xapian_index_path}{deployment_nb}. While the live
+deployment keeps serving the searches, the index of the inactive one is
+built in the background, warmed up, and the live searches are then
+switched to it. The former deployment is kept open, so that the switch
+may be rolled back.
+
+ >>> from OpenTrepWrapper import OpenTrepLib
+ >>> from OpenTrepWrapper.deployment import BlueGreenDeployer
+
+ >>> otp = OpenTrepLib()
+
+ >>> otp.init_cpp_extension(xapian_index_path="/tmp/opentrep/xapian_traveldb",
+ ...                        deployment_nb=0)
+
+ >>> deployer = BlueGreenDeployer(otp)
+
+ >>> future = deployer.deploy()
+
+ >>> future.result().deployment_nb, otp.deployment_nb
+ (1, 1)
+
+ >>> deployer.rollback()
+ 0
+
+ >>> deployer.close()
+
+ >>> otp.finalize()
+'''
+
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .OpenTrepWrapper import OpenTrepLib, OPTInitError
+from .indexing import active_filepath, read_active_deployment
+
+logger = logging.getLogger("OpenTrepWrapper")
+
+# Search strings used to warm up the Xapian index of a new deployment,
+# i.e., to load its most used pages in memory
+DEFAULT_WARM_QUERIES = ('nce sfo', 'paris', 'london', 'new york',
+                        'los angeles', 'rio de janeiro', 'frankfurt',
+                        'tokyo', 'beijing', 'sydney')
+
+DeploymentReport = namedtuple('DeploymentReport', [
+    'deployment_nb', 'nb_indexed', 'build_duration', 'warm_duration',
+    'switched'])
+
+
+class DeploymentError(Exception):
+    """
+    Raised when a deployment cannot be built, switched to or rolled back
+    """
+    pass
+
+
+def _index_deployment(settings, deployment_nb):
+    """
+    Build the Xapian index of the given deployment, with the settings
+    (attributes) of the parent OpenTrepLib instance. It is run by
+    a dedicated process, so that the indexation does not compete
+    with the searches of the parent process (e.g., for the GIL)
+    """
+    otp = OpenTrepLib()
+    for name, value in settings.items():
+        setattr(otp, name, value)
+    otp.flag_init_xapian = True
+    otp.init_cpp_extension(por_path=otp.por_filepath,
+                           deployment_nb=deployment_nb)
+    try:
+        return otp.index().nb_indexed
+    finally:
+        otp.finalize()
+
+
+class BlueGreenDeployer():
+    """
+    This class manages the blue/green deployments of an (initialized)
+    OpenTrepLib instance, alternating between the given deployment slots.
+
+    With isolate=True (the default), the Xapian index is built by a
+    separate process, so that the searches of the current process keep
+    running at full speed. Otherwise, it is built by a background thread
+    of the current process.
+    """
+
+    def __init__(self, otp, slots=(0, 1), warm_queries=DEFAULT_WARM_QUERIES,
+                 isolate=True, mp_context=None):
+        if len(set(slots)) < 2:
+            raise DeploymentError(f"At least two deployment slots are "
+                                  f"needed - Given slots: {slots}")
+        self.otp = otp
+        self.slots = tuple(slots)
+        self.warm_queries = warm_queries
+        self.isolate = isolate
+        self.mp_context = mp_context
+        self._executor = None
+        self._building = None
+        # Deployments, as (deployment_nb, trep_lib, searcher_pool) tuples,
+        # built but not live yet, and formerly live
+        self._staged = None
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"Slots: {self.slots}; live deployment: " \
+            f"{self.otp.deployment_nb}; {self.otp}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def inactive_slot(self):
+        """
+        Deployment slot following the live one
+        """
+        live = self.otp.deployment_nb
+        if live not in self.slots:
+            return self.slots[0]
+        return self.slots[(self.slots.index(live) + 1) % len(self.slots)]
+
+    def deploy(self, background=True, switch=True):
+        """
+        Build the Xapian index of the inactive deployment slot, warm it up
+        and, with switch=True, make it live (see build()).
+
+        With background=True, return at once a concurrent.futures.Future
+        of the DeploymentReport; otherwise, return the DeploymentReport
+        """
+        if not background:
+            return self.build(switch)
+
+        with self._lock:
+            if self._building is not None and not self._building.done():
+                raise DeploymentError("A deployment is already being built")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="opentrep-deploy")
+            self._building = self._executor.submit(self.build, switch)
+            return self._building
+
+    def build(self, switch=True):
+        """
+        Build and warm up the inactive deployment. When switch is False,
+        the deployment is only staged, and switch() makes it live later on
+        """
+        otp = self.otp
+        if otp._searcher_pool is None:
+            log_pfx = otp.get_log_pfx()
+            err_msg = f"{log_pfx} Error - The OpenTrep Python extension has " \
+                f"not been initialized properly - OpenTrepLib: {otp}"
+            raise OPTInitError(err_msg)
+
+        slot = self.inactive_slot()
+
+        # The deployments still open on that slot (staged, or kept for
+        # a rollback) are about to be overwritten
+        self.discard()
+
+        start = time.monotonic()
+        if self.isolate:
+            nb_indexed = self._indexInProcess(slot)
+            # That handle only reads the Xapian index: a later otp.index()
+            # re-builds it with another handle (see OpenTrepLib.index())
+            trep_lib = otp._newSearcher(False, slot)
+        else:
+            trep_lib = otp._newSearcher(True, slot)
+            nb_indexed = trep_lib.index()
+        build_duration = time.monotonic() - start
+
+        start = time.monotonic()
+        try:
+            for search_string in self.warm_queries:
+                trep_lib.search('S', search_string)
+        except BaseException:
+            otp._releaseSearcher(trep_lib)
+            raise
+        warm_duration = time.monotonic() - start
+
+        with self._lock:
+            self._staged = (slot, trep_lib,
+                            otp._newSearcherPool(trep_lib, slot))
+
+        if otp.log_level >= 4:
+            logger.info("Deployment %s built in %.2fs (%s POR indexed) and "
+                        "warmed up in %.2fs", slot, build_duration,
+                        nb_indexed, warm_duration)
+
+        if switch:
+            self.switch()
+
+        return DeploymentReport(slot, nb_indexed, build_duration,
+                                warm_duration, switch)
+
+    def _indexInProcess(self, deployment_nb):
+        otp = self.otp
+        # Same settings as the ones of otp.index() (but the deployment)
+        settings = otp._indexSettings()
+        del settings['deployment_nb']
+        settings.update(por_filepath=otp.por_filepath,
+                        log_filepath=otp.log_filepath,
+                        log_level=otp.log_level,
+                        ingest_workers=otp.ingest_workers)
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=self.mp_context) as executor:
+            return executor.submit(_index_deployment, settings,
+                                   deployment_nb).result()
+
+    def switch(self):
+        """
+        Make the staged deployment live, keeping the former one open for
+        a rollback. Return the live deployment number
+        """
+        with self._lock:
+            if self._staged is None:
+                raise DeploymentError("No deployment has been built yet")
+            staged, self._staged = self._staged, None
+            previous = self.otp._switchDeployment(*staged)
+            dropped, self._previous = self._previous, previous
+
+        self._release(dropped)
+        self._recordLive()
+        if self.otp.log_level >= 4:
+            logger.info("Switched from deployment %s to deployment %s",
+                        previous[0], staged[0])
+        return staged[0]
+
+    def rollback(self):
+        """
+        Make the formerly live deployment live again. The rolled back
+        deployment is staged, so that switch() may make it live again.
+        Return the live deployment number
+        """
+        with self._lock:
+            if self._previous is None:
+                raise DeploymentError("No former deployment to roll back to")
+            previous, self._previous = self._previous, None
+            rolled_back = self.otp._switchDeployment(*previous)
+            self._staged = rolled_back
+
+        self._recordLive()
+        if self.otp.log_level >= 4:
+            logger.info("Rolled back from deployment %s to deployment %s",
+                        rolled_back[0], previous[0])
+        return previous[0]
+
+    def discard(self):
+        """
+        Release the searcher handles of the staged deployment and of the
+        one kept for a rollback, if any
+        """
+        with self._lock:
+            dropped = [self._staged, self._previous]
+            self._staged = self._previous = None
+
+        for deployment in dropped:
+            self._release(deployment)
+
+    def close(self):
+        """
+        Wait for the deployment being built, if any, and release
+        the searcher handles but the live ones
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.discard()
+
+    def _release(self, deployment):
+        # The searches still in flight on that deployment give their
+        # handle back to the closed pool, which then releases it
+        if deployment is not None:
+            _, _, searcher_pool = deployment
+            searcher_pool.close(release=self.otp._releaseSearcher)
+
+    def _recordLive(self):
+        otp = self.otp
+        filepath = active_filepath(otp.xapian_index_filepath)
+        tmp_filepath = f"{filepath}.tmp"
+        with open(tmp_filepath, 'w') as active_file:
+            active_file.write(f"{otp.deployment_nb}\n")
+        os.replace(tmp_filepath, filepath)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/indexing.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Manifest of the POR (points of reference) indexed in the Xapian database,
+allowing to know which POR have been added, updated or deleted by a new
+version of the OPTD POR file (optd_por_public_all.csv).
+
+The manifest maps the key of every POR, i.e., its IATA code, location type,
+Geonames ID and envelope ID, to a hash of its row in the POR file.
+
+ >>> from OpenTrepWrapper.indexing import diff_manifests
+
+ >>> diff_manifests({'NCE-CA-6299418-': 'a1', 'SFO-CA-5391989-': 'b2'},
+ ...                {'NCE-CA-6299418-': 'a1', 'SFO-CA-5391989-': 'c3',
+ ...                 'CDG-A-6269554-': 'd4'})
+ IndexDelta(added=['CDG-A-6269554-'], updated=['SFO-CA-5391989-'], deleted=[])
+'''
+
+import os
+import json
+import hashlib
+from collections import namedtuple
+
+
+# Fields of the POR file making the key of a POR
+POR_KEY_FIELDS = ('iata_code', 'location_type', 'geoname_id', 'envelope_id')
+
+# Field separator of the OPTD POR files
+POR_SEPARATOR = b'^'
+
+# Prefix of the first line of the manifest, giving the settings the Xapian
+# index has been built with (see save_manifest())
+_SETTINGS_PFX = '#settings\t'
+
+IndexDelta = namedtuple('IndexDelta', ['added', 'updated', 'deleted'])
+
+IndexReport = namedtuple('IndexReport', ['nb_indexed', 'delta', 'duration',
+                                         'ingest'], defaults=[None])
+
+
+class PORFileError(Exception):
+    """
+    Raised when the POR file has not the expected header
+    """
+    pass
+
+
+def manifest_filepath(xapian_index_filepath, deployment_nb):
+    """
+    File-path of the manifest, next to the Xapian database of the given
+    deployment
+    """
+    return f"{xapian_index_filepath}{deployment_nb}.manifest.tsv"
+
+
+def state_filepath(xapian_index_filepath, deployment_nb):
+    """
+    File-path of the state of the Xapian database of the given deployment,
+    i.e., the POR file and the settings it has been built with
+    """
+    return f"{xapian_index_filepath}{deployment_nb}.state.json"
+
+
+def active_filepath(xapian_index_filepath):
+    """
+    File-path of the file recording the live deployment, next to
+    the Xapian databases (see the deployment module)
+    """
+    return f"{xapian_index_filepath}.active"
+
+
+def read_active_deployment(xapian_index_filepath, default=0):
+    """
+    Live deployment number, as recorded by the last switch, allowing
+    the other processes (or a restarted one) to search on it
+    """
+    try:
+        with open(active_filepath(xapian_index_filepath)) as active_file:
+            return int(active_file.read().strip())
+    except (OSError, ValueError):
+        return default
+
+
+def file_digest(filepath, chunksize=2**20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as por_file:
+        for chunk in iter(lambda: por_file.read(chunksize), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def index_state(por_filepath, settings):
+    """
+    State of a Xapian database built from the given POR file, with
+    the given settings (a dictionary of JSON-serializable values)
+    """
+    stat = os.stat(por_filepath)
+    return {'por_filepath': por_filepath, 'por_size': stat.st_size,
+            'por_mtime_ns': stat.st_mtime_ns,
+            'por_digest': file_digest(por_filepath), 'settings': settings}
+
+
+def load_index_state(filepath):
+    """
+    State saved by save_index_state(), or None when there is none
+    """
+    try:
+        with open(filepath, encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_index_state(state, filepath):
+    """
+    Save the state, atomically replacing the former one
+    """
+    tmp_filepath = f"{filepath}.tmp"
+    with open(tmp_filepath, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(tmp_filepath, filepath)
+
+
+def index_state_matches(state, por_filepath, settings):
+    """
+    Whether the Xapian database with the given state has been built
+    from the given POR file, unchanged since then, and with the given
+    settings. The POR file is hashed only when its size or modification
+    time have changed
+    """
+    if not state or state.get('settings') != settings \
+       or state.get('por_filepath') != por_filepath:
+        return False
+
+    try:
+        stat = os.stat(por_filepath)
+    except OSError:
+        return False
+
+    if stat.st_size != state.get('por_size'):
+        return False
+    if stat.st_mtime_ns == state.get('por_mtime_ns'):
+        return True
+    return file_digest(por_filepath) == state.get('por_digest')
+
+
+def por_key_indices(header):
+    """
+    Positions, in the header of the POR file, of the fields making
+    the key of a POR
+    """
+    fields = header.rstrip(b'\r\n').split(POR_SEPARATOR)
+    try:
+        return [fields.index(field.encode()) for field in POR_KEY_FIELDS]
+    except ValueError:
+        raise PORFileError(f"The POR file header should contain the "
+                           f"{POR_KEY_FIELDS} fields - Header: {header[:200]}")
+
+
+def por_key(row, key_indices):
+    """
+    Key of the POR described by the given row (bytes) of the POR file
+    """
+    fields = row.split(POR_SEPARATOR)
+    return '-'.join([fields[idx].decode() for idx in key_indices])
+
+
+def row_hash(row):
+    return hashlib.blake2b(row, digest_size=8).hexdigest()
+
+
+def compute_manifest(por_filepath, progress=None, progress_every=100000):
+    """
+    Manifest of the given POR file, read as a stream. The malformed rows,
+    i.e., the ones too short to have all the fields of the key, are skipped.
+    When given, progress(nb_rows) is called every progress_every rows
+    """
+    manifest = {}
+    with open(por_filepath, 'rb') as por_file:
+        key_indices = por_key_indices(por_file.readline())
+
+        for nb_rows, row in enumerate(por_file, 1):
+            row = row.rstrip(b'\r\n')
+            if row:
+                try:
+                    manifest[por_key(row, key_indices)] = row_hash(row)
+                except IndexError:
+                    pass
+            if progress and nb_rows % progress_every == 0:
+                progress(nb_rows)
+
+    return manifest
+
+
+def load_manifest(filepath, settings=None):
+    """
+    Manifest saved by save_manifest(), or an empty one when there is none.
+    When settings are given, and the manifest has been saved with other
+    settings (or without any), an empty manifest is given as well, so that
+    all the POR are seen as added, i.e., the Xapian index is fully re-built
+    """
+    manifest = {}
+    if not os.path.isfile(filepath):
+        return manifest
+
+    with open(filepath, encoding='utf-8') as manifest_file:
+        first_line = manifest_file.readline()
+        saved_settings = None
+        if first_line.startswith(_SETTINGS_PFX):
+            saved_settings = json.loads(first_line[len(_SETTINGS_PFX):])
+        elif first_line:
+            key, _, digest = first_line.rstrip('\n').partition('\t')
+            manifest[key] = digest
+
+        if settings is not None and saved_settings != settings:
+            return {}
+
+        for line in manifest_file:
+            key, _, digest = line.rstrip('\n').partition('\t')
+            manifest[key] = digest
+
+    return manifest
+
+
+def save_manifest(manifest, filepath, settings=None):
+    """
+    Save the manifest, atomically replacing the former one, along with
+    the settings the Xapian index has been built with
+    """
+    tmp_filepath = f"{filepath}.tmp"
+    with open(tmp_filepath, 'w', encoding='utf-8') as manifest_file:
+        if settings is not None:
+            manifest_file.write(
+                f"{_SETTINGS_PFX}{json.dumps(settings, sort_keys=True)}\n")
+        manifest_file.writelines(f"{key}\t{digest}\n"
+                                 for key, digest in manifest.items())
+    os.replace(tmp_filepath, filepath)
+
+
+def diff_manifests(old_manifest, new_manifest):
+    """
+    POR added, updated and deleted from the old to the new manifest
+    """
+    added, updated = [], []
+    for key, digest in new_manifest.items():
+        old_digest = old_manifest.get(key)
+        if old_digest is None:
+            added.append(key)
+        elif old_digest != digest:
+            updated.append(key)
+
+    deleted = [key for key in old_manifest if key not in new_manifest]
+    return IndexDelta(added, updated, deleted)
+
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/ingest.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Parallel ingestion of the OPTD POR file (optd_por_public_all.csv), before
+its indexation by the OpenTrep library.
+
+The POR file is memory-mapped and split into chunks of whole rows, which
+are parsed by a pool of worker processes. The rows which are not to be
+indexed (e.g., the POR without IATA code) are filtered out, and every row
+is hashed for the manifest of the POR (see the indexing module). The kept
+rows are written, in their original order, into a prepared POR file, which
+is then given to the indexer of the OpenTrep library.
+
+ >>> from OpenTrepWrapper.ingest import ingest_por_file
+
+ >>> manifest, report = ingest_por_file(
+ ...     "/tmp/opentraveldata/optd_por_public_all.csv",
+ ...     "/tmp/opentrep/xapian_traveldb0.por.csv", workers=4)
+
+ >>> report.nb_rows, report.nb_kept
+ (135457, 21768)
+'''
+
+import os
+import sys
+import mmap
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from . import indexing
+
+# Size (in bytes) of the chunks of the POR file given to the workers
+DEFAULT_CHUNKSIZE = 4 * 1024 * 1024
+
+
+class IngestReport(namedtuple('IngestReport', [
+        'nb_rows', 'nb_kept', 'duration', 'peak_memory',
+        'peak_memory_workers', 'nb_malformed'], defaults=[0])):
+    """
+    Statistics of an ingestion of the POR file. The peak memories are
+    the maximum resident set sizes (in bytes) of the current process and
+    of the worker processes, over their whole lifetime (None when the
+    platform does not report them). The malformed rows, i.e., the ones
+    too short to have all the fields of the key of a POR, are skipped
+    """
+    __slots__ = ()
+
+    @property
+    def rows_per_sec(self):
+        return self.nb_rows / self.duration if self.duration else 0.0
+
+
+def prepared_filepath(xapian_index_filepath, deployment_nb):
+    """
+    File-path of the prepared POR file, next to the Xapian database
+    of the given deployment
+    """
+    return f"{xapian_index_filepath}{deployment_nb}.por.csv"
+
+
+def peak_memory():
+    """
+    Peak resident set sizes (in bytes) of the current process and of its
+    terminated child processes
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+
+    # Kilo-bytes on Linux, bytes on MacOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+
+def chunk_bounds(buffer, begin, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Split buffer[begin:] into chunks of about chunksize bytes, ending
+    at the end of a row
+
+    >>> list(chunk_bounds(b"a^1\\nb^2\\nc^3\\n", 0, 5))
+    [(0, 8), (8, 12)]
+    """
+    end = len(buffer)
+    while begin < end:
+        target = begin + chunksize
+        if target >= end:
+            yield begin, end
+            return
+
+        newline = buffer.find(b'\n', target - 1)
+        stop = end if newline < 0 else newline + 1
+        yield begin, stop
+        begin = stop
+
+
+def _ingest_chunk(por_filepath, begin, end, key_indices, keep_non_iata):
+    """
+    Filter and hash the rows of the given chunk of the POR file.
+    Return the kept rows, the manifest of the chunk, its number of rows
+    and its number of malformed (skipped) rows
+    """
+    with open(por_filepath, 'rb') as por_file, \
+            mmap.mmap(por_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        rows = buffer[begin:end].split(b'\n')
+
+    iata_idx = key_indices[0]
+    maxsplit = max(key_indices) + 1
+    separator = indexing.POR_SEPARATOR
+    row_hash = indexing.row_hash
+
+    kept = []
+    manifest = {}
+    nb_rows = nb_malformed = 0
+    for row in rows:
+        row = row.rstrip(b'\r')
+        if not row:
+            continue
+        nb_rows += 1
+
+        # Only the leading fields, up to the ones of the key, are split
+        fields = row.split(separator, maxsplit)
+        if len(fields) < maxsplit:
+            # Skipped, as by indexing.compute_manifest()
+            nb_malformed += 1
+            continue
+        key = '-'.join([fields[idx].decode() for idx in key_indices])
+        manifest[key] = row_hash(row)
+
+        if keep_non_iata or fields[iata_idx]:
+            kept.append(row)
+
+    kept.append(b'')
+    return (b'\n'.join(kept) if len(kept) > 1 else b'', manifest, nb_rows,
+            nb_malformed)
+
+
+def ingest_por_file(por_filepath, output_filepath, keep_non_iata=False,
+                    workers=None, chunksize=DEFAULT_CHUNKSIZE,
+                    mp_context=None, progress=None):
+    """
+    Write the rows of the POR file to be indexed (by default, the ones
+    with an IATA code) into output_filepath, the chunks of the POR file
+    being processed by a pool of (by default, as many as CPU) workers.
+
+    When given, progress(nb_rows) is called after every chunk. Return
+    the manifest of the POR file and an IngestReport
+    """
+    start = time.monotonic()
+    workers = workers or os.cpu_count() or 1
+
+    with open(por_filepath, 'rb') as por_file:
+        header = por_file.readline()
+        key_indices = indexing.por_key_indices(header)
+        with mmap.mmap(por_file.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buffer:
+            bounds = list(chunk_bounds(buffer, len(header), chunksize))
+
+    manifest = {}
+    nb_rows = nb_kept = nb_malformed = 0
+    tmp_filepath = f"{output_filepath}.tmp"
+    with open(tmp_filepath, 'wb') as output_file:
+        output_file.write(header)
+
+        for rows, chunk_manifest, nb_chunk_rows, nb_chunk_malformed \
+                in _ingestChunks(por_filepath, bounds, key_indices,
+                                 keep_non_iata, workers, mp_context):
+            output_file.write(rows)
+            manifest.update(chunk_manifest)
+            nb_rows += nb_chunk_rows
+            nb_kept += rows.count(b'\n')
+            nb_malformed += nb_chunk_malformed
+            if progress:
+                progress(nb_rows)
+
+    os.replace(tmp_filepath, output_filepath)
+
+    duration = time.monotonic() - start
+    return manifest, IngestReport(nb_rows, nb_kept, duration, *peak_memory(),
+                                  nb_malformed)
+
+
+def _ingestChunks(por_filepath, bounds, key_indices, keep_non_iata,
+                  workers, mp_context):
+    """
+    Results of _ingest_chunk() for all the chunks, in order. At most twice
+    as many chunks as workers are in flight, so that the memory stays
+    bounded whatever the size of the POR file
+    """
+    if workers == 1 or len(bounds) <= 1:
+        # Not worth starting worker processes
+        for begin, end in bounds:
+            yield _ingest_chunk(por_filepath, begin, end, key_indices,
+                                keep_non_iata)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=mp_context) as executor:
+        pending = deque()
+        try:
+            for begin, end in bounds:
+                pending.append(executor.submit(
+                    _ingest_chunk, por_filepath, begin, end, key_indices,
+                    keep_non_iata))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+        finally:
+            for future in pending:
+                future.cancel()
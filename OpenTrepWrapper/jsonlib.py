@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/jsonlib.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+JSON decoder used to parse the JSON results of the OpenTrep library.
+The fastest decoder installed among orjson, ujson and simdjson
+(pysimdjson) is used, the standard json module being the fall-back.
+The decoder is selected (and imported) on the first use.
+
+ >>> from OpenTrepWrapper import jsonlib
+
+ >>> jsonlib.get_json_backend() in jsonlib.JSON_BACKENDS
+ True
+
+ >>> jsonlib.set_json_backend('json')
+ 'json'
+
+ >>> jsonlib.loads('{"locations": []}')
+ {'locations': []}
+'''
+
+import importlib
+
+# Supported decoders, from the fastest to the slowest
+JSON_BACKENDS = ('orjson', 'ujson', 'simdjson', 'json')
+
+_backend = None
+
+
+def loads(text):
+    """
+    Select the fastest JSON decoder and decode the given string with it.
+    That function is replaced by the decoder itself on the first call
+    """
+    set_json_backend()
+    return loads(text)
+
+
+def available_json_backends():
+    """
+    Names of the JSON decoders which are installed
+    """
+    names = []
+    for name in JSON_BACKENDS:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def set_json_backend(name=None):
+    """
+    Select the JSON decoder. By default, the fastest one which is installed.
+    Return the name of the selected decoder
+    """
+    global _backend, loads
+
+    names = [name] if name else JSON_BACKENDS
+    for backend in names:
+        if backend not in JSON_BACKENDS:
+            raise ValueError(f"The given JSON backend ('{backend}') is "
+                             f"invalid. It should be one of {JSON_BACKENDS}.")
+        try:
+            module = importlib.import_module(backend)
+        except ImportError:
+            if name:
+                raise
+            continue
+
+        _backend, loads = backend, module.loads
+        return _backend
+
+
+def get_json_backend():
+    """
+    Name of the selected JSON decoder
+    """
+    if _backend is None:
+        set_json_backend()
+    return _backend
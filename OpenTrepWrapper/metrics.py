@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/metrics.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Timing instrumentation of OpenTrepLib (see OpenTrepLib.enable_metrics()):
+latency histograms and error counters, by stage and output format.
+
+The stages are:
+ * search: whole search of a search string, cache look-ups included;
+ * dispatch: checks and selection of the search method of the output format;
+ * library: call to the OpenTrep C++ library, labelled with the output
+   format of the library ('J' for the 'I' output format);
+ * parse: parsing of the result given by the OpenTrep library;
+ * cache: search answered by a cache or by the code look-up table,
+   without any call to the OpenTrep library;
+ * display: display of the result on the standard output;
+ * index, ingest, diff and build: whole indexation, POR file ingestion,
+   comparison with the manifest and build of the Xapian index by the
+   OpenTrep library;
+ * init and open: whole initialization, and initialization of the searcher
+   handle by the OpenTrep library.
+
+The metrics may be read as a snapshot, exported in the Prometheus text
+format, or forwarded to callbacks, called on every observation.
+
+ >>> from OpenTrepWrapper.metrics import Metrics
+
+ >>> metrics = Metrics(buckets=(0.001, 0.01))
+
+ >>> metrics.observe('search', 'S', 0.002)
+
+ >>> metrics.snapshot().stages[('search', 'S')]
+ StageStats(count=1, total=0.002, buckets=((0.001, 0), (0.01, 1), (inf, 1)))
+
+ >>> print(metrics.prometheus_text())
+ # HELP opentrep_stage_duration_seconds Duration of the stages of OpenTrepLib
+ # TYPE opentrep_stage_duration_seconds histogram
+ opentrep_stage_duration_seconds_bucket{stage="search",format="S",le="0.001"} 0
+ ...
+'''
+
+import bisect
+import threading
+from collections import namedtuple
+
+# Upper bounds (in seconds) of the buckets of the latency histograms
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3,
+                   5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 300.0)
+
+
+class StageStats(namedtuple('StageStats', ['count', 'total', 'buckets'])):
+    """
+    Latencies of a stage: number of observations, total duration
+    (in seconds) and cumulative histogram, as (upper bound, count) tuples,
+    the last upper bound being infinite
+    """
+    __slots__ = ()
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, ratio):
+        """
+        Estimation of the given quantile (e.g., 0.95), by linear
+        interpolation within its bucket of the histogram
+        """
+        if not self.count:
+            return 0.0
+        rank = ratio * self.count
+        lower_bound, lower_count = 0.0, 0
+        for upper_bound, count in self.buckets:
+            if count >= rank:
+                if upper_bound == float('inf'):
+                    return lower_bound
+                if count == lower_count:
+                    return upper_bound
+                return lower_bound + (upper_bound - lower_bound) \
+                    * (rank - lower_count) / (count - lower_count)
+            lower_bound, lower_count = upper_bound, count
+        return lower_bound
+
+
+MetricsSnapshot = namedtuple('MetricsSnapshot', ['stages', 'errors'])
+
+
+class Metrics():
+    """
+    Latency histograms and error counters, by (stage, output format).
+    The output format is '' for the indexation and initialization stages.
+
+    The metrics may be shared by several threads, and by several
+    OpenTrepLib instances.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms = {}
+        self._errors = {}
+        self._callbacks = ()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"Metrics: {len(self._histograms)} stages"
+
+    def observe(self, stage, output_format, duration):
+        """
+        Record the duration (in seconds) of a stage
+        """
+        key = (stage, output_format)
+        idx = bisect.bisect_left(self.buckets, duration)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Counts by bucket (the last one being unbounded),
+                # and total duration
+                histogram = self._histograms[key] = \
+                    [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][idx] += 1
+            histogram[1] += duration
+
+        for callback in self._callbacks:
+            callback(stage, output_format, duration)
+
+    def count_error(self, stage, output_format):
+        """
+        Count a failure of a stage
+        """
+        key = (stage, output_format)
+        with self._lock:
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def add_callback(self, callback):
+        """
+        Call callback(stage, output_format, duration) on every observation,
+        in the thread of the observation
+        """
+        with self._lock:
+            self._callbacks += (callback,)
+
+    def remove_callback(self, callback):
+        with self._lock:
+            self._callbacks = tuple(known for known in self._callbacks
+                                    if known is not callback)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._errors = {}
+
+    def snapshot(self):
+        """
+        Copy of the metrics, as a MetricsSnapshot: the StageStats
+        and the number of errors, by (stage, output format)
+        """
+        with self._lock:
+            histograms = [(key, list(counts), total) for key, (counts, total)
+                          in self._histograms.items()]
+            errors = dict(self._errors)
+
+        bounds = self.buckets + (float('inf'),)
+        stages = {}
+        for key, counts, total in sorted(histograms):
+            cumulative, buckets = 0, []
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            stages[key] = StageStats(cumulative, total, tuple(buckets))
+        return MetricsSnapshot(stages, errors)
+
+    def prometheus_text(self, prefix='opentrep'):
+        """
+        Metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        name = f"{prefix}_stage_duration_seconds"
+        lines = [f"# HELP {name} Duration of the stages of OpenTrepLib",
+                 f"# TYPE {name} histogram"]
+        for (stage, output_format), stats in snapshot.stages.items():
+            labels = f'stage="{stage}",format="{output_format}"'
+            for bound, count in stats.buckets:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {stats.total!r}")
+            lines.append(f"{name}_count{{{labels}}} {stats.count}")
+
+        name = f"{prefix}_errors_total"
+        lines += [f"# HELP {name} Failures of the stages of OpenTrepLib",
+                  f"# TYPE {name} counter"]
+        for (stage, output_format), count in sorted(snapshot.errors.items()):
+            lines.append(f'{name}{{stage="{stage}",format="{output_format}"}} '
+                         f'{count}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/normalize.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Normalization of the search strings, before they are given to the OpenTrep
+library, so that the search strings differing only by their case, accents,
+white spaces or punctuation are searched (and cached) once.
+
+ >>> from OpenTrepWrapper.normalize import fold_query
+
+ >>> [fold_query(search_string) for search_string in ("Nice  ", "NICE", "nice,")]
+ ['nice', 'nice', 'nice']
+
+ >>> fold_query("Côte d'Azur / São-Paulo")
+ 'cote d azur sao paulo'
+'''
+
+import string
+import unicodedata
+
+# Every ASCII punctuation or symbol character (string.punctuation, i.e., the
+# ASCII characters of the P and S Unicode categories) is replaced by a white
+# space, as the non-ASCII ones are (see fold_query())
+_ASCII_PUNCTUATION = str.maketrans(string.punctuation,
+                                   ' ' * len(string.punctuation))
+
+
+def fold_query(search_string):
+    """
+    Unicode (NFKD) folding, without the combining marks (e.g., accents),
+    lower-casing, punctuation and symbol stripping (Unicode categories
+    P and S, whether the search string is ASCII or not) and white space
+    collapsing
+    """
+    if search_string.isascii():
+        # Most of the search strings, for which there is nothing to fold
+        folded = search_string.translate(_ASCII_PUNCTUATION)
+
+    else:
+        decomposed = unicodedata.normalize('NFKD', search_string)
+        folded = ''.join([
+            ' ' if unicodedata.category(char)[0] in 'PS' else char
+            for char in decomposed if not unicodedata.combining(char)])
+
+    return ' '.join(folded.lower().split())
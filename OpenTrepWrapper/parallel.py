@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/parallel.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Parallel search, with a pool of worker processes, each one of them
+holding its own OpenTrep searcher on the shared (read-only) Xapian index.
+
+ >>> import OpenTrepWrapper.parallel
+
+ >>> potp = OpenTrepWrapper.parallel.ParallelOpenTrepLib(workers=4)
+
+ >>> potp.init_cpp_extension(xapian_index_path="/tmp/opentrep/xapian_traveldb")
+
+ >>> for res in potp.search_many(["nce sfo", "rio"], output_format="S"):
+ ...     print(res.codes)
+ ['NCE', 'SFO']
+ ['RIO']
+
+ >>> potp.finalize()
+'''
+
+import os
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .OpenTrepWrapper import OpenTrepLib, OPTInitError, OutputFormatError
+
+# OpenTrepLib instance of the worker process
+_worker_lib = None
+
+
+def _init_worker(settings):
+    """
+    Initialize the OpenTrep Python extension, once per worker process.
+    The Xapian index is only read, it is not re-initialized
+    """
+    global _worker_lib
+    otp = OpenTrepLib()
+    otp.flag_init_xapian = False
+    otp.init_cpp_extension(**settings)
+    _worker_lib = otp
+
+
+def _search_chunk(output_format, search_strings, timed=False):
+    """
+    Search a chunk of search strings. When timed, the durations of the
+    searches (the 'search' stage of the metrics of the worker) are given
+    back as well
+    """
+    if not timed:
+        return list(_worker_lib.search_many(search_strings,
+                                            output_format)), None
+
+    durations = []
+
+    def observe(stage, output_format, duration):
+        if stage == 'search':
+            durations.append(duration)
+
+    metrics = _worker_lib.metrics or _worker_lib.enable_metrics()
+    metrics.add_callback(observe)
+    try:
+        results = list(_worker_lib.search_many(search_strings, output_format))
+    finally:
+        metrics.remove_callback(observe)
+    return results, durations
+
+
+def _chunked(iterable, chunksize):
+    """
+    Split an iterable into lists of (at most) chunksize items
+
+    >>> list(_chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ParallelOpenTrepLib():
+    """
+    This class spreads the searches over a pool of worker processes.
+    Every worker initializes the OpenTrep Python extension once, against
+    the same Xapian index, which must have been built beforehand
+    (see OpenTrepLib.index()).
+    """
+
+    def __init__(self, workers=None, chunksize=256, mp_context=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.mp_context = mp_context
+        self.metrics = None
+        self._settings = None
+        self._executor = None
+
+        # Settings of the searchers (output formats, etc)
+        self._otp = OpenTrepLib()
+
+    def __str__(self):
+        return f"{self.workers} worker(s); {self._otp}"
+
+    def init_cpp_extension(self, por_path=None, xapian_index_path=None,
+                           sql_db_type=None, sql_db_conn_str=None,
+                           deployment_nb=None,
+                           log_path=None, log_level=None):
+        """
+        Start the pool of worker processes. The parameters are the ones
+        of OpenTrepLib.init_cpp_extension(), and are given to every worker
+        """
+        self._settings = dict(por_path=por_path,
+                              xapian_index_path=xapian_index_path,
+                              sql_db_type=sql_db_type,
+                              sql_db_conn_str=sql_db_conn_str,
+                              deployment_nb=deployment_nb,
+                              log_path=log_path, log_level=log_level)
+
+        self.finalize()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=self.mp_context,
+                                             initializer=_init_worker,
+                                             initargs=(self._settings,))
+
+    def enable_metrics(self, metrics=None):
+        """
+        Time the searches, in the worker processes, the durations being
+        observed (as the 'search' stage) by the given Metrics instance
+        (by default, a new one) of the current process. Return the Metrics
+        instance
+        """
+        from .metrics import Metrics
+
+        if metrics is None:
+            metrics = Metrics()
+        self.metrics = metrics
+        return metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+
+    def finalize(self):
+        """
+        Stop the worker processes
+        """
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.finalize()
+
+    def search(self, search_string, output_format=None):
+        """
+        Search, in one of the worker processes
+        """
+        return next(iter(self.search_many([search_string], output_format)))
+
+    def search_many(self, search_strings, output_format=None,
+                    chunksize=None):
+        """
+        Batch search
+
+        The search strings are split into chunks, which are searched for
+        by the worker processes. The typed results (see OpenTrepLib.search())
+        are yielded in the same order as the search strings. At most two
+        chunks per worker are in flight at any time, so that the search
+        strings are consumed lazily.
+        """
+
+        # Check that the pool of workers has been started
+        if not self._executor:
+            log_pfx = self._otp.get_log_pfx()
+            err_msg = f"{log_pfx} Error - The pool of worker processes has " \
+                f"not been started - ParallelOpenTrepLib: {self}"
+            raise OPTInitError(err_msg)
+
+        if not output_format:
+            output_format = self._otp.output_format
+
+        if output_format not in self._otp.output_available_formats:
+            log_pfx = self._otp.get_log_pfx()
+            err_msg = f"{log_pfx} Error - The given output format " \
+                f"('{output_format}') is invalid. It should be one of " \
+                f"{self._otp.output_available_formats}."
+            raise OutputFormatError(err_msg)
+
+        chunks = _chunked(search_strings, chunksize or self.chunksize)
+        return self._searchChunks(chunks, output_format)
+
+    def _searchChunks(self, chunks, output_format):
+        metrics = self.metrics
+        pending = deque()
+        max_pending = 2 * self.workers
+
+        def chunkResults(future):
+            results, durations = future.result()
+            if durations:
+                for duration in durations:
+                    metrics.observe('search', output_format, duration)
+            return results
+
+        try:
+            for chunk in chunks:
+                pending.append(self._executor.submit(
+                    _search_chunk, output_format, chunk, metrics is not None))
+                if len(pending) >= max_pending:
+                    yield from chunkResults(pending.popleft())
+
+            while pending:
+                yield from chunkResults(pending.popleft())
+
+        finally:
+            # The chunks not started yet, when the caller has abandoned
+            # the results (or a chunk failed), are not searched
+            for future in pending:
+                future.cancel()
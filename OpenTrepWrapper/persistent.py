@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/persistent.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Persistent cache of the search results, shared by all the processes
+searching the same Xapian index, and surviving their restarts.
+
+The raw responses of the OpenTrep library (strings, or bytes for the
+Protobuf output format) are stored, and parsed again when they are read
+back, so that the content of the database is never executed (as with
+pickle), whoever may write it. They are stored in an SQLite database
+(in WAL mode, so that the readers are not blocked by the writers), keyed
+on the normalized search string, the output format and a fingerprint of
+the Xapian index (see index_fingerprint()). The results computed on
+another Xapian index are therefore never given back, and are purged once
+the index has been re-built. When the results take more than max_bytes,
+the oldest ones are evicted.
+
+ >>> from OpenTrepWrapper.persistent import PersistentCache
+
+ >>> cache = PersistentCache("/tmp/opentrep/xapian_traveldb.cache.sqlite")
+
+ >>> token = cache.bind("3f1c0e5d")
+
+ >>> cache.put(('nce', 'S'), 'nce/100', token)
+
+ >>> cache.get(('nce', 'S'))
+ 'nce/100'
+'''
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import namedtuple
+
+
+PersistentCacheStats = namedtuple('PersistentCacheStats', [
+    'hits', 'misses', 'evictions', 'size', 'nb_bytes', 'max_bytes'])
+
+# The results table of the former versions held pickled results
+_SCHEMA = """
+DROP TABLE IF EXISTS results;
+CREATE TABLE IF NOT EXISTS responses (
+    fingerprint TEXT NOT NULL,
+    query TEXT NOT NULL,
+    format TEXT NOT NULL,
+    value BLOB NOT NULL,
+    nb_bytes INTEGER NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (fingerprint, query, format));
+CREATE INDEX IF NOT EXISTS responses_created ON responses (created);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    fingerprint TEXT PRIMARY KEY,
+    bound REAL NOT NULL);
+"""
+
+
+def cache_filepath(xapian_index_filepath):
+    """
+    File-path of the persistent cache, next to the Xapian databases
+    """
+    return f"{xapian_index_filepath}.cache.sqlite"
+
+
+def stamp_filepath(xapian_index_filepath, deployment_nb):
+    """
+    File-path of the stamp of the Xapian database of the given deployment
+    """
+    return f"{xapian_index_filepath}{deployment_nb}.stamp"
+
+
+def write_stamp(xapian_index_filepath, deployment_nb):
+    """
+    Stamp the Xapian database of the given deployment as (re-)built
+    """
+    filepath = stamp_filepath(xapian_index_filepath, deployment_nb)
+    tmp_filepath = f"{filepath}.tmp"
+    with open(tmp_filepath, 'w') as stamp_file:
+        stamp_file.write(f"{os.urandom(16).hex()}\n")
+    os.replace(tmp_filepath, filepath)
+
+
+def stamp_signature(xapian_index_filepath, deployment_nb):
+    """
+    Cheap signature of the stamp of the Xapian database of the given
+    deployment, changing whenever the stamp is written again (by any
+    process), or None when there is no stamp
+    """
+    try:
+        stat = os.stat(stamp_filepath(xapian_index_filepath, deployment_nb))
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def index_fingerprint(xapian_index_filepath, deployment_nb):
+    """
+    Fingerprint of the Xapian database of the given deployment, changing
+    whenever it is re-built: by OpenTrepLib.index(), which stamps it,
+    or by any other tool, which changes the size or modification time
+    of its files
+    """
+    xapian_db_path = f"{xapian_index_filepath}{deployment_nb}"
+    digest = hashlib.blake2b(xapian_db_path.encode(), digest_size=16)
+
+    try:
+        with open(stamp_filepath(xapian_index_filepath,
+                                 deployment_nb), 'rb') as stamp_file:
+            digest.update(stamp_file.read())
+    except FileNotFoundError:
+        pass
+
+    try:
+        entries = sorted(os.scandir(xapian_db_path),
+                         key=lambda entry: entry.name)
+    except (FileNotFoundError, NotADirectoryError):
+        entries = []
+    for entry in entries:
+        if entry.is_file():
+            stat = entry.stat()
+            digest.update(f"{entry.name}:{stat.st_size}:"
+                          f"{stat.st_mtime_ns};".encode())
+
+    return digest.hexdigest()
+
+
+class PersistentCache():
+    """
+    SQLite-based cache of the raw responses of the OpenTrep library
+    (str or bytes), which may be shared by several threads and processes.
+    Every thread has its own connection to the database.
+
+    The results of the keep_fingerprints Xapian indexes bound last are
+    kept (e.g., both deployments of a blue/green deployment, see the
+    deployment module); the other ones are purged. The size of the cache
+    is checked every evict_every stored results.
+    """
+
+    def __init__(self, filepath, max_bytes=256 * 2**20, keep_fingerprints=2,
+                 evict_every=256, timeout=30.0):
+        self.filepath = filepath
+        self.max_bytes = max_bytes
+        self.keep_fingerprints = keep_fingerprints
+        self.evict_every = evict_every
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._token = None
+        self._nb_puts = 0
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+        # Create the database, if needed
+        self._connect()
+
+    def __str__(self):
+        return f"Persistent cache: {self.filepath}"
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.filepath, timeout=self.timeout,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def bind(self, token):
+        """
+        Bind the cache to the given fingerprint of the Xapian index. When
+        that fingerprint has not been bound so far, the results of the
+        former Xapian indexes are purged. Return the fingerprint
+        """
+        if token == self._token:
+            return token
+
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?)",
+                (token, time.time()))
+            connection.execute(
+                "DELETE FROM fingerprints WHERE fingerprint NOT IN ("
+                "SELECT fingerprint FROM fingerprints "
+                "ORDER BY bound DESC LIMIT ?)", (self.keep_fingerprints,))
+            connection.execute(
+                "DELETE FROM responses WHERE fingerprint NOT IN ("
+                "SELECT fingerprint FROM fingerprints)")
+
+        self._token = token
+        return token
+
+    def get(self, key):
+        """
+        Cached response for the given (search string, output format) key,
+        computed on the Xapian index bound last, or None when there is none
+        """
+        query, output_format = key
+        row = self._connect().execute(
+            "SELECT value FROM responses "
+            "WHERE fingerprint = ? AND query = ? AND format = ?",
+            (self._token, query, output_format)).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, value, token=None):
+        """
+        Store a response (str or bytes) computed on the Xapian index with
+        the given fingerprint (by default, the one bound last)
+        """
+        query, output_format = key
+        if not isinstance(value, (str, bytes)):
+            raise TypeError(f"[OTP] Error - Only the raw responses (str or "
+                            f"bytes) may be cached, not {type(value)}")
+        self._connect().execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (token or self._token, query, output_format, value, len(value),
+             time.time()))
+
+        self._nb_puts += 1
+        if self._nb_puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Evict the oldest results, when the cache is larger than max_bytes,
+        down to 90% of max_bytes
+        """
+        connection = self._connect()
+        nb_entries, nb_bytes = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(nb_bytes), 0) "
+            "FROM responses").fetchone()
+        if nb_bytes <= self.max_bytes:
+            return 0
+
+        # Number of results to evict, assuming that they have
+        # (about) the same size
+        target = 0.9 * self.max_bytes
+        nb_evicted = max(1, int(nb_entries * (1.0 - target / nb_bytes)) + 1)
+        connection.execute(
+            "DELETE FROM responses WHERE rowid IN ("
+            "SELECT rowid FROM responses ORDER BY created LIMIT ?)",
+            (nb_evicted,))
+        self.evictions += nb_evicted
+        return nb_evicted
+
+    def clear(self):
+        """
+        Empty the cache, for all the processes. The counters are kept
+        """
+        self._connect().execute("DELETE FROM responses")
+
+    def stats(self):
+        """
+        Counters of the current process, and size of the cache
+        """
+        nb_entries, nb_bytes = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(nb_bytes), 0) "
+            "FROM responses").fetchone()
+        return PersistentCacheStats(self.hits, self.misses, self.evictions,
+                                    nb_entries, nb_bytes, self.max_bytes)
+
+    def close(self):
+        """
+        Close the connections of all the threads
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
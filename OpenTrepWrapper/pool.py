@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/pool.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Pool of OpenTrep searcher handles, allowing several threads to search
+at the same time. Every handle is used by a single thread at a time.
+
+ >>> from OpenTrepWrapper.pool import SearcherPool
+
+ >>> pool = SearcherPool(factory=list, max_size=2)
+
+ >>> with pool.searcher() as trep_lib:
+ ...     pool.stats()
+ PoolStats(size=1, idle=0, max_size=2)
+'''
+
+import time
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+PoolStats = namedtuple('PoolStats', ['size', 'idle', 'max_size'])
+
+
+class SearcherPoolTimeoutError(Exception):
+    """
+    Raised when no searcher handle could be checked out in time
+    """
+    pass
+
+
+class SearcherPoolClosedError(Exception):
+    """
+    Raised when a searcher handle is checked out of a closed pool
+    """
+    pass
+
+
+class SearcherPool():
+    """
+    Pool of (at most max_size) searcher handles. The handles are created
+    lazily, by calling factory(), when no idle handle is available.
+    The most recently checked in handle is reused first, so that
+    the number of handles stays as low as the concurrency allows.
+    """
+
+    def __init__(self, factory, max_size=1, timeout=None):
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._size = 0
+        self._exclusive = False
+        self._keep = None
+        self._nb_waiting = 0
+        self._closed = False
+        self._release = None
+        self._cond = threading.Condition(threading.Lock())
+
+    def add(self, searcher):
+        """
+        Add an already created handle to the pool
+        """
+        with self._cond:
+            self._size += 1
+            self._idle.append(searcher)
+            # exclusive() waits on the same condition as checkout(),
+            # so all the waiters are woken up
+            self._cond.notify_all()
+
+    def checkout(self, timeout=None):
+        """
+        Take a handle out of the pool, creating it if needed. When max_size
+        handles are already in use, wait for one of them to be checked in.
+        Raise SearcherPoolClosedError once the pool has been closed
+        """
+        if timeout is None:
+            timeout = self.timeout
+        # The waiters may be woken up for a handle taken by another thread,
+        # so that the timeout is checked against a deadline
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            while self._closed or self._exclusive or not self._idle:
+                if self._closed:
+                    raise SearcherPoolClosedError(
+                        f"The pool of searcher handles is closed - "
+                        f"{self.stats()}")
+
+                if not self._exclusive and self._size < self.max_size:
+                    # Reserve a slot, the handle being created outside
+                    # of the lock
+                    self._size += 1
+                    break
+
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise SearcherPoolTimeoutError(
+                            f"No searcher handle available after {timeout}s "
+                            f"- {self.stats()}")
+
+                self._nb_waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._nb_waiting -= 1
+            else:
+                return self._idle.pop()
+
+        try:
+            return self.factory()
+
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify_all()
+            raise
+
+    def checkin(self, searcher):
+        """
+        Give a handle, taken with checkout(), back to the pool. Once the pool
+        has been closed, the handle is released instead
+        """
+        with self._cond:
+            if not self._closed:
+                self._idle.append(searcher)
+                if self._nb_waiting:
+                    self._cond.notify_all()
+                return
+            self._size -= 1
+
+        if self._release:
+            self._release(searcher)
+
+    @contextmanager
+    def searcher(self, timeout=None):
+        """
+        Context manager checking a handle out, and back in
+        """
+        searcher = self.checkout(timeout)
+        try:
+            yield searcher
+        finally:
+            self.checkin(searcher)
+
+    @contextmanager
+    def exclusive(self, keep=None, release=None):
+        """
+        Context manager waiting for all the handles to be checked in,
+        and preventing any checkout until it exits, e.g., while the Xapian
+        index is re-built. On exit, all the idle handles but keep are
+        dropped (release() being called on them), so that new handles are
+        created on the new index. Within the context, replace() may
+        substitute a new handle for keep.
+        """
+        with self._cond:
+            while self._exclusive:
+                self._nb_waiting += 1
+                try:
+                    self._cond.wait()
+                finally:
+                    self._nb_waiting -= 1
+            self._exclusive = True
+            self._keep = keep
+            while len(self._idle) < self._size:
+                self._nb_waiting += 1
+                try:
+                    self._cond.wait()
+                finally:
+                    self._nb_waiting -= 1
+
+        try:
+            yield
+
+        finally:
+            with self._cond:
+                keep, self._keep = self._keep, None
+                dropped = [searcher for searcher in self._idle
+                           if searcher is not keep]
+                self._idle = [searcher for searcher in self._idle
+                              if searcher is keep]
+                self._size = len(self._idle)
+                self._exclusive = False
+                self._cond.notify_all()
+
+            if release:
+                for searcher in dropped:
+                    release(searcher)
+
+    def replace(self, searcher, new_searcher):
+        """
+        Substitute a new handle for an idle one, e.g., within exclusive()
+        """
+        with self._cond:
+            self._idle[self._idle.index(searcher)] = new_searcher
+            if self._keep is searcher:
+                self._keep = new_searcher
+
+    def close(self, release=None):
+        """
+        Drop all the idle handles, calling release() on them. The handles
+        in use are released as well, when they get checked in
+        """
+        with self._cond:
+            self._closed = True
+            self._release = release
+            dropped, self._idle = self._idle, []
+            self._size -= len(dropped)
+            self._cond.notify_all()
+
+        if release:
+            for searcher in dropped:
+                release(searcher)
+
+    def stats(self):
+        return PoolStats(self._size, len(self._idle), self.max_size)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/results.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Typed results returned by OpenTrepLib.search(), one per output format.
+
+All the result types are named tuples with empty __slots__, so that
+building them for every query stays cheap. Derived, human-readable
+representations (e.g., the interpreted string of the 'I' format) are
+only computed when they are accessed.
+
+ >>> from OpenTrepWrapper.results import CompactMatch, CompactResult
+
+ >>> res = CompactResult('nce', [CompactMatch(1.0, 'NCE')], '', 'nce/100')
+
+ >>> res.output_format, res.codes
+ ('S', ['NCE'])
+'''
+
+from collections import namedtuple
+
+from . import jsonlib
+
+
+class CompactMatch(namedtuple('CompactMatch', ['score', 'code'])):
+    """
+    Main match of the compact ('S') output format, i.e., the matching score
+    (as a ratio) and the upper-cased code of the recognised place
+    """
+    __slots__ = ()
+
+
+class CompactLocation(namedtuple('CompactLocation', [
+        'score', 'code', 'extras', 'alternates'])):
+    """
+    Main match of the compact ('S') output format, with the whole tree
+    of matches: the extra matches (codes with the same matching score)
+    and the alternate matches (CompactLocation with lower matching scores)
+    """
+    __slots__ = ()
+
+
+class PORMatch(namedtuple('PORMatch', [
+        'iata_code', 'icao_code', 'geonames_id', 'page_rank',
+        'city_code', 'lat', 'lon'])):
+    """
+    POR (point of reference) main match of the JSON- and Protobuf-based
+    output formats ('J', 'I' and 'P'). The Geonames ID is an integer,
+    and the PageRank and the coordinates are floating point numbers,
+    so that they are converted once, when the result is decoded
+    (see decode_json() and decode_protobuf())
+    """
+    __slots__ = ()
+
+
+# Faster than calling the named tuple classes, as their fields are given
+# in order
+_new_tuple = tuple.__new__
+
+
+def _float(value):
+    return float(value) if value else 0.0
+
+
+def decode_json(jsonFormattedResult):
+    '''
+    Decode the main matches of a JSON result string, as a list of PORMatch
+
+     >>> decode_json("""{"locations": [{
+     ...     "iata_code": "ORY", "icao_code": "LFPO",
+     ...     "geonames_id": "2988500", "page_rank": "23.53",
+     ...     "lat": "48.725278", "lon": "2.359444",
+     ...     "cities": {"city_details": {"iata_code": "PAR"}}}]}""")
+     [PORMatch(iata_code='ORY', icao_code='LFPO', geonames_id=2988500, page_rank=23.53, city_code='PAR', lat=48.725278, lon=2.359444)]
+    '''
+    return [
+        _new_tuple(PORMatch, (location["iata_code"],
+                              location["icao_code"],
+                              int(location["geonames_id"] or 0),
+                              _float(location["page_rank"]),
+                              location["cities"]["city_details"]["iata_code"],
+                              _float(location["lat"]),
+                              _float(location["lon"])))
+        for location in jsonlib.loads(jsonFormattedResult)["locations"]
+    ]
+
+
+def decode_protobuf(queryAnswer):
+    """
+    Decode the main matches of a (parsed) Travel_pb2.QueryAnswer Protobuf
+    message, as a list of PORMatch. The city code is the one of the last
+    city served by the place, if any
+    """
+    matches = []
+    for place in queryAnswer.place_list.place:
+        city_list = place.city_list.city
+        geo_point = place.coord
+        matches.append(_new_tuple(PORMatch, (
+            place.tvl_code.code,
+            place.icao_code.code,
+            place.geonames_id.id,
+            place.page_rank.rank,
+            city_list[-1].code.code if city_list else "",
+            geo_point.latitude,
+            geo_point.longitude)))
+    return matches
+
+
+def format_places(matches):
+    """
+    Human-readable rendering of a list of POR matches, as displayed
+    for the 'P' output format
+    """
+    return ''.join(
+        f"{m.iata_code}-{m.icao_code}-{m.geonames_id} ({m.page_rank}%) / "
+        f"{m.city_code}: {m.lat} {m.lon}; "
+        for m in matches
+    )
+
+
+def format_json_places(jsonFormattedResult):
+    """
+    Human-readable rendering of the main matches of a JSON result string,
+    as displayed for the 'I' output format. The fields are rendered as
+    given by the OpenTrep library, i.e., before any conversion (so that,
+    e.g., a PageRank of "64.70" and an empty Geonames ID are kept as is)
+    """
+    return ''.join(
+        f"{location['iata_code']}-{location['icao_code']}-"
+        f"{location['geonames_id']} ({location['page_rank']}%) / "
+        f"{location['cities']['city_details']['iata_code']}: "
+        f"{location['lat']} {location['lon']}; "
+        for location in jsonlib.loads(jsonFormattedResult)["locations"]
+    )
+
+
+class CompactResult(namedtuple('CompactResult', [
+        'query', 'matches', 'unmatched', 'raw'])):
+    """
+    Result of the compact ('S') output format. The matches are a list
+    of CompactMatch or, when the whole tree of matches has been requested
+    (see OpenTrepLib.compact_first_only), of CompactLocation. The unmatched
+    keywords are given as a string
+    """
+    __slots__ = ()
+    output_format = 'S'
+
+    @property
+    def codes(self):
+        return [match.code for match in self.matches]
+
+
+class FullResult(namedtuple('FullResult', ['query', 'raw'])):
+    """
+    Result of the full details ('F') output format. That format is not
+    aimed to be parsed, so only the raw string is given
+    """
+    __slots__ = ()
+    output_format = 'F'
+
+
+class JSONResult(namedtuple('JSONResult', ['query', 'raw'])):
+    """
+    Result of the raw JSON ('J') output format. The main matches
+    (as a list of PORMatch) are decoded only when accessed
+    """
+    __slots__ = ()
+    output_format = 'J'
+
+    @property
+    def matches(self):
+        return decode_json(self.raw)
+
+
+class InterpretedResult(namedtuple('InterpretedResult', [
+        'query', 'matches', 'raw'])):
+    """
+    Result of the interpreted JSON ('I') output format. The matches are
+    a list of PORMatch, and the raw JSON string is kept as well
+    """
+    __slots__ = ()
+    output_format = 'I'
+
+    @property
+    def text(self):
+        return format_json_places(self.raw)
+
+
+class ProtobufResult(namedtuple('ProtobufResult', [
+        'query', 'matches', 'unmatched', 'raw'])):
+    """
+    Result of the Protobuf ('P') output format. The matches are a list
+    of PORMatch, and the raw (serialized) Protobuf message is kept as well
+    """
+    __slots__ = ()
+    output_format = 'P'
+
+    @property
+    def text(self):
+        return format_places(self.matches)
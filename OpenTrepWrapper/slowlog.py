@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/OpenTrepWrapper/slowlog.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Slow-query log (see OpenTrepLib.enable_slow_query_log()): the searches
+taking more than a latency threshold are recorded, as JSON lines, in
+a rotating file, with their output format, the deployment number,
+the timings of their stages and the size of their result.
+
+Optionally, the slow searches are searched again, without the caches
+nor the metrics, under a profiler: cProfile (the statistics are dumped
+next to the log, and the top functions are recorded) or tracemalloc (the
+peak of memory and the top allocating lines are recorded). Only the
+searches above the threshold are profiled (a sample of them, with
+profile_rate), in a background thread, so that neither the slow search
+itself nor the rest of the traffic pays for it.
+
+ >>> import OpenTrepWrapper
+
+ >>> otp = OpenTrepWrapper.OpenTrepLib()
+
+ >>> otp.init_cpp_extension(xapian_index_path="/tmp/opentrep/xapian_traveldb")
+
+ >>> slow_log = otp.enable_slow_query_log(threshold=0.05, profile='cprofile')
+
+ >>> res = otp.search(search_string="a very long search string " * 20)
+
+ % tail -1 /tmp/opentrep/opentrepwrapper.slow.jsonl
+ {"time": "2026-10-18T18:02:11", "query": "a very long search string ...",
+  "format": "S", "deployment": 0, "duration": 0.4127,
+  "timings": {"library": 0.4121, "parse": 0.0006}, "result_size": 412,
+  "profile": "/tmp/opentrep/opentrepwrapper.slow.jsonl.20261018T180211-4242-1.prof",
+  "top": ["0.4118s OpenTrepSearcher.search", ...]}
+'''
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+import logging.handlers
+
+PROFILERS = ('cprofile', 'tracemalloc')
+
+# Number of functions or lines recorded for a profiled search
+_NB_TOP = 5
+
+
+def slow_query_filepath(log_filepath):
+    """
+    Default file-path of the slow-query log, next to the log file
+    """
+    return f"{os.path.splitext(log_filepath)[0]}.slow.jsonl"
+
+
+class SlowQueryLog():
+    """
+    Rotating log of the searches taking more than threshold seconds.
+    The file is rotated when it reaches max_bytes, backup_count former
+    files being kept.
+
+    With profile ('cprofile' or 'tracemalloc'), a ratio (profile_rate)
+    of the slow searches is searched again under that profiler, in
+    a background thread, their entry being written once profiled. A single
+    search is profiled at a time; the other slow searches are not profiled
+    meanwhile.
+    """
+
+    def __init__(self, filepath, threshold=0.1, max_bytes=10 * 2**20,
+                 backup_count=5, profile=None, profile_rate=1.0):
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError(f"[OTP] Error - The profiler ('{profile}') "
+                             f"should be one of {PROFILERS}")
+
+        dirpath = os.path.dirname(filepath)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+
+        self.filepath = filepath
+        self.threshold = threshold
+        self.profile = profile
+        self.profile_rate = profile_rate
+        self.nb_recorded = 0
+        self.nb_profiled = 0
+        self._handler = logging.handlers.RotatingFileHandler(
+            filepath, maxBytes=max_bytes, backupCount=backup_count,
+            encoding='utf-8', delay=True)
+        self._profile_lock = threading.Lock()
+        self._profiler = None
+
+    def __str__(self):
+        return f"Slow-query log: {self.filepath}; " \
+            f"threshold: {self.threshold}s; profiler: {self.profile}"
+
+    def record(self, search_string, output_format, deployment_nb, duration,
+               timings, result_size, rerun=None):
+        """
+        Record a slow search. rerun(), when given, searches again
+        the search string, so that it may be profiled. It is called
+        in the thread of the profiler
+        """
+        entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'query': search_string, 'format': output_format,
+                 'deployment': deployment_nb, 'duration': round(duration, 6),
+                 'timings': {stage: round(timing, 6)
+                             for stage, timing in timings.items()},
+                 'result_size': result_size}
+
+        self.nb_recorded += 1
+        if rerun is not None and self.profile is not None \
+           and random.random() < self.profile_rate \
+           and self._profile_lock.acquire(blocking=False):
+            self.nb_profiled += 1
+            self._profiler = threading.Thread(
+                target=self._profile, args=(entry, rerun, self.nb_profiled),
+                name='OpenTrep-profiler', daemon=True)
+            self._profiler.start()
+            return
+
+        self._write(entry)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the search being profiled, if any, to be recorded
+        """
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.join(timeout)
+
+    def _write(self, entry):
+        self._handler.handle(logging.makeLogRecord(
+            {'msg': json.dumps(entry, ensure_ascii=False)}))
+
+    def _profile(self, entry, rerun, profile_nb):
+        try:
+            if self.profile == 'cprofile':
+                entry.update(self._runCProfile(rerun, profile_nb))
+            else:
+                entry.update(self._runTracemalloc(rerun))
+        except Exception as error:
+            entry['profile_error'] = repr(error)
+        finally:
+            self._profile_lock.release()
+        self._write(entry)
+
+    def _runCProfile(self, rerun, profile_nb):
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.runcall(rerun)
+
+        # Unique across the processes and their restarts
+        profile_filepath = f"{self.filepath}." \
+            f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{profile_nb}.prof"
+        stats = pstats.Stats(profiler)
+        stats.dump_stats(profile_filepath)
+
+        # Functions taking the most (cumulative) time
+        functions = sorted(stats.stats.items(),
+                           key=lambda item: item[1][3], reverse=True)
+        top = [f"{cumtime:.6f}s {filename}:{lineno}({name})"
+               for (filename, lineno, name), (_, _, _, cumtime, _)
+               in functions[:_NB_TOP]]
+        return {'profile': profile_filepath, 'top': top}
+
+    def _runTracemalloc(self, rerun):
+        import tracemalloc
+
+        # The memory allocated meanwhile by the other threads is traced
+        # as well
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        current, _ = tracemalloc.get_traced_memory()
+        try:
+            rerun()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+        # Lines allocating the most memory
+        top = [f"{stat.size_diff:+d}B {stat.traceback}"
+               for stat in after.compare_to(before, 'lineno')[:_NB_TOP]]
+        return {'peak_memory': peak - current, 'top': top}
+
+    def close(self):
+        self.wait()
+        self._handler.close()
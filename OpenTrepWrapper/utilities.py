@@ -5,10 +5,6 @@
 # Authors: Alex Prengere, Denis Arnaud
 #
 
-import json
-import os
-import errno
-
 # Default settings
 DEFAULT_POR = '/tmp/opentraveldata/optd_por_public_all.csv'
 DEFAULT_IDX = '/tmp/opentrep/xapian_traveldb'
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/benchmarks/bench_compact_parser.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Compact ('S') result parser: the single-pass parser of
+OpenTrepLib.compactResultParser(), in its "first only" and "whole tree"
+modes, compared with the former nested split() parser and with its
+straightforward extension to the whole tree. The whole tree has a
+CompactLocation per main and alternate match, hence is slower to build
+than the first matches only.
+
+ % python benchmarks/bench_compact_parser.py
+'''
+
+import os
+import argparse
+
+from common import time_per_item, report
+
+import OpenTrepWrapper
+from OpenTrepWrapper.results import CompactMatch, CompactLocation
+
+CORPUS_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'data', 'compact_results.txt')
+
+
+def legacy_compact_result_parser(resultString):
+    """
+    Former compact result parser, kept as a reference
+    """
+    if ';' in resultString:
+        str_matches, unrecognized = resultString.split(';', 1)
+    else:
+        str_matches, unrecognized = resultString, ''
+
+    if not str_matches:
+        return [], unrecognized
+
+    codes = []
+    for alter_loc in str_matches.split(','):
+        for extra_loc in alter_loc.split('-'):
+            extra_loc, score = extra_loc.split('/', 1)
+            for code in extra_loc.split(':'):
+                codes.append(CompactMatch(float(score) / 100.0, code.upper()))
+                break
+            break
+
+    return codes, unrecognized
+
+
+def legacy_whole_tree_parser(resultString):
+    """
+    Former compact result parser, extended to the whole tree of matches
+    """
+    if ';' in resultString:
+        str_matches, unrecognized = resultString.split(';', 1)
+    else:
+        str_matches, unrecognized = resultString, ''
+
+    if not str_matches:
+        return [], unrecognized
+
+    locations = []
+    for alter_loc in str_matches.split(','):
+        matches = []
+        for extra_loc in alter_loc.split('-'):
+            extra_loc, score = extra_loc.split('/', 1)
+            code, *extra_codes = extra_loc.upper().split(':')
+            matches.append((float(score) / 100.0, code, tuple(extra_codes)))
+        alternates = tuple(CompactLocation(*match, ())
+                           for match in matches[1:])
+        locations.append(CompactLocation(*matches[0], alternates))
+
+    return locations, unrecognized
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--repeat-corpus', type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(CORPUS_FILEPATH) as corpus_file:
+        corpus = corpus_file.read().splitlines() * args.repeat_corpus
+    nb = len(corpus)
+
+    otp = OpenTrepWrapper.OpenTrepLib()
+    parse = otp.compactResultParser
+
+    # Both parsers must agree on the first matches
+    for result in corpus[:100]:
+        assert parse(result) == legacy_compact_result_parser(result), result
+        assert parse(result, False) == legacy_whole_tree_parser(result), result
+
+    def legacy():
+        for result in corpus:
+            legacy_compact_result_parser(result)
+
+    def legacy_whole_tree():
+        for result in corpus:
+            legacy_whole_tree_parser(result)
+
+    def first_only():
+        for result in corpus:
+            parse(result)
+
+    def whole_tree():
+        for result in corpus:
+            parse(result, False)
+
+    report(f"Compact result parsers, {nb} result strings:",
+           {'former split() parser': time_per_item(legacy, nb),
+            'single pass, first only': time_per_item(first_only, nb),
+            'former split() parser, tree':
+            time_per_item(legacy_whole_tree, nb),
+            'single pass, whole tree': time_per_item(whole_tree, nb)})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/benchmarks/bench_formats.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Protobuf ('P') output format compared with the JSON ('J' and 'I') and
+compact ('S') ones: time spent in the OpenTrep library plus the wrapper
+(search), and time spent decoding the results only (decode).
+
+The search strings are the ones of data/queries.tsv. By default, the
+OpenTrep library is stood in for by the responses recorded in
+data/recorded_responses.jsonl (see bench_suite.py), so that the benchmark
+runs without the OpenTrep Python extension. With --live, the actual
+library is benchmarked, on an already built Xapian index. The Protobuf
+format is left out, rather than compared on figures which would not be
+comparable, unless the actual Travel Protobuf module is installed and,
+with recorded responses, the Protobuf ones have been recorded.
+
+ % python benchmarks/bench_formats.py
+ % python benchmarks/bench_formats.py --live -x /tmp/opentrep/xapian_traveldb
+'''
+
+import os
+import sys
+import argparse
+import tempfile
+
+from common import load_queries, load_recorded_responses, \
+    make_recorded_lib, has_protobuf, time_per_item, report
+
+import OpenTrepWrapper
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--live', action='store_true',
+                        help='benchmark the OpenTrep library itself')
+    parser.add_argument('-x', '--xapiandb',
+                        default='/tmp/opentrep/xapian_traveldb',
+                        help='Xapian index searched with --live')
+    parser.add_argument('-n', '--nb-queries', type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.live:
+        try:
+            import pyopentrep
+        except ImportError:
+            sys.exit("--live requires the OpenTrep Python extension. "
+                     "See https://pypi.org/project/opentrep/")
+
+    corpus = [query for _, query in load_queries()]
+    nb = args.nb_queries
+    queries = (corpus * (nb // len(corpus) + 1))[:nb]
+
+    responses = None if args.live else load_recorded_responses()
+    with tempfile.TemporaryDirectory() as tmpdir, \
+         (OpenTrepWrapper.OpenTrepLib() if args.live else
+          make_recorded_lib(responses)) as otp:
+        otp.flag_init_xapian = False
+        # The corpus is repeated: every search string is actually searched
+        otp.batch_dedup_size = 0
+        if args.live:
+            otp.init_cpp_extension(xapian_index_path=args.xapiandb)
+        else:
+            # The Xapian index is not used by the stand-in
+            otp.init_cpp_extension(
+                xapian_index_path=os.path.join(tmpdir, 'xapian_traveldb'),
+                log_path=os.path.join(tmpdir, 'opentrepwrapper.log'))
+
+        formats = ['S', 'J', 'I']
+        if has_protobuf(otp, responses):
+            formats.append('P')
+        else:
+            print("The Protobuf ('P') format is left out: no Protobuf "
+                  "response, or no Travel Protobuf module")
+
+        searches = {}
+        for fmt in formats:
+            def search():
+                for _ in otp.search_many(queries, output_format=fmt):
+                    pass
+            searches[f"search, '{fmt}'"] = time_per_item(search, nb)
+        report(f"Search, {nb} queries "
+               f"({'live' if args.live else 'recorded'} responses):",
+               searches)
+
+        # Raw results, decoded below
+        decoders = {'S': otp.compactResultParser,
+                    'J': otp.placesFromJSON,
+                    'P': otp.placesFromProtobuf}
+        decoders = {fmt: decode for fmt, decode in decoders.items()
+                    if fmt in formats}
+        raw_results = {fmt: [otp._rawSearch(fmt, query) for query in queries]
+                       for fmt in decoders}
+
+        decodes = {}
+        for fmt, decode in decoders.items():
+            def decode_all():
+                for raw_result in raw_results[fmt]:
+                    decode(raw_result)
+            decodes[f"decode, '{fmt}'"] = time_per_item(decode_all, nb)
+        report(f"Decoding, {nb} results:", decodes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/benchmarks/bench_import.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Import time of the OpenTrepWrapper package, as reported by
+python -X importtime, in fresh interpreters. The median time of the
+package import is checked against a budget, so that the script may guard
+the start-up time, e.g., in a CI job (the exit status is 1 when the budget
+is exceeded).
+
+ % python benchmarks/bench_import.py --budget-ms 15
+'''
+
+import sys
+import argparse
+import statistics
+import subprocess
+
+from common import REPO_DIR
+
+STATEMENTS = ['import OpenTrepWrapper',
+              'from OpenTrepWrapper import OpenTrepLib',
+              'from OpenTrepWrapper.parallel import ParallelOpenTrepLib',
+              'from OpenTrepWrapper.persistent import PersistentCache']
+
+
+def top_level_imports(statement):
+    """
+    Cumulative time (in micro-seconds) of every top-level import done by
+    a fresh interpreter running the given statement, by module name
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime',
+                              '-c', statement],
+                             cwd=REPO_DIR, capture_output=True, text=True,
+                             check=True)
+
+    timings = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            # Header
+            continue
+        # The nested imports are indented, and included in the cumulative
+        # time of the top-level ones
+        if not name.startswith('  '):
+            timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def import_time(statement, startup_modules):
+    """
+    Time (in micro-seconds) spent by a fresh interpreter importing
+    the modules needed by the given statement, i.e., the ones which
+    are not imported by the interpreter start-up
+    """
+    return sum(cumulative
+               for name, cumulative in top_level_imports(statement).items()
+               if name not in startup_modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--repeat', type=int, default=15)
+    parser.add_argument('-b', '--budget-ms', type=float, default=15.0,
+                        help='budget of the "import OpenTrepWrapper" '
+                        'statement, in milli-seconds')
+    args = parser.parse_args()
+
+    startup_modules = set(top_level_imports('pass'))
+
+    medians = {}
+    print(f"Import times (median over {args.repeat} interpreters):")
+    for statement in STATEMENTS:
+        timings = [import_time(statement, startup_modules)
+                   for _ in range(args.repeat)]
+        medians[statement] = statistics.median(timings) / 1000.0
+        print(f"  {statement:<60} {medians[statement]:8.2f} ms")
+
+    median = medians[STATEMENTS[0]]
+    if median > args.budget_ms:
+        print(f"The import of the package ({median:.2f} ms) exceeds "
+              f"the budget of {args.budget_ms:.2f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/benchmarks/bench_ingest.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Ingestion of the POR file (see OpenTrepWrapper.ingest), with an increasing
+number of worker processes, on a synthetic POR file with the columns of
+optd_por_public_all.csv. The reference is the sequential computation of
+the manifest of the POR file alone (see OpenTrepWrapper.indexing).
+
+ % python benchmarks/bench_ingest.py -r 500000 -w 1 2 4 8
+'''
+
+import os
+import argparse
+import tempfile
+
+from common import time_per_item, report, write_por_file
+
+from OpenTrepWrapper import indexing
+from OpenTrepWrapper.ingest import ingest_por_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--nb-rows', type=int, default=200000)
+    parser.add_argument('-w', '--workers', type=int, nargs='+',
+                        default=sorted({1, 2, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    nb = args.nb_rows
+    with tempfile.TemporaryDirectory() as tmpdir:
+        por_filepath = os.path.join(tmpdir, 'optd_por_public_all.csv')
+        output_filepath = os.path.join(tmpdir, 'prepared.csv')
+        write_por_file(por_filepath, nb)
+        size = os.path.getsize(por_filepath) / 2**20
+        print(f"POR file: {nb} rows, {size:.0f} MB, {os.cpu_count()} CPU")
+
+        timings = {'compute_manifest()': time_per_item(
+            lambda: indexing.compute_manifest(por_filepath), nb, repeat=3)}
+
+        peaks = {}
+        for workers in args.workers:
+            def ingest():
+                _, ingest_report = ingest_por_file(
+                    por_filepath, output_filepath, workers=workers)
+                peaks[workers] = ingest_report
+
+            timings[f"ingest_por_file(workers={workers})"] = time_per_item(
+                ingest, nb, repeat=3)
+
+        report(f"POR file ingestion, {nb} rows:", timings)
+        for workers, ingest_report in peaks.items():
+            print(f"  Last run with {workers} worker(s): "
+                  f"{ingest_report.rows_per_sec:.0f} rows/s, "
+                  f"{ingest_report.nb_kept} rows kept")
+
+        memory = [None if peak is None else f"{peak / 2**20:.0f} MB"
+                  for peak in (ingest_report.peak_memory,
+                               ingest_report.peak_memory_workers)]
+        print(f"Peak memory: {memory[0]} (workers: {memory[1]})")
+
+
+if __name__ == '__main__':
+    main()
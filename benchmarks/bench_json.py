@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/benchmarks/bench_json.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+JSON ('J' and 'I') result parsing with every installed JSON decoder
+(see OpenTrepWrapper.jsonlib), on large multi-location payloads.
+
+ % python benchmarks/bench_json.py
+'''
+
+import json
+import argparse
+
+from common import time_per_item, report
+
+import OpenTrepWrapper
+from OpenTrepWrapper import jsonlib
+
+# Main matches: IATA code, ICAO code, Geonames ID, city code, lat, lon
+PLACES = [('NCE', 'LFMN', '6299418', 'NCE', '43.658411', '7.215872'),
+          ('SFO', 'KSFO', '5391989', 'SFO', '37.618972', '-122.374889'),
+          ('CDG', 'LFPG', '6269554', 'PAR', '49.012779', '2.55'),
+          ('ORY', 'LFPO', '2988500', 'PAR', '48.725278', '2.359444'),
+          ('YVR', 'CYVR', '6301485', 'YVR', '49.193889', '-123.184444'),
+          ('GIG', 'SBGL', '6300646', 'RIO', '-22.809999', '-43.250557'),
+          ('NRT', 'RJAA', '6300346', 'TYO', '35.764722', '140.386389'),
+          ('JFK', 'KJFK', '5122732', 'NYC', '40.639751', '-73.778925')]
+
+
+def make_location(place, rank):
+    """
+    Location record, with (roughly) the fields given by the OpenTrep library
+    """
+    iata_code, icao_code, geonames_id, city_code, lat, lon = place
+    return {
+        'iata_code': iata_code, 'icao_code': icao_code, 'faa_code': '',
+        'geonames_id': geonames_id, 'envelope_id': '0',
+        'feature_class': 'S', 'feature_code': 'AIRP',
+        'date_from': '1970-01-01', 'date_end': '2999-12-31',
+        'names': [{'lang': lang, 'name': f"{iata_code} Airport ({lang})"}
+                  for lang in ('en', 'fr', 'de', 'es', 'it', 'ja', 'ru')],
+        'lat': lat, 'lon': lon, 'page_rank': f"{rank:.2f}",
+        'country_code': 'FR', 'country_name': 'France',
+        'continent_name': 'Europe', 'adm1_code': 'B8',
+        'adm1_name_utf': "Provence-Alpes-Côte d'Azur",
+        'time_zone': 'Europe/Paris', 'gmt_offset': '1', 'dst_offset': '2',
+        'population': '0', 'elevation': '3', 'currency_code': 'EUR',
+        'wiki_link': f"https://en.wikipedia.org/wiki/{iata_code}_Airport",
+        'cities': {'city_details': {'iata_code': city_code,
+                                    'geonames_id': geonames_id,
+                                    'name': city_code.title()}},
+        'matching_percentage': '100', 'edit_distance': '0',
+        'allowable_distance': '0',
+    }
+
+
+def make_payload(nb_locations):
+    locations = [make_location(PLACES[i % len(PLACES)], 100.0 / (i + 1))
+                 for i in range(nb_locations)]
+    return json.dumps({'locations': locations}, indent=4, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-l', '--nb-locations', type=int, default=8)
+    parser.add_argument('-n', '--nb-payloads', type=int, default=2000)
+    args = parser.parse_args()
+
+    nb = args.nb_payloads
+    payload = make_payload(args.nb_locations)
+    otp = OpenTrepWrapper.OpenTrepLib()
+    print(f"Payload: {args.nb_locations} locations, {len(payload)} characters")
+
+    for name, func in (('placesFromJSON()', otp.placesFromJSON),
+                       ('jsonResultParser()', otp.jsonResultParser)):
+        timings = {}
+        # The standard json module comes first, as the reference
+        for backend in sorted(jsonlib.available_json_backends(),
+                              key=lambda backend: backend != 'json'):
+            jsonlib.set_json_backend(backend)
+
+            def parse():
+                for _ in range(nb):
+                    func(payload)
+
+            timings[backend] = time_per_item(parse, nb)
+
+        report(f"{name}, {nb} payloads:", timings)
+
+    jsonlib.set_json_backend()
+
+
+if __name__ == '__main__':
+    main()
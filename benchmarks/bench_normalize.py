@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/benchmarks/bench_normalize.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Cost of the normalization of the search strings (see
+OpenTrepWrapper.normalize), and per-query cost of OpenTrepLib.search_many()
+with and without normalization, on a stream of search strings which are
+mostly duplicates apart from their case, accents, white spaces and
+punctuation.
+
+The searcher answers the same result after a busy wait of --search-cost
+micro-seconds, standing for the cost of the Xapian look-up.
+
+ % python benchmarks/bench_normalize.py --search-cost 50
+'''
+
+import time
+import random
+import argparse
+
+from common import ConstantSearcher, make_constant_lib, time_per_item, report
+
+from OpenTrepWrapper.normalize import fold_query
+from OpenTrepWrapper.cache import normalize_query
+
+RESULTS = {'S': 'nce/100,sfo/100-emb/98-jcc/97,yvr/100-cxh/83;'}
+
+PLACES = ['nice', 'san francisco', 'paris', 'sao paulo', 'zurich',
+          'montreal', 'dusseldorf', 'malaga', 'reykjavik', 'cote d azur']
+
+
+class BusySearcher(ConstantSearcher):
+    """
+    ConstantSearcher spending search_cost seconds on every search
+    """
+
+    def __init__(self, results, search_cost):
+        super().__init__(results)
+        self.search_cost = search_cost
+        self.nb_calls = 0
+
+    def search(self, outputFormat, search_string):
+        self.nb_calls += 1
+        deadline = time.perf_counter() + self.search_cost
+        while time.perf_counter() < deadline:
+            pass
+        return self.results[outputFormat]
+
+
+def make_variant(place, rng):
+    """
+    Variant of a place name, differing by its case, accents,
+    white spaces and punctuation
+    """
+    variant = rng.choice([place, place.upper(), place.title()])
+    variant = variant.replace('a', rng.choice(['a', 'á', 'â']), 1)
+    return variant + rng.choice(['', ' ', '  ', ',', '.', ' !'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--nb-queries', type=int, default=20000)
+    parser.add_argument('-c', '--search-cost', type=float, default=50.0,
+                        help='cost of a search, in micro-seconds')
+    args = parser.parse_args()
+
+    nb = args.nb_queries
+    rng = random.Random(42)
+    queries = [make_variant(rng.choice(PLACES), rng) for _ in range(nb)]
+
+    timings = {}
+    for name, normalizer in (('normalize_query()', normalize_query),
+                             ('fold_query()', fold_query)):
+        def normalize():
+            for query in queries:
+                normalizer(query)
+
+        timings[name] = time_per_item(normalize, nb)
+    report(f"Normalization, {nb} search strings:", timings)
+
+    searcher = BusySearcher(RESULTS, args.search_cost / 1e6)
+    otp = make_constant_lib(RESULTS)
+    otp._setSearcher(searcher)
+
+    timings, nb_calls = {}, {}
+    for name, normalizer, dedup_size in (
+            ('search_many()', None, 0),
+            ('+ dedup', None, 4096),
+            ('+ normalization + dedup', fold_query, 4096)):
+        otp.query_normalizer = normalizer
+        otp.batch_dedup_size = dedup_size
+
+        def batch_search():
+            for _ in otp.search_many(queries):
+                pass
+
+        searcher.nb_calls = 0
+        timings[name] = time_per_item(batch_search, nb, repeat=3)
+        nb_calls[name] = searcher.nb_calls // 3
+
+    report(f"search_many(), {nb} search strings, "
+           f"{args.search_cost:.0f} us per search:", timings)
+    for name, calls in nb_calls.items():
+        print(f"  {name:<32} {calls:8d} searches")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/benchmarks/bench_search_many.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Per-query cost of OpenTrepLib.search_many() compared with a loop
+over OpenTrepLib.search().
+
+The searcher always answers the same result, so that only the overhead
+of the wrapper is measured. The search strings are all distinct, so that
+the (opt-in) de-duplication of the batch (see OpenTrepLib.batch_dedup_size)
+costs a look-up per search string without saving any search. What is left
+per search string is the pool of searcher handles and the parsing of the
+result.
+
+ % python benchmarks/bench_search_many.py
+'''
+
+import argparse
+
+from common import make_constant_lib, time_per_item, report
+
+RESULTS = {'S': 'nce/100,sfo/100-emb/98-jcc/97,yvr/100-cxh/83;niznayou',
+           'F': '1. NCE-A-6299418, 8.16788%, Nice Cote d\'Azur Airport'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--nb-queries', type=int, default=100000)
+    args = parser.parse_args()
+
+    nb = args.nb_queries
+    queries = [f"nce sfo yvr {i}" for i in range(nb)]
+    otp = make_constant_lib(RESULTS)
+
+    for fmt in ('S', 'F'):
+        def loop_search():
+            for query in queries:
+                otp.search(search_string=query, outputFormat=fmt)
+
+        def batch_search():
+            for _ in otp.search_many(queries, output_format=fmt):
+                pass
+
+        def batch_search_with_dedup():
+            otp.batch_dedup_size = 4096
+            try:
+                batch_search()
+            finally:
+                otp.batch_dedup_size = 0
+
+        report(f"Output format '{fmt}', {nb} queries:",
+               {'loop over search()': time_per_item(loop_search, nb),
+                'search_many()': time_per_item(batch_search, nb),
+                'search_many(), with dedup':
+                time_per_item(batch_search_with_dedup, nb)})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/benchmarks/bench_suite.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Benchmark suite of the wrapper: search() for every output format,
+the result parsers, the initialization and the indexation. Every case
+reports its throughput and its p50/p95/p99 latencies, and may be compared
+with a baseline saved by a former run, so as to catch the regressions
+(the exit status is 1 when a case is slower than its baseline by more
+than the tolerance, on its p50 or p95 latency).
+
+The search strings are the ones of data/queries.tsv: IATA/ICAO codes,
+misspelled place names, and strings made of several places and
+un-recognised words. By default, the OpenTrep library is stood in for by
+a searcher answering the responses recorded in
+data/recorded_responses.jsonl, so that the suite runs without the OpenTrep
+Python extension, and measures the wrapper alone. The stand-in does not
+build any Xapian index, so that the full indexation is then only run with
+--live, and the incremental indexation of an unchanged POR file is compared
+with the one of a changed POR file (which both compare the POR file with
+the last indexation). The shipped responses follow the formats of the
+OpenTrep library on a small set of places; with the OpenTrep Python extension and a Xapian
+index, --record records the actual responses (including the Protobuf
+ones), and --live benchmarks the actual library. No Protobuf response is
+shipped, as the Protobuf responses may only be produced, and decoded, by
+the OpenTrep Python extension (with its Travel Protobuf module): without
+recorded ones, or without that module, the 'P' cases are skipped.
+
+ % python benchmarks/bench_suite.py --save-baseline /tmp/baseline.json
+ % python benchmarks/bench_suite.py --baseline /tmp/baseline.json
+ % python benchmarks/bench_suite.py --live -x /tmp/opentrep/xapian_traveldb
+'''
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import platform
+import tempfile
+
+from common import load_queries, load_recorded_responses, \
+    make_recorded_lib, has_protobuf, percentile, write_por_file, \
+    RECORDED_FILEPATH
+
+import OpenTrepWrapper
+
+
+class Context():
+    """
+    What the benchmark cases run on: an initialized OpenTrepLib instance
+    and the raw responses of the OpenTrep library for the query corpus
+    """
+
+    def __init__(self, args, tmpdir):
+        self.args = args
+        self.tmpdir = tmpdir
+        self.queries = [query for category, query in load_queries()
+                        if not args.category or category in args.category]
+        self.responses = None if args.live else load_recorded_responses()
+
+        self.otp = self.new_lib()
+        self.otp.flag_init_xapian = False
+        self.otp.init_cpp_extension(xapian_index_path=args.xapiandb,
+                                    log_path=self.log_filepath)
+        self.formats = ['S', 'F', 'J', 'I']
+        if has_protobuf(self.otp, self.responses):
+            self.formats.append('P')
+        self.raw = {fmt: [self.otp._rawSearch(fmt, query)
+                          for query in self.queries]
+                    for fmt in self.formats if fmt != 'I'}
+
+        # Synthetic POR files, indexed by the indexation cases
+        self.por_filepath = os.path.join(tmpdir, 'optd_por_public_all.csv')
+        write_por_file(self.por_filepath, args.nb_por)
+        self.changed_por_filepath = os.path.join(tmpdir,
+                                                 'optd_por_changed.csv')
+        write_por_file(self.changed_por_filepath, args.nb_por + 1)
+
+    @property
+    def log_filepath(self):
+        return os.path.join(self.tmpdir, 'opentrepwrapper.log')
+
+    def new_lib(self):
+        if self.responses is None:
+            return OpenTrepWrapper.OpenTrepLib()
+        return make_recorded_lib(self.responses)
+
+
+def measure(func, items, repeat, setup=None):
+    """
+    Latency (in nano-seconds) of func(item), for every item, repeat times.
+    When given, setup(item) is called (un-timed) before every func(item)
+    """
+    clock = time.perf_counter_ns
+    samples = []
+    for _ in range(repeat):
+        for item in items:
+            if setup is not None:
+                setup(item)
+            start = clock()
+            func(item)
+            samples.append(clock() - start)
+    return samples
+
+
+def search_case(fmt):
+    def run(ctx):
+        search = ctx.otp.search
+        return measure(lambda query: search(query, fmt), ctx.queries,
+                       ctx.args.repeat)
+    run.output_format = fmt
+    return run
+
+
+def parser_case(fmt, parse):
+    def run(ctx):
+        return measure(parse(ctx.otp), ctx.raw[fmt], ctx.args.repeat)
+    run.output_format = fmt
+    return run
+
+
+def init_case(warm_start):
+    def run(ctx):
+        xapian_filepath = os.path.join(ctx.tmpdir, 'xapian_init')
+        otp = ctx.new_lib()
+        otp.init_cpp_extension(por_path=ctx.por_filepath,
+                               xapian_index_path=xapian_filepath,
+                               log_path=ctx.log_filepath)
+        otp.index()
+        otp.finalize()
+
+        def init(_):
+            otp = ctx.new_lib()
+            otp.init_cpp_extension(por_path=ctx.por_filepath,
+                                   xapian_index_path=xapian_filepath,
+                                   log_path=ctx.log_filepath,
+                                   warm_start=warm_start)
+            otp.finalize()
+
+        return measure(init, range(ctx.args.nb_runs), 1)
+    return run
+
+
+def index_case(incremental, changed=False):
+    def run(ctx):
+        otp = ctx.new_lib()
+        otp.init_cpp_extension(
+            por_path=ctx.por_filepath,
+            xapian_index_path=os.path.join(ctx.tmpdir, 'xapian_index'),
+            log_path=ctx.log_filepath)
+        if incremental:
+            otp.index(incremental=True)
+
+        setup = None
+        if changed:
+            # Every run indexes the other POR file (with one more row)
+            por_filepaths = [ctx.por_filepath, ctx.changed_por_filepath]
+
+            def setup(nb_run):
+                otp.por_filepath = por_filepaths[(nb_run + 1) % 2]
+
+        samples = measure(lambda _: otp.index(incremental=incremental),
+                          range(ctx.args.nb_runs), 1, setup)
+        otp.finalize()
+        return samples
+    run.live_only = not incremental
+    return run
+
+
+CASES = {
+    **{f"search '{fmt}'": search_case(fmt) for fmt in 'SFJIP'},
+    'compactResultParser': parser_case(
+        'S', lambda otp: otp.compactResultParser),
+    'jsonResultParser': parser_case('J', lambda otp: otp.jsonResultParser),
+    'interpretFromJSON': parser_case('J', lambda otp: otp.interpretFromJSON),
+    'interpretFromProtobuf': parser_case(
+        'P', lambda otp: otp.interpretFromProtobuf),
+    'init': init_case(False),
+    'init, warm start': init_case(True),
+    'index': index_case(False),
+    'index, incremental, unchanged': index_case(True),
+    'index, incremental, changed': index_case(True, changed=True),
+}
+
+
+def summarize(samples):
+    """
+    Throughput (per second) and p50/p95/p99 latencies (in micro-seconds)
+    """
+    samples = sorted(samples)
+    stats = {'nb': len(samples),
+             'throughput': 1e9 * len(samples) / max(sum(samples), 1)}
+    for name, ratio in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+        stats[name] = percentile(samples, ratio) / 1e3
+    return stats
+
+
+def compare(results, baseline, tolerance):
+    """
+    Names of the cases slower than their baseline by more than tolerance,
+    on their p50 or p95 latency
+    """
+    regressions = []
+    for name, stats in results.items():
+        reference = baseline.get(name)
+        if reference and any(stats[p] > (1.0 + tolerance) * reference[p]
+                             for p in ('p50', 'p95')):
+            regressions.append(name)
+    return regressions
+
+
+def record(ctx, filepath):
+    """
+    Record the responses of the OpenTrep library for the query corpus
+    """
+    with open(filepath, 'w', encoding='utf-8') as recorded_file:
+        for query in ctx.queries:
+            record = {'query': query}
+            for fmt in ctx.formats:
+                if fmt == 'P':
+                    record[fmt] = base64.b64encode(
+                        ctx.otp._rawSearch(fmt, query)).decode('ascii')
+                elif fmt != 'I':
+                    record[fmt] = ctx.otp._rawSearch(fmt, query)
+            recorded_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    print(f"Recorded the responses to {len(ctx.queries)} search strings "
+          f"in {filepath}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-k', '--filter', default='',
+                        help='run only the cases whose name contains it')
+    parser.add_argument('-c', '--category', nargs='+',
+                        choices=('code', 'typo', 'multi'),
+                        help='categories of search strings (default: all)')
+    parser.add_argument('-r', '--repeat', type=int, default=20,
+                        help='number of passes over the query corpus')
+    parser.add_argument('-n', '--nb-runs', type=int, default=50,
+                        help='number of runs of the init and index cases')
+    parser.add_argument('--nb-por', type=int, default=20000,
+                        help='number of rows of the indexed POR file')
+    parser.add_argument('-b', '--baseline',
+                        help='JSON file of the baseline to compare with')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='tolerated slow-down, relatively to the '
+                        'baseline')
+    parser.add_argument('-s', '--save-baseline',
+                        help='JSON file where to save the results')
+    parser.add_argument('--live', action='store_true',
+                        help='benchmark the OpenTrep library itself')
+    parser.add_argument('-x', '--xapiandb',
+                        default='/tmp/opentrep/xapian_traveldb',
+                        help='Xapian index searched with --live/--record')
+    parser.add_argument('--record', nargs='?', const=RECORDED_FILEPATH,
+                        help='record the responses of the OpenTrep library')
+    args = parser.parse_args()
+    if args.record:
+        args.live = True
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if not args.live:
+            # The Xapian index is not used by the stand-in
+            args.xapiandb = os.path.join(tmpdir, 'xapian_traveldb')
+        ctx = Context(args, tmpdir)
+
+        if args.record:
+            record(ctx, args.record)
+            return
+
+        baseline = {}
+        if args.baseline:
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)['results']
+
+        print(f"{'live' if args.live else 'recorded'} responses, "
+              f"{len(ctx.queries)} search strings x {args.repeat}, "
+              f"Python {platform.python_version()}")
+        print(f"{'case':<32} {'nb':>7} {'ops/s':>10} {'p50 us':>9} "
+              f"{'p95 us':>9} {'p99 us':>9}")
+
+        results = {}
+        for name, run in CASES.items():
+            if args.filter not in name:
+                continue
+            if getattr(run, 'output_format', None) == 'P' \
+               and 'P' not in ctx.formats:
+                print(f"{name:<32} skipped (no Protobuf response, or no "
+                      "Travel Protobuf module)")
+                continue
+            if getattr(run, 'live_only', False) and not args.live:
+                print(f"{name:<32} skipped (no Xapian index is built by "
+                      "the stand-in; see --live)")
+                continue
+
+            stats = results[name] = summarize(run(ctx))
+            line = f"{name:<32} {stats['nb']:7d} {stats['throughput']:10.0f} " \
+                f"{stats['p50']:9.2f} {stats['p95']:9.2f} {stats['p99']:9.2f}"
+            if name in baseline:
+                p50_ratio = stats['p50'] / max(baseline[name]['p50'], 1e-9)
+                line += f"  (p50 x{p50_ratio:.2f} vs baseline)"
+            print(line)
+        ctx.otp.finalize()
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump({'python': platform.python_version(),
+                       'live': args.live, 'results': results},
+                      baseline_file, indent=2)
+        print(f"Baseline saved in {args.save_baseline}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions (more than {args.tolerance:.0%} slower than "
+                  f"the baseline): {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"No regression (tolerance: {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
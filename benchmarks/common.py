@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+#
+# Source: https://github.com/trep/wrapper/tree/master/benchmarks/common.py
+#
+# Authors: Alex Prengere, Denis Arnaud
+#
+
+'''
+Helpers shared by the benchmark scripts. The scripts are run directly,
+e.g., python benchmarks/bench_search_many.py, from any directory.
+'''
+
+import os
+import sys
+import json
+import time
+import base64
+import types
+
+# Make the OpenTrepWrapper package importable from the source tree
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+import OpenTrepWrapper
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+QUERIES_FILEPATH = os.path.join(DATA_DIR, 'queries.tsv')
+RECORDED_FILEPATH = os.path.join(DATA_DIR, 'recorded_responses.jsonl')
+
+# Columns of optd_por_public_all.csv
+POR_COLUMNS = [
+    'iata_code', 'icao_code', 'faa_code', 'is_geonames', 'geoname_id',
+    'envelope_id', 'name', 'asciiname', 'latitude', 'longitude',
+    'fclass', 'fcode', 'page_rank', 'date_from', 'date_until',
+    'comment', 'country_code', 'cc2', 'country_name', 'continent_name',
+    'adm1_code', 'adm1_name_utf', 'adm1_name_ascii', 'adm2_code',
+    'adm2_name_utf', 'adm2_name_ascii', 'adm3_code', 'adm4_code',
+    'population', 'elevation', 'gtopo30', 'timezone', 'gmt_offset',
+    'dst_offset', 'raw_offset', 'moddate', 'city_code_list',
+    'city_name_list', 'city_detail_list', 'tvl_por_list',
+    'iso31662', 'location_type', 'wiki_link', 'alt_name_section',
+    'wac', 'wac_name', 'ccy_code', 'unlc_list', 'uic_list',
+    'geoname_lat', 'geoname_lon']
+
+
+class ConstantSearcher():
+    """
+    Stand-in for pyopentrep.OpenTrepSearcher, always answering the same
+    result. It allows to measure the overhead of the wrapper alone,
+    without the cost of the Xapian look-up
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    def search(self, outputFormat, search_string):
+        return self.results[outputFormat]
+
+    def finalize(self):
+        pass
+
+
+class RecordedSearcher(ConstantSearcher):
+    """
+    Stand-in for pyopentrep.OpenTrepSearcher, answering the responses
+    recorded for every search string and output format (see
+    load_recorded_responses()), or an empty result for the search strings
+    which have not been recorded. The indexation does nothing
+    """
+
+    def __init__(self, responses):
+        super().__init__(responses)
+        self.por_filepath = None
+
+    def init(self, por_filepath, *args):
+        self.por_filepath = por_filepath
+        return True
+
+    def search(self, outputFormat, search_string):
+        response = self.results.get(search_string)
+        if response is None:
+            return _EMPTY_RESPONSES[outputFormat]
+        return response[outputFormat]
+
+    def searchToPB(self, search_string):
+        return self.search('P', search_string)
+
+    def index(self):
+        return 0
+
+
+# Responses of the OpenTrep library when nothing has been recognised
+_EMPTY_RESPONSES = {'S': '', 'F': '', 'J': '{ "locations": [] }', 'P': b''}
+
+
+def load_queries(filepath=QUERIES_FILEPATH):
+    """
+    Query corpus, as a list of (category, search string) tuples
+    """
+    with open(filepath, encoding='utf-8') as queries_file:
+        next(queries_file)
+        return [tuple(line.rstrip('\n').split('\t', 1))
+                for line in queries_file]
+
+
+def load_recorded_responses(filepath=RECORDED_FILEPATH):
+    """
+    Responses of the OpenTrep library, by search string and output format.
+    The Protobuf ('P') responses, when recorded, are base64-encoded
+    """
+    responses = {}
+    with open(filepath, encoding='utf-8') as recorded_file:
+        for line in recorded_file:
+            record = json.loads(line)
+            if 'P' in record:
+                record['P'] = base64.b64decode(record['P'])
+            responses[record.pop('query')] = record
+    return responses
+
+
+def has_protobuf(otp, responses=None):
+    """
+    Whether the Protobuf ('P') responses may be benchmarked: the actual
+    Travel Protobuf module must be installed and, with recorded responses,
+    the Protobuf ones must have been recorded (see bench_suite.py --record)
+    """
+    if responses is not None and \
+       not all('P' in response for response in responses.values()):
+        return False
+    try:
+        otp._getTravelProtobuf()
+    except ImportError:
+        return False
+    return True
+
+
+def stand_in_pyopentrep(responses):
+    """
+    Stand-in for the pyopentrep module, creating RecordedSearcher instances
+    """
+    return types.SimpleNamespace(
+        __file__=os.path.join(REPO_DIR, 'pyopentrep.so'),
+        OpenTrepSearcher=lambda: RecordedSearcher(responses))
+
+
+def make_recorded_lib(responses):
+    """
+    OpenTrepLib instance initialized with a RecordedSearcher
+    """
+    otp = OpenTrepWrapper.OpenTrepLib()
+    pyopentrep = stand_in_pyopentrep(responses)
+    otp._getPyOpenTrep = lambda: pyopentrep
+    return otp
+
+
+def make_constant_lib(results):
+    """
+    OpenTrepLib instance answering with a ConstantSearcher
+    """
+    otp = OpenTrepWrapper.OpenTrepLib()
+    otp._setSearcher(ConstantSearcher(results))
+    return otp
+
+
+def time_per_item(func, nb_items, repeat=5):
+    """
+    Best, over several runs, of the time (in micro-seconds) spent per item
+    by func(), which is expected to process nb_items items
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return 1e6 * best / nb_items
+
+
+def report(title, timings):
+    """
+    Display the timings (micro-seconds per item) of several variants,
+    relatively to the first one
+    """
+    print(title)
+    ref = next(iter(timings.values()))
+    for name, timing in timings.items():
+        print(f"  {name:<32} {timing:8.3f} us/item  (x{ref / timing:.2f})")
+
+
+def percentile(sorted_samples, ratio):
+    """
+    Nearest-rank percentile of sorted samples, e.g., ratio=0.99 for p99
+    """
+    rank = max(0, min(len(sorted_samples) - 1,
+                      int(ratio * len(sorted_samples) + 0.5) - 1))
+    return sorted_samples[rank]
+
+
+def make_por_row(i, iata_ratio=4):
+    """
+    Row of a synthetic POR file. One POR out of iata_ratio has
+    an IATA code, as (roughly) in the OPTD POR file
+    """
+    values = dict.fromkeys(POR_COLUMNS, '')
+    values.update(
+        iata_code=f"{i % 17576:05d}"[-3:] if i % iata_ratio == 0 else '',
+        geoname_id=str(1000000 + i), name=f"Place number {i}",
+        asciiname=f"Place number {i}", latitude='43.658411',
+        longitude='7.215872', fclass='S', fcode='AIRP', page_rank='0.01',
+        date_from='1970-01-01', country_code='FR', country_name='France',
+        continent_name='Europe', timezone='Europe/Paris',
+        location_type='A' if i % 2 else 'C',
+        wiki_link=f"https://en.wikipedia.org/wiki/Place_{i}",
+        alt_name_section=f"en|Place {i}|=fr|Lieu {i}|=de|Ort {i}|")
+    return '^'.join(values.values())
+
+
+def write_por_file(filepath, nb_rows):
+    """
+    Write a synthetic POR file, with the columns of the OPTD POR file
+    """
+    with open(filepath, 'w') as por_file:
+        por_file.write('^'.join(POR_COLUMNS) + '\n')
+        for i in range(nb_rows):
+            por_file.write(make_por_row(i) + '\n')
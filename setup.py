@@ -57,6 +57,8 @@ setuptools.setup(
         # 'some--package',
     ],
     extras_require={
+        'fast': ['orjson'],
+        'columnar': ['numpy', 'pyarrow'],
         # eg:
         #   'rst': ['docutils>=0.11'],
         #   ':python_version=="2.6"': ['argparse'],
@@ -64,6 +66,8 @@ setuptools.setup(
     entry_points = {
         'console_scripts' : [
             'OpenTrep = OpenTrepWrapper.cli:main',
+            'OpenTrep-daemon = OpenTrepWrapper.daemon:main',
+            'OpenTrep-client = OpenTrepWrapper.daemon:client_main',
         ]
     },
 )
@@ -5,6 +5,12 @@
 # Authors: Denis Arnaud, Alex Prengere
 #
 
+import io
+import os
+import logging
+import tempfile
+import functools
+import contextlib
 import unittest
 import OpenTrepWrapper
 
@@ -65,3 +71,1296 @@ class OpenTrepWrapperTest(unittest.TestCase):
         # Search
         otp.search(search_string="nce sfo", outputFormat="F")
 
+
+
+NCE_SFO_JSON = """{ "locations":[{
+    "iata_code": "NCE", "icao_code": "LFMN", "geonames_id": "6299418",
+    "page_rank": "8.16", "lat": "43.658411", "lon": "7.215872",
+    "cities": { "city_details": { "iata_code": "NCE" } }
+  }, {
+    "iata_code": "SFO", "icao_code": "", "geonames_id": "5391959",
+    "page_rank": "32.49", "lat": "37.77493", "lon": "-122.41942",
+    "cities": { "city_details": { "iata_code": "SFO" } }
+  }]
+}"""
+
+
+class FakeSearcher():
+    """
+    Stand-in for pyopentrep.OpenTrepSearcher, answering canned results
+    """
+
+    def __init__(self, results=None):
+        self.results = results or {'S': 'nce/100,sfo/100-emb/98;niznayou',
+                                   'F': '1. NCE-A-6299418, 8.16788%',
+                                   'J': NCE_SFO_JSON}
+        self.nb_calls = 0
+
+    def search(self, outputFormat, search_string):
+        self.nb_calls += 1
+        return self.results[outputFormat]
+
+    def searchToPB(self, search_string):
+        self.nb_calls += 1
+        return b'serialized QueryAnswer'
+
+    def index(self):
+        self.nb_calls += 1
+        return 3
+
+    def finalize(self):
+        pass
+
+
+POR_ROWS = [
+    "iata_code^icao_code^geoname_id^envelope_id^name^latitude^longitude^location_type",
+    "NCE^LFMN^6299418^^Nice Airport^43.66^7.22^A",
+    "NCE^^2990440^^Nice^43.70^7.27^C",
+    "SFO^KSFO^5391989^^San Francisco Airport^37.62^-122.37^A",
+]
+
+
+def write_por_file(dirpath, rows=POR_ROWS):
+    por_filepath = os.path.join(dirpath, "optd_por_public_all.csv")
+    with open(por_filepath, "w") as por_file:
+        por_file.write("\n".join(rows) + "\n")
+    return por_filepath
+
+
+def make_fake_lib(results=None, searcher_pool_size=1):
+    otp = OpenTrepWrapper.OpenTrepLib()
+    otp.searcher_pool_size = searcher_pool_size
+    otp._newSearcher = lambda flag_init_xapian=False, deployment_nb=None, \
+        por_filepath=None: FakeSearcher(results)
+    otp._setSearcher(FakeSearcher(results))
+    return otp
+
+
+class OpenTrepWrapperSearchTest(unittest.TestCase):
+
+    def test_lazy_import(self):
+        import sys
+        import subprocess
+
+        script = "import sys; import OpenTrepWrapper; " \
+            "from OpenTrepWrapper import OpenTrepLib; " \
+            "print(' '.join(sorted(sys.modules)))"
+        modules = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True).stdout.split()
+        for module in ("argparse", "inspect", "json", "multiprocessing",
+                       "sqlite3", "OpenTrepWrapper.cli",
+                       "OpenTrepWrapper.ingest"):
+            self.assertNotIn(module, modules)
+
+        self.assertIs(OpenTrepWrapper.main, OpenTrepWrapper.cli.main)
+        self.assertIn("parallel", dir(OpenTrepWrapper))
+
+    def test_search_compact(self):
+        otp = make_fake_lib()
+        res = otp.search(search_string="nce sfo niznayou", outputFormat="S")
+
+        self.assertIsInstance(res, OpenTrepWrapper.CompactResult)
+        self.assertEqual(res.query, "nce sfo niznayou")
+        self.assertEqual(res.matches, [(1.0, 'NCE'), (1.0, 'SFO')])
+        self.assertEqual(res.codes, ['NCE', 'SFO'])
+        self.assertEqual(res.unmatched, 'niznayou')
+
+    def test_compact_result_parser(self):
+        otp = OpenTrepWrapper.OpenTrepLib()
+        result = 'nce/100,sfo/100-emb/98-jcc/97,aur:avf/83;niznayou'
+
+        self.assertEqual(otp.compactResultParser(result),
+                         ([(1.0, 'NCE'), (1.0, 'SFO'), (0.83, 'AUR')],
+                          'niznayou'))
+        self.assertEqual(otp.compactResultParser(';eeee'), ([], 'eeee'))
+
+        locations, unmatched = otp.compactResultParser(result,
+                                                       first_only=False)
+        self.assertEqual([loc.code for loc in locations], ['NCE', 'SFO', 'AUR'])
+        self.assertEqual(locations[1].alternates,
+                         ((0.98, 'EMB', (), ()), (0.97, 'JCC', (), ())))
+        self.assertEqual(locations[2].extras, ('AVF',))
+
+        otp = make_fake_lib()
+        otp.compact_first_only = False
+        res = otp.search(search_string="nce sfo", outputFormat="S")
+        self.assertEqual(res.codes, ['NCE', 'SFO'])
+        self.assertEqual(res.matches[1].alternates[0].code, 'EMB')
+
+    def test_por_match(self):
+        from OpenTrepWrapper.results import decode_json
+
+        nce, sfo = decode_json(NCE_SFO_JSON)
+        self.assertIsInstance(nce, OpenTrepWrapper.PORMatch)
+        self.assertEqual(nce, ('NCE', 'LFMN', 6299418, 8.16, 'NCE',
+                               43.658411, 7.215872))
+        self.assertEqual((sfo.icao_code, sfo.lon), ('', -122.41942))
+
+        otp = make_fake_lib()
+        res = otp.search(search_string="nce sfo", outputFormat="J")
+        self.assertEqual(res.matches, [nce, sfo])
+
+    def test_interpreted_text(self):
+        # The 'I' output renders the JSON fields as given by OpenTrep
+        cdg_json = """{ "locations":[{
+            "iata_code": "CDG", "icao_code": "LFPG", "geonames_id": "",
+            "page_rank": "64.70", "lat": "49.012779", "lon": "2.55",
+            "cities": { "city_details": { "iata_code": "PAR" } }
+          }]
+        }"""
+        otp = make_fake_lib(results={'J': cdg_json})
+        res = otp.search(search_string="cdg", outputFormat="I")
+        self.assertEqual(res.text, "CDG-LFPG- (64.70%) / PAR: 49.012779 2.55; ")
+        self.assertEqual(res.matches[0].page_rank, 64.7)
+        self.assertEqual(otp.interpretFromJSON(cdg_json), res.text)
+        self.assertEqual(otp.jsonResultParser(cdg_json),
+                         "CDG-LFPG--64.70%-PAR-49.01-2.55")
+
+    def test_search_protobuf(self):
+        from types import SimpleNamespace as NS
+
+        class FakeQueryAnswer():
+            """
+            Stand-in for Travel_pb2.QueryAnswer
+            """
+            parsed = []
+
+            def ParseFromString(self, serialized):
+                self.parsed.append(serialized)
+                city = NS(code=NS(code='NCE'))
+                self.place_list = NS(place=[NS(
+                    tvl_code=NS(code='NCE'), icao_code=NS(code='LFMN'),
+                    geonames_id=NS(id=6299418), page_rank=NS(rank=8.16),
+                    city_list=NS(city=[city]),
+                    coord=NS(latitude=43.658411, longitude=7.215872))])
+                self.unmatched_keyword_list = NS(word=['niznayou'])
+
+        otp = make_fake_lib()
+        otp._pb_local.queryAnswer = FakeQueryAnswer()
+
+        res = otp.search(search_string="nce niznayou", outputFormat="P")
+        self.assertEqual(res.output_format, 'P')
+        self.assertEqual(res.matches, [('NCE', 'LFMN', 6299418, 8.16, 'NCE',
+                                        43.658411, 7.215872)])
+        self.assertEqual(res.unmatched, 'niznayou')
+
+        # The serialized result is not copied
+        view = memoryview(b'serialized QueryAnswer')
+        self.assertEqual(otp.placesFromProtobuf(view)[1], 'niznayou')
+        self.assertIs(FakeQueryAnswer.parsed[-1], view)
+
+        # The errors of a stand-in, which are not Protobuf decoding errors,
+        # are given back as such, even though the Travel Protobuf module
+        # has not been imported
+        class FailingQueryAnswer(FakeQueryAnswer):
+            def ParseFromString(self, serialized):
+                raise ValueError("Not a QueryAnswer")
+
+        otp._pb_local.queryAnswer = FailingQueryAnswer()
+        with self.assertRaises(ValueError):
+            otp.placesFromProtobuf(b'garbage')
+
+    def test_json_backends(self):
+        from OpenTrepWrapper import jsonlib
+
+        otp = OpenTrepWrapper.OpenTrepLib()
+        expected = "NCE-LFMN-6299418-8.16%-NCE-43.66-7.22; " \
+            "SFO--5391959-32.49%-SFO-37.77--122.42"
+        try:
+            for backend in jsonlib.available_json_backends():
+                self.assertEqual(jsonlib.set_json_backend(backend), backend)
+                self.assertEqual(otp.jsonResultParser(NCE_SFO_JSON), expected)
+
+            with self.assertRaises(ValueError):
+                jsonlib.set_json_backend('yaml')
+        finally:
+            jsonlib.set_json_backend()
+
+    def test_search_all_formats(self):
+        otp = make_fake_lib()
+
+        res = otp.search(search_string="nce sfo", outputFormat="F")
+        self.assertEqual(res.output_format, 'F')
+        self.assertEqual(res.raw, '1. NCE-A-6299418, 8.16788%')
+
+        res = otp.search(search_string="nce sfo", outputFormat="J")
+        self.assertEqual(res.output_format, 'J')
+        self.assertEqual(res.raw, NCE_SFO_JSON)
+
+        res = otp.search(search_string="nce sfo", outputFormat="I")
+        self.assertEqual(res.output_format, 'I')
+        self.assertEqual([m.iata_code for m in res.matches], ['NCE', 'SFO'])
+        self.assertEqual(res.text, otp.interpretFromJSON(NCE_SFO_JSON))
+        self.assertEqual(res.text.split(';')[0],
+                         "NCE-LFMN-6299418 (8.16%) / NCE: 43.658411 7.215872")
+
+        with self.assertRaises(OpenTrepWrapper.OpenTrepWrapper.OutputFormatError):
+            otp.search(search_string="nce sfo", outputFormat="X")
+
+    def test_search_display_is_opt_in(self):
+        otp = make_fake_lib()
+
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            otp.search(search_string="nce sfo", outputFormat="S")
+        self.assertEqual(out.getvalue(), "")
+
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            otp.search(search_string="nce sfo", outputFormat="S", display=True)
+        self.assertIn("recognised place (city/airport) codes", out.getvalue())
+
+    def test_search_many(self):
+        otp = make_fake_lib()
+        queries = iter(["nce", "sfo", "nce sfo"])
+        results = otp.search_many(queries, output_format="S")
+
+        # The search strings are consumed lazily
+        self.assertEqual(otp._trep_lib.nb_calls, 0)
+        self.assertEqual([res.query for res in results],
+                         ["nce", "sfo", "nce sfo"])
+        self.assertEqual(otp._trep_lib.nb_calls, 3)
+
+    def test_metrics(self):
+        from OpenTrepWrapper.metrics import Metrics
+
+        otp = make_fake_lib()
+        observations = []
+        metrics = otp.enable_metrics(Metrics(buckets=(0.001, 1.0)))
+        metrics.add_callback(lambda *observation: observations.append(observation))
+        otp.enable_cache()
+
+        otp.search(search_string="nce sfo", outputFormat="S")
+        otp.search(search_string="nce sfo", outputFormat="S")
+        with contextlib.redirect_stdout(io.StringIO()):
+            otp.search(search_string="nce", outputFormat="I", display=True)
+        list(otp.search_many(["rio", "yvr"], output_format="J"))
+        with self.assertRaises(OpenTrepWrapper.OpenTrepWrapper.OutputFormatError):
+            otp.search(search_string="nce", outputFormat="X")
+
+        stages = metrics.snapshot().stages
+        self.assertEqual(stages[("search", "S")].count, 2)
+        self.assertEqual(stages[("library", "S")].count, 1)
+        self.assertEqual(stages[("parse", "S")].count, 1)
+        self.assertEqual(stages[("cache", "S")].count, 1)
+        self.assertEqual(stages[("dispatch", "S")].count, 2)
+        self.assertEqual(stages[("library", "J")].count, 3)
+        self.assertEqual(stages[("display", "I")].count, 1)
+        self.assertEqual(stages[("search", "J")].count, 2)
+        self.assertEqual(len(observations), sum(stats.count
+                                                for stats in stages.values()))
+        self.assertEqual(stages[("search", "S")].buckets[-1][1], 2)
+
+        text = metrics.prometheus_text()
+        self.assertIn('opentrep_stage_duration_seconds_count'
+                      '{stage="search",format="S"} 2', text)
+        self.assertIn('opentrep_stage_duration_seconds_bucket'
+                      '{stage="search",format="S",le="+Inf"} 2', text)
+
+        # Failed searches are counted
+        otp._trep_lib.results = {}
+        with self.assertRaises(KeyError):
+            otp.search(search_string="sfo", outputFormat="F")
+        errors = metrics.snapshot().errors
+        self.assertEqual(errors, {("library", "F"): 1, ("search", "F"): 1})
+
+        otp.disable_metrics()
+        otp.search(search_string="nce sfo", outputFormat="S")
+        self.assertEqual(metrics.snapshot().stages[("search", "S")].count, 2)
+
+    def test_slow_query_log(self):
+        import json
+        import time
+
+        class SlowSearcher(FakeSearcher):
+            def search(self, outputFormat, search_string):
+                if "slow" in search_string:
+                    time.sleep(0.02)
+                return FakeSearcher.search(self, outputFormat, search_string)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            otp = make_fake_lib()
+            otp._setSearcher(SlowSearcher())
+            otp.log_filepath = os.path.join(tmpdir, "opentrepwrapper.log")
+            slow_log = otp.enable_slow_query_log(threshold=0.01,
+                                                 profile="cprofile")
+            self.assertEqual(slow_log.filepath,
+                             os.path.join(tmpdir, "opentrepwrapper.slow.jsonl"))
+
+            metrics = otp.enable_metrics()
+            otp.search(search_string="nce sfo", outputFormat="S")
+            otp.search(search_string="slow " * 10, outputFormat="S")
+            # The slow search is profiled in the background, without
+            # being observed by the metrics
+            slow_log.wait()
+            self.assertEqual(otp._trep_lib.nb_calls, 3)
+            stages = metrics.snapshot().stages
+            self.assertEqual((stages[("library", "S")].count,
+                              stages[("search", "S")].count), (2, 2))
+            otp.disable_metrics()
+            with open(slow_log.filepath) as slow_file:
+                entries = [json.loads(line) for line in slow_file]
+            self.assertEqual(len(entries), 1)
+            entry = entries[0]
+            self.assertEqual((entry["query"], entry["format"], entry["deployment"]),
+                             ("slow " * 10, "S", 0))
+            self.assertGreaterEqual(entry["timings"]["library"], 0.01)
+            self.assertEqual(entry["result_size"], 31)
+            self.assertTrue(os.path.isfile(entry["profile"]))
+            self.assertIn(f"-{os.getpid()}-1.prof", entry["profile"])
+            self.assertTrue(any("search" in line for line in entry["top"]))
+
+            slow_log = otp.enable_slow_query_log(
+                threshold=0.01, profile="tracemalloc", max_bytes=1000,
+                backup_count=1)
+            for i in range(6):
+                otp.search(search_string=f"slow {i}", outputFormat="J")
+                slow_log.wait()
+            self.assertEqual(slow_log.nb_recorded, 6)
+            self.assertTrue(os.path.isfile(f"{slow_log.filepath}.1"))
+            with open(slow_log.filepath) as slow_file:
+                entry = json.loads(slow_file.readline())
+            self.assertIn("peak_memory", entry)
+
+            otp.disable_slow_query_log()
+            otp.search(search_string="slow", outputFormat="S")
+            self.assertEqual(slow_log.nb_recorded, 6)
+
+    def test_normalization(self):
+        from OpenTrepWrapper.normalize import fold_query
+
+        self.assertEqual(fold_query(" Nice,  CÔTE-d'Azur! "), "nice cote d azur")
+        self.assertEqual(fold_query("ＮＣＥ"), "nce")
+
+        # The ASCII and the non-ASCII search strings strip the same
+        # punctuation and symbols
+        import string
+        for char in string.punctuation:
+            self.assertEqual(fold_query(f"nice{char}cote"), "nice cote")
+            self.assertEqual(fold_query(f"nicé{char}côte"), "nice cote")
+        self.assertEqual(fold_query("é|b"), fold_query("e|b"))
+        self.assertEqual(fold_query("nice€＋cote"), "nice cote")
+
+        otp = make_fake_lib()
+        searched = []
+        search = otp._trep_lib.search
+        otp._trep_lib.search = lambda fmt, query: searched.append(query) \
+            or search(fmt, query)
+        otp.enable_normalization()
+        otp.enable_cache()
+
+        self.assertEqual(otp.search(search_string="Nice  ").query, "Nice  ")
+        otp.search(search_string="NICE")
+        self.assertEqual((searched, otp.cache_stats().hits), (["nice"], 1))
+
+        # Within a batch, the duplicates are searched once, when the
+        # de-duplication is enabled
+        otp.disable_cache()
+        self.assertEqual(otp.batch_dedup_size, 0)
+        otp.batch_dedup_size = 4096
+        queries = ["Nice  ", "NICE", "nice,", "Nîce", "sfo", "nice"]
+        results = list(otp.search_many(queries))
+        self.assertEqual([res.query for res in results], queries)
+        self.assertEqual(searched, ["nice", "nice", "sfo"])
+
+        otp.disable_normalization()
+        list(otp.search_many(["nce", "nce", "NCE"]))
+        self.assertEqual(searched[3:], ["nce", "NCE"])
+
+    def test_search_many_checks_format_eagerly(self):
+        otp = make_fake_lib()
+        with self.assertRaises(OpenTrepWrapper.OpenTrepWrapper.OutputFormatError):
+            otp.search_many(["nce"], output_format="X")
+
+    def test_result_cache(self):
+        otp = make_fake_lib()
+        otp.enable_cache(maxsize=2)
+
+        res = otp.search(search_string="NCE ", outputFormat="S")
+        res_cached = otp.search(search_string="nce", outputFormat="S")
+        self.assertEqual(otp._trep_lib.nb_calls, 1)
+        self.assertEqual(res_cached.query, "nce")
+        self.assertEqual(res_cached.matches, res.matches)
+
+        # Another output format is another entry, evicting the oldest one
+        otp.search(search_string="nce", outputFormat="F")
+        otp.search(search_string="sfo", outputFormat="S")
+        self.assertEqual(otp.cache_stats()[:4], (1, 3, 1, 2))
+
+        # Changing the deployment invalidates the cache
+        otp.deployment_nb = 1
+        otp.search(search_string="sfo", outputFormat="S")
+        self.assertEqual(otp._trep_lib.nb_calls, 4)
+
+    def test_code_index(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            otp = make_fake_lib()
+            otp.por_filepath = write_por_file(tmpdir)
+            otp.xapian_index_filepath = os.path.join(tmpdir, "xapian_traveldb")
+            otp.enable_code_index()
+            self.assertEqual(sorted(otp.code_index.records),
+                             ['KSFO', 'LFMN', 'NCE', 'SFO'])
+            self.assertEqual(otp.code_index.records['NCE'].geonames_ids,
+                             (6299418, 2990440))
+
+            # The OpenTrep library is called once per code and format
+            searcher = otp._trep_lib
+            first = otp.search(search_string="lfmn")
+            res = otp.search(search_string=" LFMN ")
+            self.assertEqual(searcher.nb_calls, 1)
+            self.assertEqual(res.query, " LFMN ")
+            self.assertEqual(res._replace(query="lfmn"), first)
+
+            # The free-text search strings go to the OpenTrep library
+            otp.search(search_string="nce sfo")
+            otp.search(search_string="xyz")
+            self.assertEqual(searcher.nb_calls, 3)
+
+            # The Xapian index is re-built by a new handle
+            otp.index()
+            searcher = otp._trep_lib
+            otp.search(search_string="lfmn")
+            self.assertEqual(searcher.nb_calls, 2)
+
+            otp.enable_code_index(prime_formats=["S", "J"])
+            calls = searcher.nb_calls
+            self.assertEqual(calls, 2 + 8)
+            list(otp.search_many(["nce", "sfo", "ksfo"], "J"))
+            self.assertEqual(searcher.nb_calls, calls)
+
+            # A deployment switch within a batch drops the answers
+            results = otp.search_many(["nce", "sfo"], "J")
+            next(results)
+            green = FakeSearcher()
+            otp._switchDeployment(1, green, otp._newSearcherPool(green, 1))
+            next(results)
+            self.assertEqual((searcher.nb_calls, green.nb_calls), (calls, 1))
+
+    def test_persistent_cache(self):
+        from OpenTrepWrapper.persistent import PersistentCache
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            otp = make_fake_lib()
+            otp.xapian_index_filepath = os.path.join(tmpdir, "xapian_traveldb")
+            otp.enable_persistent_cache()
+            otp.search(search_string="nce sfo")
+
+            # Another process, starting with the same Xapian index
+            other = make_fake_lib()
+            other.xapian_index_filepath = otp.xapian_index_filepath
+            other.fingerprint_check_interval = 0.0
+            other.enable_persistent_cache()
+            res = other.search(search_string="NCE  SFO")
+            self.assertEqual(res.query, "NCE  SFO")
+            self.assertEqual(res.codes, ["NCE", "SFO"])
+            self.assertEqual(other._trep_lib.nb_calls, 0)
+
+            # Only the raw responses of the OpenTrep library are stored
+            self.assertEqual(other.persistent_cache.get(("nce sfo", "S")),
+                             "nce/100,sfo/100-emb/98;niznayou")
+
+            # A re-indexation invalidates the results for all the processes,
+            # which notice it by themselves
+            fingerprint = other.persistent_cache._token
+            otp.index()
+            otp.search(search_string="nce sfo")
+            self.assertEqual(otp._trep_lib.nb_calls, 2)
+            other.search(search_string="nce sfo")
+            self.assertEqual(other._trep_lib.nb_calls, 0)
+            self.assertNotEqual(other.persistent_cache._token, fingerprint)
+            self.assertEqual(other.persistent_cache._token,
+                             otp.persistent_cache._token)
+            # The results of the two last Xapian indexes are kept
+            self.assertEqual(other.persistent_cache.stats().size, 2)
+            other.finalize()
+            otp.finalize()
+
+            # Size-based eviction
+            cache = PersistentCache(os.path.join(tmpdir, "cache.sqlite"),
+                                    max_bytes=1000, evict_every=10)
+            token = cache.bind("fingerprint")
+            for i in range(30):
+                cache.put((f"query {i}", "S"), "x" * 50, token)
+            stats = cache.stats()
+            self.assertLessEqual(stats.nb_bytes, 1000)
+            self.assertGreater(stats.evictions, 0)
+            self.assertIsNone(cache.get(("query 0", "S")))
+            self.assertEqual(cache.get(("query 29", "S")), "x" * 50)
+            cache.close()
+
+    def test_result_cache_within_batch(self):
+        otp = make_fake_lib()
+        otp.enable_cache()
+        otp.search(search_string="nce")
+
+        # A deployment switch in the middle of a batch: the results of the
+        # former deployment are no longer served, nor cached
+        results = otp.search_many(["sfo", "nce", "sfo"])
+        self.assertEqual(next(results).query, "sfo")
+        green = FakeSearcher()
+        otp._switchDeployment(1, green, otp._newSearcherPool(green, 1))
+        self.assertEqual([res.query for res in results], ["nce", "sfo"])
+        self.assertEqual(green.nb_calls, 2)
+        self.assertEqual(otp.cache_stats().size, 2)
+
+    def test_result_cache_ttl(self):
+        from OpenTrepWrapper.cache import QueryCache
+
+        cache = QueryCache(maxsize=10, ttl=-1)
+        cache.put(('nce', 'S'), 'NCE')
+        self.assertIsNone(cache.get(('nce', 'S')))
+        self.assertEqual(cache.stats().evictions, 1)
+
+
+    def test_search_from_threads(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        class SlowSearcher(FakeSearcher):
+            in_use = set()
+
+            def search(self, outputFormat, search_string):
+                assert self not in self.in_use, "Searcher handle shared"
+                self.in_use.add(self)
+                threading.Event().wait(0.001)
+                self.in_use.discard(self)
+                return FakeSearcher.search(self, outputFormat, search_string)
+
+        otp = make_fake_lib(searcher_pool_size=3)
+        otp._newSearcher = lambda flag_init_xapian=False, deployment_nb=None: \
+            SlowSearcher()
+        queries = [f"nce {i}" for i in range(50)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(
+                lambda query: otp.search(search_string=query), queries))
+
+        self.assertEqual([res.query for res in results], queries)
+        self.assertLessEqual(otp._searcher_pool.stats().size, 3)
+
+    def test_searcher_pool(self):
+        from OpenTrepWrapper.pool import SearcherPool, SearcherPoolTimeoutError
+
+        pool = SearcherPool(factory=object, max_size=2, timeout=0.01)
+        first, second = pool.checkout(), pool.checkout()
+        self.assertIsNot(first, second)
+        with self.assertRaises(SearcherPoolTimeoutError):
+            pool.checkout()
+
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+
+    def test_searcher_pool_exclusive(self):
+        import time
+        import threading
+        from OpenTrepWrapper.pool import SearcherPool, SearcherPoolClosedError
+
+        # A checkout and an exclusive() are both waiting for the single
+        # handle: the check-in must wake the exclusive() up
+        pool = SearcherPool(factory=object, max_size=1)
+        handle = pool.checkout()
+        events = []
+
+        def checkout():
+            with pool.searcher():
+                events.append("checkout")
+
+        def exclusive():
+            with pool.exclusive(keep=handle):
+                events.append("exclusive")
+
+        checkout_thread = threading.Thread(target=checkout, daemon=True)
+        checkout_thread.start()
+        while not pool._nb_waiting:
+            time.sleep(0.001)
+        exclusive_thread = threading.Thread(target=exclusive, daemon=True)
+        exclusive_thread.start()
+        while not pool._exclusive:
+            time.sleep(0.001)
+
+        pool.checkin(handle)
+        exclusive_thread.join(5)
+        checkout_thread.join(5)
+        self.assertFalse(exclusive_thread.is_alive())
+        self.assertFalse(checkout_thread.is_alive())
+        self.assertEqual(events, ["exclusive", "checkout"])
+
+        pool.close()
+        with self.assertRaises(SearcherPoolClosedError):
+            pool.checkout()
+
+
+    def test_logging(self):
+        otp = make_fake_lib()
+        self.assertTrue(otp.get_log_pfx().startswith(
+            "[TREP][test_OpenTrepWrapper.py][test_logging]["))
+
+        # Below the Info log level, nothing is logged
+        with self.assertLogs("OpenTrepWrapper", level="INFO") as logs:
+            otp.search(search_string="nce", outputFormat="S")
+            logging.getLogger("OpenTrepWrapper").info("end")
+        self.assertEqual(len(logs.records), 1)
+
+        otp.log_level = 4
+        with self.assertLogs("OpenTrepWrapper", level="INFO") as logs:
+            otp.search(search_string="nce", outputFormat="S")
+        self.assertEqual(logs.records[0].getMessage(), "search_string: nce")
+
+    def test_logging_configuration(self):
+        from OpenTrepWrapper.OpenTrepWrapper import setup_logging
+
+        # The logging configuration of the application is left untouched
+        wrapper_logger = logging.getLogger("OpenTrepWrapper")
+        handlers = list(wrapper_logger.handlers)
+        otp = make_fake_lib()
+        otp.log_level = 5
+        otp.search(search_string="nce", outputFormat="S")
+        self.assertEqual(wrapper_logger.level, logging.NOTSET)
+        self.assertEqual(wrapper_logger.handlers, handlers)
+        self.assertTrue(all(isinstance(handler, logging.NullHandler)
+                            for handler in handlers))
+
+        # The command-line scripts display the log records
+        stream = io.StringIO()
+        handler = setup_logging(4, stream)
+        try:
+            otp.search(search_string="nce", outputFormat="S")
+        finally:
+            wrapper_logger.removeHandler(handler)
+            wrapper_logger.setLevel(logging.NOTSET)
+        self.assertIn("] - search_string: nce", stream.getvalue())
+
+
+class IndexingTest(unittest.TestCase):
+
+    def test_incremental_index(self):
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            otp = make_fake_lib()
+            otp.por_filepath = write_por_file(tmpdir)
+            otp.xapian_index_filepath = os.path.join(tmpdir, "xapian_traveldb")
+            otp.enable_cache()
+
+            report = otp.index(incremental=True)
+            self.assertEqual(report.nb_indexed, 3)
+            self.assertEqual(len(report.delta.added), 3)
+
+            # Nothing has changed, the re-build is skipped, without the POR
+            # file being hashed row by row
+            otp.search(search_string="nce")
+            with mock.patch("OpenTrepWrapper.indexing.compute_manifest") \
+                 as compute_manifest:
+                report = otp.index(incremental=True)
+                os.utime(otp.por_filepath)
+                self.assertIsNone(otp.index(incremental=True).nb_indexed)
+            self.assertFalse(compute_manifest.called)
+            self.assertIsNone(report.nb_indexed)
+            self.assertEqual(report.delta, ([], [], []))
+            self.assertEqual(otp.cache_stats().size, 1)
+
+            rows = POR_ROWS[:2] + ["SFO^KSFO^5391989^^SFO Intl^37.62^-122.37^A"]
+            write_por_file(tmpdir, rows)
+            report = otp.index(incremental=True)
+            self.assertEqual(report.nb_indexed, 3)
+            self.assertEqual(report.delta, ([], ["SFO-A-5391989-"],
+                                            ["NCE-C-2990440-"]))
+            self.assertEqual(otp.cache_stats().size, 0)
+
+            # A full indexation drops the manifest
+            otp.index()
+            self.assertEqual(len(otp.index(incremental=True).delta.added), 2)
+
+            # Other settings trigger a full re-build
+            otp.flag_index_non_iata_por = True
+            report = otp.index(incremental=True)
+            self.assertEqual(report.nb_indexed, 3)
+            self.assertEqual(len(report.delta.added), 2)
+            self.assertIsNone(otp.index(incremental=True).nb_indexed)
+
+    def test_warm_start(self):
+        flags = []
+        indexed_with = []
+
+        class FlaggedSearcher(FakeSearcher):
+            def index(self):
+                indexed_with.append(self.flag_init_xapian)
+                return FakeSearcher.index(self)
+
+        def new_searcher(flag_init_xapian=False, deployment_nb=None,
+                         por_filepath=None):
+            flags.append(flag_init_xapian)
+            searcher = FlaggedSearcher()
+            searcher.flag_init_xapian = flag_init_xapian
+            return searcher
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            otp = make_fake_lib()
+            otp._newSearcher = new_searcher
+            otp._getPyOpenTrep = lambda: None
+            por_filepath = write_por_file(tmpdir)
+            xapian_filepath = os.path.join(tmpdir, "xapian_traveldb")
+            init = functools.partial(
+                otp.init_cpp_extension, por_path=por_filepath,
+                xapian_index_path=xapian_filepath, warm_start=True)
+
+            # No Xapian index has been built so far
+            self.assertFalse(init().warm_start)
+            self.assertEqual(flags, [True])
+
+            otp.index()
+            report = init()
+            self.assertTrue(report.warm_start)
+            self.assertIs(otp.init_report, report)
+            self.assertGreaterEqual(report.duration, 0.0)
+            self.assertEqual(flags[-1], False)
+
+            # Other settings, or another POR file
+            otp.flag_index_non_iata_por = True
+            self.assertFalse(init().warm_start)
+            otp.flag_index_non_iata_por = False
+            self.assertTrue(init().warm_start)
+            self.assertTrue(init().warm_start)
+
+            # The Xapian index is re-built with a handle initialized with
+            # flag_init_xapian, not with the warm-started one
+            warm = otp._trep_lib
+            otp.index()
+            self.assertEqual(indexed_with[-1], True)
+            self.assertIsNot(otp._trep_lib, warm)
+            self.assertTrue(init().warm_start)
+            write_por_file(tmpdir, POR_ROWS[:2])
+            self.assertFalse(init().warm_start)
+
+            # The POR file is touched, but not changed
+            otp.index()
+            os.utime(por_filepath, ns=(0, 0))
+            self.assertTrue(init().warm_start)
+            self.assertFalse(init(warm_start=False).warm_start)
+
+    def test_index_metrics(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            otp = make_fake_lib()
+            otp.por_filepath = write_por_file(tmpdir)
+            otp.xapian_index_filepath = os.path.join(tmpdir, "xapian_traveldb")
+            metrics = otp.enable_metrics()
+
+            otp.index(incremental=True)
+            otp.index(incremental=True)
+            stages = metrics.snapshot().stages
+            self.assertEqual(stages[("index", "")].count, 2)
+            self.assertEqual(stages[("diff", "")].count, 2)
+            self.assertEqual(stages[("build", "")].count, 1)
+            self.assertGreater(stages[("index", "")].quantile(0.5), 0.0)
+
+    def test_ingest_por_file(self):
+        from OpenTrepWrapper import indexing
+        from OpenTrepWrapper.ingest import ingest_por_file
+
+        rows = POR_ROWS + [f"X{i:02d}^^{i}^^POR {i}^0.0^0.0^C" for i in range(40)]
+        rows += ["^^3000000^^No IATA code^0.0^0.0^C"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            por_filepath = write_por_file(tmpdir, rows)
+            output_filepath = os.path.join(tmpdir, "prepared.csv")
+
+            # Several chunks, processed by several worker processes
+            manifest, report = ingest_por_file(
+                por_filepath, output_filepath, workers=2, chunksize=256)
+            self.assertEqual(manifest, indexing.compute_manifest(por_filepath))
+            self.assertEqual((report.nb_rows, report.nb_kept), (44, 43))
+            self.assertGreater(report.rows_per_sec, 0)
+            with open(output_filepath) as output_file:
+                self.assertEqual(output_file.read().splitlines(), rows[:-1])
+
+            ingest_por_file(por_filepath, output_filepath, keep_non_iata=True)
+            with open(output_filepath) as output_file:
+                self.assertEqual(output_file.read().splitlines(), rows)
+
+            # The short rows are skipped, by the worker processes as well
+            malformed = ["X99^^99", "NCE"]
+            por_filepath = write_por_file(tmpdir, rows + malformed)
+            manifest, report = ingest_por_file(
+                por_filepath, output_filepath, workers=2, chunksize=256)
+            self.assertEqual(manifest, indexing.compute_manifest(por_filepath))
+            self.assertEqual((report.nb_rows, report.nb_kept,
+                              report.nb_malformed), (46, 43, 2))
+
+    def test_index_with_ingestion(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            otp = make_fake_lib(searcher_pool_size=2)
+            otp.por_filepath = write_por_file(tmpdir)
+            otp.xapian_index_filepath = os.path.join(tmpdir, "xapian_traveldb")
+            former = otp._trep_lib
+
+            report = otp.index(incremental=True, ingest=True)
+            self.assertEqual(report.nb_indexed, 3)
+            self.assertEqual(report.ingest.nb_kept, 3)
+            self.assertEqual(len(report.delta.added), 3)
+            self.assertIsNot(otp._trep_lib, former)
+            self.assertEqual(otp._searcher_pool.stats().size, 1)
+
+            # The manifest of the ingestion is the one of the POR file
+            report = otp.index(incremental=True)
+            self.assertIsNone(report.nb_indexed)
+
+
+class DeploymentTest(unittest.TestCase):
+
+    def test_blue_green_deployment(self):
+        import threading
+        from OpenTrepWrapper.deployment import BlueGreenDeployer, \
+            DeploymentError, read_active_deployment
+
+        class BuildingSearcher(FakeSearcher):
+            building = threading.Event()
+            built = threading.Event()
+
+            def index(self):
+                self.building.set()
+                self.built.wait(5)
+                return FakeSearcher.index(self)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            otp = make_fake_lib()
+            otp.xapian_index_filepath = os.path.join(tmpdir, "xapian_traveldb")
+            otp.enable_cache()
+            blue = otp._trep_lib
+            green = BuildingSearcher()
+            created = []
+
+            def new_searcher(flag_init_xapian=False, deployment_nb=None,
+                             por_filepath=None):
+                if (flag_init_xapian, deployment_nb) == (True, 1) \
+                   and green not in created:
+                    searcher = green
+                else:
+                    searcher = FakeSearcher()
+                created.append(searcher)
+                searcher.flags = (flag_init_xapian, deployment_nb)
+                return searcher
+            otp._newSearcher = new_searcher
+
+            deployer = BlueGreenDeployer(otp, warm_queries=["nce"],
+                                         isolate=False)
+            with self.assertRaises(DeploymentError):
+                deployer.rollback()
+            otp.search(search_string="nce")
+
+            # The live deployment keeps serving while the other one is built
+            future = deployer.deploy()
+            self.assertTrue(BuildingSearcher.building.wait(5))
+            self.assertEqual(otp.search(search_string="sfo").query, "sfo")
+            self.assertEqual((otp.deployment_nb, blue.nb_calls), (0, 2))
+            BuildingSearcher.built.set()
+
+            report = future.result(5)
+            self.assertEqual((report.deployment_nb, report.nb_indexed), (1, 3))
+            self.assertEqual(otp.deployment_nb, 1)
+            self.assertEqual(read_active_deployment(otp.xapian_index_filepath), 1)
+
+            # The switch empties the result cache
+            self.assertEqual(otp.search(search_string="nce").query, "nce")
+            self.assertEqual((blue.nb_calls, green.nb_calls), (2, 3))
+
+            self.assertEqual(deployer.rollback(), 0)
+            otp.search(search_string="rio")
+            self.assertEqual((blue.nb_calls, green.nb_calls), (3, 3))
+            self.assertEqual(deployer.switch(), 1)
+
+            deployer.close()
+            self.assertEqual(otp.search(search_string="yvr").query, "yvr")
+            self.assertEqual(green.nb_calls, 4)
+
+            # A later indexation of the live deployment re-builds it with
+            # a new handle, initialized with flag_init_xapian
+            otp.index()
+            self.assertIsNot(otp._trep_lib, green)
+            self.assertEqual(otp._trep_lib.flags, (True, None))
+            self.assertEqual(otp._trep_lib.nb_calls, 1)
+
+    def test_isolated_deployment(self):
+        import json
+        import types
+        import multiprocessing
+        from unittest import mock
+        from OpenTrepWrapper.deployment import BlueGreenDeployer
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            init_filepath = os.path.join(tmpdir, "init.json")
+
+            class InitFakeSearcher(FakeSearcher):
+                def init(self, *args):
+                    # Called in the process building the deployment
+                    with open(init_filepath, "w") as init_file:
+                        json.dump(args, init_file)
+                    return True
+
+            pyopentrep = types.SimpleNamespace(
+                OpenTrepSearcher=InitFakeSearcher, __file__="pyopentrep.so")
+            with mock.patch.object(OpenTrepWrapper.OpenTrepLib,
+                                   "_getPyOpenTrep", lambda otp: pyopentrep):
+                otp = make_fake_lib()
+                otp.por_filepath = write_por_file(tmpdir)
+                otp.xapian_index_filepath = os.path.join(tmpdir,
+                                                         "xapian_traveldb")
+                otp.log_filepath = os.path.join(tmpdir, "opentrep.log")
+                otp.flag_index_non_iata_por = True
+                otp.flag_add_por_to_db = True
+
+                deployer = BlueGreenDeployer(
+                    otp, warm_queries=["nce"],
+                    mp_context=multiprocessing.get_context("fork"))
+                report = deployer.deploy(background=False)
+                deployer.close()
+                self.assertEqual(report.deployment_nb, 1)
+
+                # The deployment is built with the settings of otp.index()
+                with open(init_filepath) as init_file:
+                    args = json.load(init_file)
+                self.assertEqual(args[0], otp.por_filepath)
+                self.assertEqual((args[4], args[5], args[6], args[7]),
+                                 (1, True, True, True))
+
+                # A restarted process searches the live deployment
+                restarted = OpenTrepWrapper.OpenTrepLib()
+                restarted.init_cpp_extension(
+                    por_path=otp.por_filepath,
+                    xapian_index_path=otp.xapian_index_filepath,
+                    log_path=otp.log_filepath)
+                self.assertEqual(restarted.deployment_nb, 1)
+                restarted.finalize()
+                otp.finalize()
+
+
+class AsyncOpenTrepLibTest(unittest.TestCase):
+
+    def test_search_stream(self):
+        import asyncio
+        from OpenTrepWrapper.aio import AsyncOpenTrepLib
+
+        async def resolve():
+            aotp = AsyncOpenTrepLib(make_fake_lib(searcher_pool_size=2))
+            res = await aotp.search("nce sfo", output_format="S")
+            self.assertEqual(res.codes, ['NCE', 'SFO'])
+
+            async def queries():
+                for i in range(20):
+                    yield f"nce {i}"
+
+            results = [res.query async for res
+                       in aotp.search_stream(queries(), max_pending=3)]
+            await aotp.finalize()
+            return results
+
+        results = asyncio.run(resolve())
+        self.assertEqual(results, [f"nce {i}" for i in range(20)])
+
+    def test_search_timeout(self):
+        import asyncio
+        import threading
+        from OpenTrepWrapper.aio import AsyncOpenTrepLib
+
+        release = threading.Event()
+
+        class BlockingSearcher(FakeSearcher):
+            def search(self, outputFormat, search_string):
+                release.wait(5)
+                return FakeSearcher.search(self, outputFormat, search_string)
+
+        otp = make_fake_lib()
+        otp._setSearcher(BlockingSearcher())
+
+        async def resolve():
+            aotp = AsyncOpenTrepLib(otp, max_concurrency=1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await aotp.search("nce", timeout=0.01)
+
+            # The searcher handle and the concurrency slot are given back
+            # once the blocked call returns
+            release.set()
+            res = await aotp.search("sfo", timeout=5)
+            await aotp.finalize()
+            return res
+
+        self.assertEqual(asyncio.run(resolve()).query, "sfo")
+        self.assertEqual(otp._searcher_pool, None)
+
+
+class ParallelOpenTrepLibTest(unittest.TestCase):
+
+    def test_chunked(self):
+        from OpenTrepWrapper.parallel import _chunked
+
+        chunks = list(_chunked(iter(range(7)), 3))
+        self.assertEqual(chunks, [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_search_many_checks(self):
+        from OpenTrepWrapper.parallel import ParallelOpenTrepLib
+
+        with ParallelOpenTrepLib(workers=2) as potp:
+            with self.assertRaises(OpenTrepWrapper.OpenTrepWrapper.OPTInitError):
+                potp.search_many(["nce"])
+
+            potp.init_cpp_extension()
+            with self.assertRaises(OpenTrepWrapper.OpenTrepWrapper.OutputFormatError):
+                potp.search_many(["nce"], output_format="X")
+
+    def test_abandoned_search_many(self):
+        from concurrent.futures import Future
+        from OpenTrepWrapper.parallel import ParallelOpenTrepLib
+
+        class PendingExecutor():
+            """
+            Stand-in for the pool of workers, only the first chunk
+            being searched
+            """
+            futures = []
+
+            def submit(self, func, output_format, chunk, timed):
+                future = Future()
+                if not self.futures:
+                    future.set_result((chunk, None))
+                self.futures.append(future)
+                return future
+
+        potp = ParallelOpenTrepLib(workers=2)
+        potp._executor = PendingExecutor()
+        results = potp._searchChunks(iter([["nce"], ["sfo"], ["rio"],
+                                           ["cdg"], ["lhr"]]), "S")
+        self.assertEqual(next(results), "nce")
+        results.close()
+        self.assertEqual([future.cancelled()
+                          for future in PendingExecutor.futures],
+                         [False, True, True, True])
+
+    def test_timed_search_many(self):
+        import multiprocessing
+        import types
+        from unittest import mock
+        from OpenTrepWrapper.parallel import ParallelOpenTrepLib
+
+        class InitFakeSearcher(FakeSearcher):
+            def init(self, *args):
+                return True
+
+        pyopentrep = types.SimpleNamespace(OpenTrepSearcher=InitFakeSearcher,
+                                           __file__="pyopentrep.so")
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             mock.patch.object(OpenTrepWrapper.OpenTrepLib, "_getPyOpenTrep",
+                               lambda otp: pyopentrep), \
+             ParallelOpenTrepLib(
+                 workers=2, chunksize=3,
+                 mp_context=multiprocessing.get_context("fork")) as potp:
+            potp.init_cpp_extension(
+                xapian_index_path=os.path.join(tmpdir, "xapian"),
+                log_path=os.path.join(tmpdir, "opentrep.log"))
+            metrics = potp.enable_metrics()
+            results = list(potp.search_many([f"nce {i}" for i in range(10)],
+                                            output_format="S"))
+            self.assertEqual([result.query for result in results],
+                             [f"nce {i}" for i in range(10)])
+            # Every search has been timed by the worker which has run it
+            self.assertEqual(metrics.snapshot().stages[("search", "S")].count,
+                             10)
+
+
+class SearchDaemonTest(unittest.TestCase):
+
+    def test_pipelined_search(self):
+        import threading
+        from OpenTrepWrapper.daemon import SearchDaemon, DaemonClient, \
+            DaemonError
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            otp = make_fake_lib(searcher_pool_size=2)
+            socket_filepath = os.path.join(tmpdir, "opentrep.sock")
+            with SearchDaemon(otp, socket_filepath) as search_daemon:
+                search_daemon.serve_in_background()
+
+                with DaemonClient(socket_filepath, timeout=5) as client:
+                    response = client.search("nce sfo")
+                    self.assertEqual(response["codes"], ["NCE", "SFO"])
+                    self.assertEqual(response["unmatched"], "niznayou")
+                    response = client.search("nce", output_format="I")
+                    self.assertEqual(response["matches"][1]["iata_code"], "SFO")
+                    with self.assertRaises(DaemonError):
+                        client.search("nce", output_format="X")
+
+                    queries = [f"nce {i}" for i in range(500)]
+                    responses = list(client.search_many(queries))
+                    self.assertEqual([response["query"] for response in responses],
+                                     queries)
+
+                # The consumer stops early: the sending thread does not stay
+                # blocked on a full queue, or on a full socket buffer
+                for window in (4, 100000):
+                    with DaemonClient(socket_filepath, timeout=5) as client:
+                        queries = [f"nce {i} " + "x" * 1000
+                                   for i in range(20000)]
+                        responses = client.search_many_raw(queries, "F",
+                                                           window)
+                        next(responses)
+                        responses.close()
+                        for thread in threading.enumerate():
+                            if thread.name == "opentrep-client":
+                                thread.join(5)
+                                self.assertFalse(thread.is_alive())
+
+                # Concurrent clients
+                def search(queries, responses):
+                    with DaemonClient(socket_filepath, timeout=5) as client:
+                        responses.extend(client.search_many(queries, "F"))
+
+                threads, outputs = [], []
+                for i in range(4):
+                    queries = [f"sfo {i} {j}" for j in range(100)]
+                    responses = []
+                    outputs.append((queries, responses))
+                    threads.append(threading.Thread(target=search,
+                                                    args=(queries, responses)))
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join(5)
+                for queries, responses in outputs:
+                    self.assertEqual([response["query"] for response in responses],
+                                     queries)
+
+                search_daemon.shutdown()
+
+            self.assertFalse(os.path.exists(socket_filepath))
+            with self.assertRaises(DaemonError):
+                DaemonClient(socket_filepath)
+
+
+def has_module(name):
+    import importlib.util
+    return importlib.util.find_spec(name) is not None
+
+
+class ColumnarTest(unittest.TestCase):
+
+    def test_column_buffers(self):
+        from OpenTrepWrapper.columnar import ColumnarResults, search_columnar
+
+        otp = make_fake_lib({'S': 'nce/100,sfo/90-emb/80;niznayou',
+                             'J': NCE_SFO_JSON})
+        res = search_columnar(otp, ["nce sfo", "sfo nce"], output_format="S")
+        self.assertEqual(len(res), 4)
+        self.assertEqual(list(res.query_index), [0, 0, 1, 1])
+        self.assertEqual(res.iata_codes, ["NCE", "SFO", "NCE", "SFO"])
+        self.assertEqual(list(res.score), [1.0, 0.9, 1.0, 0.9])
+        self.assertEqual(len(res.lat), 0)
+
+        res = search_columnar(otp, ["nce sfo"], output_format="I")
+        self.assertEqual(res.iata_codes, ["NCE", "SFO"])
+        self.assertEqual(list(res.page_rank), [8.16, 32.49])
+        self.assertEqual(list(res.lon), [7.215872, -122.41942])
+        with self.assertRaises(OpenTrepWrapper.OpenTrepWrapper.OutputFormatError):
+            res.append(1, otp.search("nce", "S"))
+        with self.assertRaises(OpenTrepWrapper.OpenTrepWrapper.OutputFormatError):
+            ColumnarResults("F")
+
+        res.clear()
+        self.assertEqual((len(res), res.iata_codes), (0, []))
+
+    @unittest.skipUnless(has_module("numpy"), "NumPy is not installed")
+    def test_to_numpy(self):
+        import numpy as np
+        from OpenTrepWrapper.columnar import search_columnar
+
+        otp = make_fake_lib()
+        matches = search_columnar(otp, ["nce sfo", "rio"]).to_numpy()
+        self.assertEqual(matches["query_index"].tolist(), [0, 0, 1, 1])
+        self.assertEqual(matches["iata_code"].tolist(),
+                         ["NCE", "SFO", "NCE", "SFO"])
+        self.assertTrue(np.isnan(matches["lat"]).all())
+
+        matches = search_columnar(otp, [], output_format="P").to_numpy()
+        self.assertEqual(len(matches), 0)
+
+    @unittest.skipUnless(has_module("pyarrow"), "PyArrow is not installed")
+    def test_write_parquet(self):
+        import pyarrow.parquet as pq
+        from OpenTrepWrapper.columnar import write_parquet
+
+        otp = make_fake_lib()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filepath = os.path.join(tmpdir, "matches.parquet")
+            nb_rows = write_parquet(otp, [f"nce {i}" for i in range(5)],
+                                    filepath, output_format="I",
+                                    row_group_size=4)
+            self.assertEqual(nb_rows, 10)
+            parquet_file = pq.ParquetFile(filepath)
+            self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+            table = parquet_file.read()
+            self.assertEqual(table.column("query_index").to_pylist(),
+                             [0, 0, 1, 1, 2, 2, 3, 3, 4, 4])
+            self.assertEqual(table.column("iata_code").to_pylist()[:2],
+                             ["NCE", "SFO"])
+            self.assertEqual(table.column("score").null_count, 10)
+
+
+class CommandLineTest(unittest.TestCase):
+
+    def test_run_batch(self):
+        from OpenTrepWrapper.cli import read_search_strings, make_writer, \
+            run_batch, summary
+        from OpenTrepWrapper.metrics import Metrics
+
+        otp = make_fake_lib()
+        search_strings = read_search_strings(io.StringIO("nce sfo\n\n rio \n"))
+        output = io.StringIO()
+        metrics = Metrics()
+        nb_results, elapsed = run_batch(otp, search_strings, "S",
+                                        make_writer(output, "tsv"), metrics)
+        self.assertEqual(nb_results, 2)
+        self.assertEqual(output.getvalue().splitlines(),
+                         ["query\tcodes\tunmatched",
+                          "nce sfo\tNCE SFO\tniznayou",
+                          "rio\tNCE SFO\tniznayou"])
+        stats = metrics.snapshot().stages[("search", "S")]
+        self.assertEqual(stats.count, 2)
+        self.assertIn("2 search strings in", summary(nb_results, elapsed, stats))
+
+        output = io.StringIO()
+        run_batch(otp, ["nce"], "I", make_writer(output, "csv"))
+        self.assertEqual(output.getvalue().splitlines()[1], "nce,NCE SFO,")
+
+    def test_main(self):
+        import json
+        import types
+        from unittest import mock
+        from OpenTrepWrapper import cli
+
+        class InitFakeSearcher(FakeSearcher):
+            def init(self, *args):
+                return True
+
+        pyopentrep = types.SimpleNamespace(OpenTrepSearcher=InitFakeSearcher,
+                                           __file__="pyopentrep.so")
+        with tempfile.TemporaryDirectory() as tmpdir, \
+             mock.patch.object(OpenTrepWrapper.OpenTrepLib, "_getPyOpenTrep",
+                               lambda otp: pyopentrep):
+            input_filepath = os.path.join(tmpdir, "queries.txt")
+            with open(input_filepath, "w") as input_file:
+                input_file.write("".join(f"nce {i}\n" for i in range(100)))
+            output_filepath = os.path.join(tmpdir, "matches.jsonl")
+
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr):
+                cli.main(["--input", input_filepath, "-o", output_filepath,
+                          "-f", "I", "-x", os.path.join(tmpdir, "xapian"),
+                          "-l", os.path.join(tmpdir, "opentrep.log")])
+            self.assertIn("100 search strings in", stderr.getvalue())
+            self.assertIn("p99", stderr.getvalue())
+
+            with open(output_filepath) as output_file:
+                responses = [json.loads(line) for line in output_file]
+            self.assertEqual([response["query"] for response in responses],
+                             [f"nce {i}" for i in range(100)])
+            self.assertEqual(responses[0]["matches"][0]["iata_code"], "NCE")
+
+            with self.assertRaises(SystemExit):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    cli.main(["-f", "F", "-t", "csv", "nce"])